@@ -0,0 +1,198 @@
+"""
+Download every game of one or more Chess.com users into local multi-game PGN files (PGNs/<username>.pgn).
+The monthly archives of the users (the get_player_game_archives endpoint) are fetched concurrently over one pooled
+HTTP session with a request rate limit, which retries of throttled or failed requests go through too. The
+ETag/Last-Modified of every archive is remembered, so a repeated sync only downloads archives that changed (in practice
+the current month) and only appends the games that are new.
+
+    python Chess.com_API/sync_archives.py magnuscarlsen frottorii --workers 4
+    python Chess.com_API/sync_archives.py frottorii --base-url http://localhost:8000/pub     # e.g. a stub server
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+BASE_URL = os.environ.get("CHESSCOM_API_URL", "https://api.chess.com/pub")
+USER_AGENT = "frottori/Chess archive sync (https://github.com/frottori/Chess)"
+DEFAULT_WORKERS = 4
+DEFAULT_RATE = 5.0          # Requests per second over all workers (Chess.com throttles parallel requests)
+STATE_FILE = "sync_state.json"
+MAX_RETRIES = 5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF = 0.5               # Seconds before the first retry, doubled for every further one
+
+class RateLimiter():
+    # At most rate calls of wait() per second, spread evenly, shared by every thread
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.nextTime = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            waitUntil = max(now, self.nextTime)
+            self.nextTime = waitUntil + self.interval
+        if waitUntil > now:
+            time.sleep(waitUntil - now)
+
+    # Hold every thread back for seconds (the server asked to slow down)
+    def delay(self, seconds):
+        with self.lock:
+            self.nextTime = max(self.nextTime, time.monotonic() + seconds)
+
+# Session with a connection pool as big as the number of workers (ArchiveSync.get does the retrying, so the retries
+# keep to the rate limit)
+def make_session(workers=DEFAULT_WORKERS):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = USER_AGENT
+    return session
+
+class ArchiveSync():
+    def __init__(self, outputDir="PGNs", baseUrl=BASE_URL, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE, session=None):
+        self.outputDir = outputDir
+        self.baseUrl = baseUrl.rstrip("/")
+        self.workers = workers
+        self.session = session or make_session(workers)
+        self.limiter = RateLimiter(rate)
+        self.statePath = os.path.join(outputDir, STATE_FILE)
+        self.state = self.load_state()  # {username: {url: {"etag", "lastModified", "games"}, "pgnSize": bytes}}
+        self.requests = 0               # Requests sent
+        self.notModified = 0            # Of which answered 304 Not Modified
+
+    """
+    Sync state: validators and the number of games already saved, per archive URL, and the size of the PGN file
+    after the games the state records
+    """
+    def load_state(self):
+        try:
+            with open(self.statePath) as stateFile:
+                return json.load(stateFile)
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self):
+        os.makedirs(self.outputDir, exist_ok=True)
+        temporary = self.statePath + ".tmp"
+        with open(temporary, "w") as stateFile:
+            json.dump(self.state, stateFile, indent=1)
+            stateFile.flush()
+            os.fsync(stateFile.fileno())
+        os.replace(temporary, self.statePath) # Never leave a half-written state behind
+
+    """
+    HTTP
+    """
+    # GET a JSON document, conditional on the validators of the last download.
+    # Returns (json, validators), or (None, validators) if it didn't change
+    def get_json(self, url, validators=None):
+        headers = {}
+        if validators:
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("lastModified"):
+                headers["If-Modified-Since"] = validators["lastModified"]
+        response = self.get(url, headers)
+        if response.status_code == 304:
+            self.notModified += 1
+            return None, validators
+        response.raise_for_status()
+        return response.json(), {"etag": response.headers.get("ETag"), "lastModified": response.headers.get("Last-Modified")}
+
+    # GET through the rate limiter, retrying throttled (429) and failed (5xx, connection errors) requests with
+    # backoff or after the Retry-After of the response. The backoff holds back every thread, not just this one
+    def get(self, url, headers):
+        for attempt in range(MAX_RETRIES + 1):
+            self.limiter.wait()
+            self.requests += 1
+            try:
+                response = self.session.get(url, headers=headers, timeout=30)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == MAX_RETRIES:
+                    raise
+                self.limiter.delay(BACKOFF * 2 ** attempt)
+                continue
+            if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                return response
+            retryAfter = response.headers.get("Retry-After", "")
+            self.limiter.delay(float(retryAfter) if retryAfter.isdigit() else BACKOFF * 2 ** attempt)
+
+    def archive_urls(self, username):
+        data, _ = self.get_json(f"{self.baseUrl}/player/{username.lower()}/games/archives")
+        return data.get("archives", [])
+
+    # New games of one archive: (url, validators, [pgn, ...]) or (url, None, []) if it didn't change
+    def fetch_archive(self, username, url):
+        known = self.state.get(username, {}).get(url, {})
+        data, validators = self.get_json(url, known)
+        if data is None:
+            return url, None, []
+        games = [game["pgn"] for game in data.get("games", []) if game.get("pgn")]
+        return url, validators, games[known.get("games", 0):] # Archives only grow, new games are at the end
+
+    """
+    Syncing
+    """
+    # Download the new games of every user, returns {username: number of new games}
+    def sync(self, usernames):
+        archives = {username.lower(): self.archive_urls(username) for username in usernames}
+        with ThreadPoolExecutor(self.workers) as executor:
+            futures = {username: [executor.submit(self.fetch_archive, username, url) for url in urls]
+                       for username, urls in archives.items()}
+            return {username: self.write_games(username, [future.result() for future in userFutures])
+                    for username, userFutures in futures.items()}
+
+    # Append the new games in archive (chronological) order, then record them in the state once they are on disk.
+    # A crash between the two leaves games in the file that the state doesn't record: the next sync downloads them
+    # again as its first new games, and skips the ones already written instead of appending them twice
+    def write_games(self, username, results):
+        os.makedirs(self.outputDir, exist_ok=True)
+        userState = self.state.setdefault(username, {})
+        pending = [(pgn.strip() + "\n\n").encode() for _, _, games in results for pgn in games]
+        with open(os.path.join(self.outputDir, f"{username}.pgn"), "ab+") as pgnFile:
+            size = pgnFile.seek(0, os.SEEK_END)
+            recorded = min(userState.get("pgnSize", size), size)
+            pgnFile.seek(recorded)
+            unrecorded = pgnFile.read()
+            written = 0
+            matched = 0
+            while written < len(pending) and unrecorded.startswith(pending[written], matched):
+                matched += len(pending[written])
+                written += 1
+            if matched < len(unrecorded): # The rest of a game cut off by the crash
+                pgnFile.truncate(recorded + matched)
+            pgnFile.writelines(pending[written:])
+            pgnFile.flush()
+            os.fsync(pgnFile.fileno())
+            userState["pgnSize"] = os.fstat(pgnFile.fileno()).st_size
+        for url, validators, games in results:
+            if validators is not None:
+                userState[url] = dict(validators, games=userState.get(url, {}).get("games", 0) + len(games))
+        self.save_state()
+        return len(pending)
+
+def main():
+    parser = argparse.ArgumentParser(description="Download the Chess.com game archives of users into PGN files")
+    parser.add_argument("usernames", nargs="+", help="Chess.com usernames")
+    parser.add_argument("--output", default="PGNs", help="directory of the PGN files and the sync state")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="archives downloaded at the same time")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="most requests per second")
+    parser.add_argument("--base-url", default=BASE_URL, help="API root (default: CHESSCOM_API_URL or Chess.com)")
+    args = parser.parse_args()
+
+    sync = ArchiveSync(args.output, args.base_url, args.workers, args.rate)
+    for username, newGames in sync.sync(args.usernames).items():
+        print(f"{username}: {newGames} new games")
+    print(f"{sync.requests} requests, {sync.notModified} archives unchanged")
+
+if __name__ == "__main__":
+    main()
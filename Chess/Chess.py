@@ -4,7 +4,11 @@ Responsible for handling user input and displaying the current GameState object.
 
 import pygame as p
 import ChessEngine
-from stockfish import Stockfish
+import ChessAI
+import EnginePool
+import OpeningBook
+import Renderer
+import Sprites
 
 # Global Constants
 BOARD_SIZE = 600                            # Dimensions of the chessboard
@@ -15,50 +19,25 @@ BAR_HEIGHT = BOARD_SIZE                     # Height of the evaluation bar
 WIDTH = BOARD_SIZE + BAR_WIDTH              # Total window width
 HEIGHT = BOARD_SIZE                         # Total window height
 MAX_FPS = 15                                # For animations of pieces
-IMAGES = {}                                 # Dictionary of images
+AI_TIME_LIMIT = 1.0                         # Seconds the computer may think about each move
+THEME = "blue"                              # Piece images (see Sprites.THEMES)
+IMAGES = {}                                 # Dictionary of images (piece code -> image)
+
+SPRITES = Sprites.SpriteManager(THEME)      # Piece images, loaded on first use
 
 def load_images(): 
-    pieces = ["wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK"]
-    for piece in pieces:
-        IMAGES[piece] = p.transform.smoothscale(
-            p.image.load("Chess/images_blue_theme/" + piece + ".png"),
-            (SQUARE_SIZE, SQUARE_SIZE)
-        )
-
-# Draws graphics of current game state 
-def draw_game_state(screen, gs):    
-    draw_board(screen)                                      # Draw the squares on the board
-    draw_pieces(screen, gs.board)                           # Draw the pieces on top of the squares
-    draw_eval_bar(screen, gs)                               # Draw the evaluation bar
-    
-# Draw the squares on the board
-def draw_board(screen):
-    # Starting position of the chessboard (right of the evaluation bar)
-    board_offset_x = BAR_WIDTH
-    colors = [p.Color("#a0b9cf"), p.Color("#7e98ac")]
-    for row in range(DIMENSION):
-        for col in range(DIMENSION):
-            color = colors[(row + col) % 2]  # Alternate colors of squares
-            p.draw.rect(
-                screen, color, 
-                p.Rect(board_offset_x + col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
-            )
-
-# Draw the pieces on top of the squares with current game state from GameState.board
-def draw_pieces(screen, board):
-    board_offset_x = BAR_WIDTH
-    for row in range(DIMENSION):
-        for col in range(DIMENSION):
-            piece = board[row][col]
-            if piece != "--": 
-                screen.blit(
-                    IMAGES[piece],
-                    p.Rect(board_offset_x + col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
-                )
-
-# Function to draw the evaluation bar
-def draw_eval_bar(screen, gs):
-    eval_value, mate_moves = gs.get_evaluation()
+    IMAGES.update(SPRITES.images(SQUARE_SIZE))
+
+# Draws graphics of current game state: only the squares that changed since the last draw (see Renderer)
+def draw_game_state(renderer, gs, evaluation):
+    renderer.clear_selection()                              # Take the highlights of the last clicks away
+    renderer.update_board(gs.board)                         # Draw the squares whose piece changed
+    draw_eval_bar(renderer, gs, evaluation)                 # Draw the evaluation bar
+
+# Function to draw the evaluation bar, evaluation is (eval_value, mate_moves) from the background analysis
+def draw_eval_bar(renderer, gs, evaluation):
+    screen = renderer.screen
+    eval_value, mate_moves = evaluation
     font = p.font.SysFont("Consolas", 14, bold=True)
 
     # Scale evaluation value to the range (-10 to 10) and normalize
@@ -96,20 +75,20 @@ def draw_eval_bar(screen, gs):
         p.draw.rect(screen, p.Color("#ffffff"), (0, 0, BAR_WIDTH, BAR_HEIGHT))      # White bar
     
     screen.blit(eval_text, text_rect)
-
-def draw_selection(screen, gs, sqSelected, is_selected):
-    board_offset_x = BAR_WIDTH
-    row, col = sqSelected
-    if row < 0 or col < 0:
-        return
-    if is_selected:
-        color = p.Color("#8ec7e9") if (row + col) % 2 == 0 else p.Color("#378ccc") # highlight the square (dependig if light or dark square)
-    else:
-        color = p.Color("#a0b9cf") if (row + col) % 2 == 0 else p.Color("#7e98ac") # reset the color of the square
-    p.draw.rect(
-        screen, color, 
-        p.Rect(board_offset_x + col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE), 4
-    )
+    renderer.mark_dirty((0, 0, BAR_WIDTH, BAR_HEIGHT))
+
+# A move from the opening book for the position (the zobrist key is the Polyglot hash), None when out of book
+def book_move(book, gs, validMoves):
+    if book is None:
+        return None
+    entry = book.choose(gs.zobristKey)
+    if entry is None:
+        return None
+    # Polyglot writes castling as the king taking its rook, only a king on the start square can mean that
+    fromSq = ChessEngine.Move.ranksToRows[entry.move[1]] * DIMENSION + ChessEngine.Move.filesToCols[entry.move[0]]
+    uci = entry.uci(kingMove=abs(gs.board[fromSq]) == ChessEngine.KING)
+    # Only a valid move is played, a corrupt book entry gives None (the computer searches instead)
+    return next((move for move in validMoves if move.get_chess_notation() == uci), None)
 
 def main():
     # Initialize a window
@@ -120,56 +99,88 @@ def main():
     screen.fill(p.Color("#a0b9cf"))                 # Fill the screen with white color
     gs = ChessEngine.GameState()                    # Initialize the game state
 
-    validMoves = gs.get_valid_moves()
+    validMoves = {move: move for move in gs.get_valid_moves()} # Looked up by Move hash
     moveMade = False
     load_images()                                   # Load the images of the pieces
+    renderer = Renderer.BoardRenderer(screen, IMAGES, SQUARE_SIZE, offsetX=BAR_WIDTH)
 
     running = True
     sqSelected = ()     # square selected by the user (tuple: (row, col))
     playerClicks = []   # Keep track of player clicks (two tuples: [(6, 4), (4, 4)])
-    draw_game_state(screen, gs) # initial draw of the game state
+    playerOne = True    # True if a human plays white, False if the computer plays white
+    playerTwo = False   # True if a human plays black, False if the computer plays black
+    # Stockfish evaluates on a worker thread, the bar is redrawn whenever a deeper result comes in
+    analysis = EnginePool.AnalysisThread()
+    analysis.start()
+    analysis.analyse(gs.get_fen())
+    analysisVersion = analysis.version
+    evaluation = (0, None)
+    book = OpeningBook.load_book()                  # None until it is built with OpeningBook.py
+    draw_game_state(renderer, gs, evaluation) # initial draw of the game state
 
     while running:
+        humanTurn = (gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo)
         for e in p.event.get():
             if e.type == p.QUIT:
                 running = False
+            elif e.type == p.WINDOWEXPOSED: # The window lost its contents, draw everything again
+                renderer.redraw(gs.board)
+                draw_eval_bar(renderer, gs, evaluation)
             # Mouse handler
-            elif e.type == p.MOUSEBUTTONDOWN:
+            elif e.type == p.MOUSEBUTTONDOWN and humanTurn:
                 loc = p.mouse.get_pos()  # (x, y) location of the mouse
                 col = (loc[0] - BAR_WIDTH) // SQUARE_SIZE  # Adjust for board offset
-                row = loc[1] // SQUARE_SIZE              
+                row = loc[1] // SQUARE_SIZE
+                if not (0 <= row < DIMENSION and 0 <= col < DIMENSION):
+                    continue # Off the board (e.g. the evaluation bar), Move would wrap it onto another square
                 if sqSelected != (row, col):    # double click same square
                     sqSelected = (row, col)
                     playerClicks.append(sqSelected)
-                    draw_selection(screen, gs, sqSelected, is_selected=True)
+                    renderer.select(*sqSelected, selected=True)
                 else:
-                    draw_selection(screen, gs, sqSelected, is_selected=False)
+                    renderer.select(*sqSelected, selected=False)
                     sqSelected = ()
                     playerClicks = []
                 if len(playerClicks) == 2:
-                    move = ChessEngine.Move(playerClicks[0], playerClicks[1], gs.board)
-                    if move in validMoves:
-                        gs.make_move(move)
-                        draw_selection(screen, gs, sqSelected, is_selected=False)
+                    startSq, endSq = (clickRow * DIMENSION + clickCol for clickRow, clickCol in playerClicks)
+                    move = ChessEngine.Move(startSq, endSq, gs.board)
+                    validMove = validMoves.get(move) # The generated move knows castling/en passant
+                    if validMove is not None:
+                        gs.make_move(validMove)
                         moveMade = True
                     else:
-                        draw_selection(screen, gs, playerClicks[0], is_selected=False)
+                        renderer.select(*playerClicks[0], selected=False)
                         playerClicks = [playerClicks[1]]
-                        draw_selection(screen, gs, sqSelected, is_selected=True)
+                        renderer.select(*sqSelected, selected=True)
             # Key Handler 
             elif e.type == p.KEYDOWN:
                 if (valid_keystroke(e.key)):
                     gs.undo_move()
+                    if not (playerOne and playerTwo): # Also take back the computer's reply
+                        gs.undo_move()
                     moveMade = True
+        # Computer move
+        if not humanTurn and not moveMade and validMoves:
+            move = book_move(book, gs, validMoves) # Book moves are played instantly
+            gs.make_move(move if move is not None else ChessAI.find_best_move(gs, timeLimit=AI_TIME_LIMIT))
+            moveMade = True
         if moveMade:
-            validMoves = gs.get_valid_moves()
-            draw_game_state(screen, gs)   
+            validMoves = {move: move for move in gs.get_valid_moves()} # Looked up by Move hash
+            analysis.analyse(gs.get_fen()) # Also stops the analysis of the old position
+            draw_game_state(renderer, gs, evaluation)
             sqSelected = ()
             playerClicks = []
             moveMade = False
+        if analysis.version != analysisVersion: # The analysis has a new result
+            analysisVersion = analysis.version
+            result = analysis.get_result()
+            if result is not None:
+                evaluation = ChessEngine.convert_evaluation(result[1])
+                draw_eval_bar(renderer, gs, evaluation)
         # print(sqSelected)
         clock.tick(MAX_FPS)  # Cap the framerate
-        p.display.flip()    # Update the screen
+        renderer.present()  # Update the changed parts of the screen (nothing if nothing changed)
+    analysis.close()
 
 def valid_keystroke(key):
     return key == p.K_z and (p.key.get_mods() & p.KMOD_CTRL) or key == p.K_z and (p.key.get_mods() & p.KMOD_META)
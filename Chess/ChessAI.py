@@ -0,0 +1,226 @@
+"""
+Native chess engine that picks the move for the computer side.
+Negamax with alpha-beta pruning over GameState.make_move/undo_move, with iterative deepening and a time/node budget.
+At depth 0 a quiescence search plays on the captures and promotions that don't lose material (by static exchange
+evaluation), so a position isn't evaluated in the middle of an exchange.
+"""
+
+import time
+from TranspositionTable import TranspositionTable, EXACT, LOWERBOUND, UPPERBOUND
+from MoveOrdering import MoveOrderer, is_quiet, see
+import Evaluation
+
+CHECKMATE = 100000                      # Score of giving checkmate (minus the plies it takes)
+STALEMATE = 0
+MATE_THRESHOLD = CHECKMATE - 1000       # Scores above this are forced mates
+MAX_DEPTH = 64
+CHECK_EVERY = 1024                      # Nodes between two checks of the time/node budget
+
+class SearchResult():
+    def __init__(self, bestMove, score, depth, nodes, seconds, pv, qnodes=0):
+        self.bestMove = bestMove        # Best move found (None if there are no moves)
+        self.score = score              # Centipawns from the point of view of the side to move
+        self.depth = depth              # Depth of the last completed iteration
+        self.nodes = nodes              # Nodes searched in total
+        self.seconds = seconds          # Wall-clock time of the search
+        self.pv = pv                    # Principal variation (list of moves)
+        self.qnodes = qnodes            # Of the nodes, those searched by the quiescence search
+
+    @property
+    def nps(self):
+        return int(self.nodes / self.seconds) if self.seconds > 0 else 0
+
+    def __str__(self):
+        pv = " ".join(move.get_chess_notation() for move in self.pv)
+        qshare = 100 * self.qnodes // self.nodes if self.nodes else 0
+        return (f"depth {self.depth} score {self.score} nodes {self.nodes} qnodes {self.qnodes} ({qshare}%) "
+                f"nps {self.nps} time {self.seconds:.2f}s pv {pv}")
+
+class Searcher():
+    def __init__(self, maxDepth=MAX_DEPTH, timeLimit=None, nodeLimit=None, onIteration=None, tt=None):
+        self.maxDepth = maxDepth        # Deepest iteration to search
+        self.timeLimit = timeLimit      # Seconds per move (None = no limit)
+        self.nodeLimit = nodeLimit      # Nodes per move (None = no limit)
+        self.onIteration = onIteration  # Called with a SearchResult after every completed iteration
+        self.tt = tt if tt is not None else TranspositionTable() # Pass the same table to keep it between moves
+        self.ordering = MoveOrderer()   # Killer moves and history, kept between iterations
+        self.stopped = False
+
+    """
+    Iterative deepening: search depth 1, 2, 3, ... until the budget runs out and return the last completed result
+    """
+    def search(self, gs):
+        self.start()
+        self.tt.new_search()
+        self.ordering.new_search()
+        rootMoves = order_root_moves(gs)
+        result = SearchResult(rootMoves[0] if rootMoves else None, 0, 0, 0, 0.0, [])
+        if len(rootMoves) <= 1: # Nothing to think about
+            return result
+
+        for depth in range(1, self.maxDepth + 1):
+            self.pvTable = [[] for _ in range(depth + 1)]
+            score = self.negamax(gs, depth, -CHECKMATE - 1, CHECKMATE + 1, 0, rootMoves)
+            if self.stopped: # The unfinished iteration is thrown away
+                break
+            pv = self.pvTable[0]
+            result = SearchResult(pv[0], score, depth, self.nodes, time.perf_counter() - self.startTime, pv, self.qnodes)
+            if self.onIteration is not None:
+                self.onIteration(result)
+            # Search the best move first in the next iteration, it is the most likely to stay the best
+            rootMoves.remove(pv[0])
+            rootMoves.insert(0, pv[0])
+            if abs(score) >= MATE_THRESHOLD:
+                break
+            # The next iteration takes several times longer, don't start it if it can't finish
+            if self.deadline is not None and time.perf_counter() - self.startTime > self.timeLimit / 2:
+                break
+        result.nodes = self.nodes
+        result.qnodes = self.qnodes
+        result.seconds = time.perf_counter() - self.startTime
+        return result
+
+    # Reset the counters and start the clock of a new search
+    def start(self):
+        self.nodes = 0
+        self.qnodes = 0
+        self.stopped = False
+        self.startTime = time.perf_counter()
+        self.deadline = self.startTime + self.timeLimit if self.timeLimit is not None else None
+
+    def negamax(self, gs, depth, alpha, beta, ply, moves=None):
+        self.pvTable[ply] = []
+        if depth == 0:
+            return self.quiescence(gs, alpha, beta, ply)
+        self.nodes += 1
+        if self.nodes % CHECK_EVERY == 0:
+            self.check_limits()
+
+        # Reuse what an earlier search of this position found
+        ttMoveID = None
+        entry = self.tt.probe(gs.zobristKey)
+        if entry is not None:
+            _, ttDepth, bound, ttScore, ttMoveID, _ = entry
+            if ttDepth >= depth and ply > 0:
+                ttScore = score_from_tt(ttScore, ply)
+                if bound == EXACT or (bound == LOWERBOUND and ttScore >= beta) or (bound == UPPERBOUND and ttScore <= alpha):
+                    return ttScore
+
+        if moves is None: # The root moves come already ordered
+            moves = gs.get_valid_moves()
+            if not moves: # Checkmate or stalemate
+                return -CHECKMATE + ply if gs.inCheck else STALEMATE
+            moves = self.ordering.pick(moves, ply, ttMoveID)
+
+        alphaOrig = alpha
+        bestScore = -CHECKMATE - 1
+        bestMove = None
+        quietsTried = []
+        for move in moves:
+            gs.make_move(move)
+            score = -self.negamax(gs, depth - 1, -beta, -alpha, ply + 1)
+            gs.undo_move()
+            if self.stopped:
+                return 0
+            if score > bestScore:
+                bestScore = score
+                bestMove = move
+                self.pvTable[ply] = [move] + self.pvTable[ply + 1]
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta: # The opponent will avoid this line, no need to look further
+                        if is_quiet(move):
+                            self.ordering.cutoff(move, ply, depth, quietsTried)
+                        break
+            if is_quiet(move):
+                quietsTried.append(move)
+
+        if bestScore <= alphaOrig:
+            bound = UPPERBOUND
+        elif bestScore >= beta:
+            bound = LOWERBOUND
+        else:
+            bound = EXACT
+        self.tt.store(gs.zobristKey, depth, bound, score_to_tt(bestScore, ply), bestMove.moveID)
+        return bestScore
+
+    # Search only captures and promotions (all moves when in check) until the position is quiet.
+    # The side to move may also stand pat on the static evaluation, it doesn't have to capture
+    def quiescence(self, gs, alpha, beta, ply):
+        self.nodes += 1
+        self.qnodes += 1
+        if self.nodes % CHECK_EVERY == 0:
+            self.check_limits()
+        # Only the captures and promotions, unless in check: then every evasion
+        inCheck, moves = gs.get_valid_captures()
+        bestScore = -CHECKMATE - 1
+        if inCheck:
+            if not moves: # Checkmate
+                return -CHECKMATE + ply
+        else:
+            bestScore = self.evaluate(gs)
+            if bestScore >= beta:
+                return bestScore
+            alpha = max(alpha, bestScore)
+            # Captures that lose material on the exchange are left out
+            moves = [move for move in moves if see(gs.board, move) >= 0]
+
+        for move in self.ordering.pick(moves, ply):
+            gs.make_move(move)
+            score = -self.quiescence(gs, -beta, -alpha, ply + 1)
+            gs.undo_move()
+            if self.stopped:
+                return 0
+            if score > bestScore:
+                bestScore = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return bestScore
+
+    def check_limits(self):
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            self.stopped = True
+        if self.nodeLimit is not None and self.nodes >= self.nodeLimit:
+            self.stopped = True
+
+    # Static evaluation from the point of view of the side to move, from the totals GameState keeps up to date
+    def evaluate(self, gs):
+        return Evaluation.evaluate_state(gs)
+
+# Root moves of the position, in the order of the static score after each move (all scored in one batch)
+def order_root_moves(gs):
+    rootMoves = gs.get_valid_moves()
+    if len(rootMoves) <= 1:
+        return rootMoves
+    scores = Evaluation.score_moves(gs, rootMoves)
+    return [move for _, move in sorted(zip(scores, rootMoves), key=lambda pair: -pair[0])]
+
+# Mate scores are stored relative to the position (not the root), so they stay right in a transposition
+def score_to_tt(score, ply):
+    if score >= MATE_THRESHOLD:
+        return score + ply
+    if score <= -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+def score_from_tt(score, ply):
+    if score >= MATE_THRESHOLD:
+        return score - ply
+    if score <= -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+# Transposition table shared by the computer's moves within one game
+sharedTable = None
+
+# Pick the computer's move within the budget and report how the search went
+def find_best_move(gs, timeLimit=1.0, maxDepth=MAX_DEPTH, nodeLimit=None):
+    global sharedTable
+    if sharedTable is None:
+        sharedTable = TranspositionTable()
+    searcher = Searcher(maxDepth=maxDepth, timeLimit=timeLimit, nodeLimit=nodeLimit, tt=sharedTable)
+    result = searcher.search(gs)
+    print(result)
+    return result.bestMove
@@ -2,249 +2,654 @@
 Information about current game state. Evaluates valid moves at current state. Keeps a move log.
 """
 
+from array import array
 import numpy as np
-from stockfish import Stockfish
-from stockfish import StockfishException
 import chess
+import chess.polyglot
+import EnginePool
+import Evaluation
+import Fen
+# Piece codes, castling flags, square indexing and attack tables (precomputed so the move generators never have to
+# check the board edges). The codes and flags are imported here so ChessEngine.PAWN etc. keep working
+from Geometry import (DIMENSION, ROW_COL, EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, WHITE_KINGSIDE,
+                      WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE, CASTLE_KING_SQUARES, CASTLE_RIGHTS_MASK,
+                      castle_rook_squares, enpassant_captured_sq, KNIGHT_TARGETS, KING_TARGETS, ROOK_RAYS,
+                      BISHOP_RAYS, WHITE_PAWN_ATTACKS, BLACK_PAWN_ATTACKS)
+
+# Conversion between piece codes and the old two character strings ("wp", "bK", "--", ...)
+PIECE_TO_STR = {EMPTY: "--",
+                PAWN: "wp", KNIGHT: "wN", BISHOP: "wB", ROOK: "wR", QUEEN: "wQ", KING: "wK",
+                -PAWN: "bp", -KNIGHT: "bN", -BISHOP: "bB", -ROOK: "bR", -QUEEN: "bQ", -KING: "bK"}
+STR_TO_PIECE = {v: k for k, v in PIECE_TO_STR.items()}
+# Conversion between piece codes and FEN letters (uppercase for white, lowercase for black)
+PIECE_TO_FEN = {PAWN: "P", KNIGHT: "N", BISHOP: "B", ROOK: "R", QUEEN: "Q", KING: "K",
+                -PAWN: "p", -KNIGHT: "n", -BISHOP: "b", -ROOK: "r", -QUEEN: "q", -KING: "k"}
+
+PROMOTION_PIECES = [QUEEN, ROOK, BISHOP, KNIGHT]
+
+# Zobrist keys, taken from the standard Polyglot table so GameState keys match Polyglot opening books.
+# Polyglot piece kinds are black pawn, white pawn, black knight, ... and its rank 0 is our row 7
+POLYGLOT_RANDOM = chess.polyglot.POLYGLOT_RANDOM_ARRAY
+ZOBRIST_PIECES = [[0] * (DIMENSION * DIMENSION) for _ in range(13)] # ZOBRIST_PIECES[code + 6][sq]
+for code in PIECE_TO_FEN:
+    kind = 2 * (abs(code) - 1) + (1 if code > 0 else 0)
+    for sq, (row, col) in enumerate(ROW_COL):
+        ZOBRIST_PIECES[code + 6][sq] = POLYGLOT_RANDOM[64 * kind + 8 * (DIMENSION - 1 - row) + col]
+ZOBRIST_WHITE_TO_MOVE = POLYGLOT_RANDOM[780]
+# ZOBRIST_CASTLING[rights] for every combination of the 4 castling flags, ZOBRIST_ENPASSANT[col]
+ZOBRIST_CASTLING = [0] * 16
+for rights in range(16):
+    for bit in range(4):
+        if rights & (1 << bit):
+            ZOBRIST_CASTLING[rights] ^= POLYGLOT_RANDOM[768 + bit]
+ZOBRIST_ENPASSANT = [POLYGLOT_RANDOM[772 + col] for col in range(DIMENSION)]
+
+START_BOARD = [
+    ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
+    ["bp", "bp", "bp", "bp", "bp", "bp", "bp", "bp"],
+    ["--", "--", "--", "--", "--", "--", "--", "--"],
+    ["--", "--", "--", "--", "--", "--", "--", "--"],
+    ["--", "--", "--", "--", "--", "--", "--", "--"],
+    ["--", "--", "--", "--", "--", "--", "--", "--"],
+    ["wp", "wp", "wp", "wp", "wp", "wp", "wp", "wp"],
+    ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]
+]
+
+# Convert a grid of two character strings (list or np array) to the compact board
+def grid_to_board(grid):
+    return array('b', [STR_TO_PIECE[str(square)] for row in grid for square in row])
+
+# Convert the compact board back to the 8x8 np array of two character strings
+def board_to_grid(board):
+    return np.array([[PIECE_TO_STR[board[row * DIMENSION + col]] for col in range(DIMENSION)]
+                     for row in range(DIMENSION)])
 
 class GameState():
-    def __init__(self):
-        # Board is an 8x8 2d np array, each element of the list has 2 characters.
-        # The first character represents the color of the piece, 'b' or 'w'
-        # The second character represents the type of the piece, 'K', 'Q', 'R', 'B', 'N', 'P'
-        # "--" represents an empty space with no piece.
-        self.board = np.array([
-            ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
-            ["bp", "bp", "bp", "bp", "bp", "bp", "bp", "bp"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["wp", "wp", "wp", "wp", "wp", "wp", "wp", "wp"],
-            ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]
-        ])
-        self.lenRow = len(self.board)
-        self.lenCol = len(self.board[0])
-        # Dictionary to map the piece to its move function
-        self.moveFunctions = {"p": self.get_pawn_moves, "R": self.get_rook_moves, "N": self.get_knight_moves, 
-                              "B": self.get_bishop_moves, "Q": self.get_queen_moves, "K": self.get_king_moves}
+    def __init__(self, fen=None):
+        # Board is a flat array of 64 signed bytes, one piece code per square (see the codes above).
+        # board[row * 8 + col] is the square at (row, col), EMPTY (0) represents an empty space with no piece.
+        # Use get_board_grid() for the old 8x8 np array of strings ("wp", "bK", "--", ...)
+        self.board = grid_to_board(START_BOARD)
+        # Dictionary to map the piece type to its move function
+        self.moveFunctions = {PAWN: self.get_pawn_moves, ROOK: self.get_rook_moves, KNIGHT: self.get_knight_moves,
+                              BISHOP: self.get_bishop_moves, QUEEN: self.get_queen_moves, KING: self.get_king_moves}
         self.whiteToMove = True 
         self.moveLog = [] # list of all moves taken in the game  
+        self.whiteKingSq = 60 # e1
+        self.blackKingSq = 4  # e8
+        self.inCheck = False
+        self.checkmate = False
+        self.stalemate = False
+        self.enpassantSq = None # Square a pawn can capture onto en passant (None if there is none)
+        self.enpassantLog = [] # Previous en passant squares, restored by undo_move
+        self.castlingRights = WHITE_KINGSIDE | WHITE_QUEENSIDE | BLACK_KINGSIDE | BLACK_QUEENSIDE
+        self.castleRightsLog = [] # Previous castling rights, restored by undo_move
+        self.bitboards = None # Optional Bitboard.BitboardBoard move generator (see use_bitboards)
+        self.zobristKey = self.compute_zobrist_key() # Position key, updated incrementally by make_move
+        self.zobristLog = [] # Keys of the previous positions, restored by undo_move
+        self.scoreLog = [] # Previous (middleScore, endScore, phase), restored by undo_move
+        self.halfmoveClock = 0 # Plies since the last capture or pawn move (fifty-move rule)
+        self.fullmoveNumber = 1 # Starts at 1 and goes up after every black move
+        self.halfmoveLog = [] # Previous halfmove clocks, restored by undo_move
+        self.compute_piece_state()
+        if fen is not None:
+            self.load_fen(fen)
+
+    # Set up any position from a FEN string (all six fields, see Fen.decode), clearing the move log
+    def load_fen(self, fen):
+        data, whiteToMove, castlingRights, enpassantSq, halfmoveClock, fullmoveNumber = Fen.decode(fen)
+        board = array('b', data)
+        if board.count(KING) != 1 or board.count(-KING) != 1:
+            raise ValueError(f"Invalid FEN board '{fen.split()[0]}', each side needs one king")
+        self.board = board
+        self.whiteToMove = whiteToMove
+        self.castlingRights = castlingRights
+        self.enpassantSq = enpassantSq
+        self.halfmoveClock = halfmoveClock
+        self.fullmoveNumber = fullmoveNumber
+        self.halfmoveLog = []
+        self.whiteKingSq = self.board.index(KING)
+        self.blackKingSq = self.board.index(-KING)
+        self.moveLog = []
+        self.enpassantLog = []
+        self.castleRightsLog = []
+        self.zobristLog = []
+        self.scoreLog = []
+        self.zobristKey = self.compute_zobrist_key()
+        self.compute_piece_state()
+        self.checkmate = False
+        self.stalemate = False
+        if self.bitboards is not None:
+            self.use_bitboards()
+
+    # Conversion shim for code that still wants the 8x8 grid of strings
+    def get_board_grid(self):
+        return board_to_grid(self.board)
+
+    # Zobrist key of the position computed from scratch (make_move/undo_move keep self.zobristKey up to date)
+    def compute_zobrist_key(self):
+        key = ZOBRIST_WHITE_TO_MOVE if self.whiteToMove else 0
+        for sq in range(DIMENSION * DIMENSION):
+            piece = self.board[sq]
+            if piece != EMPTY:
+                key ^= ZOBRIST_PIECES[piece + 6][sq]
+        return key ^ ZOBRIST_CASTLING[self.castlingRights] ^ self.zobrist_enpassant()
+
+    # Piece lists and evaluation totals computed from scratch (make_move/undo_move keep them up to date):
+    # pieceSquares[code + 6] is the set of squares holding that piece, middleScore/endScore are material plus
+    # piece-square values (white minus black) and phase is Evaluation's phase
+    def compute_piece_state(self):
+        self.pieceSquares = [set() for _ in range(13)]
+        for sq, piece in enumerate(self.board):
+            if piece != EMPTY:
+                self.pieceSquares[piece + 6].add(sq)
+        self.middleScore, self.endScore, self.phase = Evaluation.board_totals(self.board)
+
+    # Like Polyglot, the en passant file only counts when a pawn of the side to move can capture there
+    def zobrist_enpassant(self):
+        if self.enpassant_capturable():
+            return ZOBRIST_ENPASSANT[ROW_COL[self.enpassantSq][1]]
+        return 0
+
+    # Can a pawn of the side to move capture on the en passant square? (Polyglot and FENs as python-chess writes
+    # them only mention the square then)
+    def enpassant_capturable(self):
+        if self.enpassantSq is None:
+            return False
+        pawn = PAWN if self.whiteToMove else -PAWN
+        attackers = BLACK_PAWN_ATTACKS if self.whiteToMove else WHITE_PAWN_ATTACKS
+        for sq in attackers[self.enpassantSq]:
+            if self.board[sq] == pawn:
+                return True
+        return False
+
+    # Switch get_all_possible_moves to the bitboard move generator (same moves, built with bit operations)
+    def use_bitboards(self, enabled=True):
+        if enabled:
+            import Bitboard # Imported here because Bitboard itself imports this module
+            self.bitboards = Bitboard.BitboardBoard(self.board)
+        else:
+            self.bitboards = None
 
     """
     Functions to move pieces
     """
-    # Takes a Move as a parameter and executes it (this will not work for castling, pawn promotion, and en-passant)
+    # Takes a Move as a parameter and executes it (including castling, pawn promotion, and en-passant)
     def make_move(self, move):
-        if self.board[move.startRow][move.startCol] != "--":
-            self.board[move.startRow][move.startCol] = "--"         # Empty the start square
-            self.board[move.endRow][move.endCol] = move.pieceMoved  # Move the piece to the end square
-            self.moveLog.append(move)                               # Log the move
-            self.whiteToMove = not self.whiteToMove                 # Swap the turn
+        board = self.board
+        if board[move.startSq] == EMPTY:
+            return
+        self.zobristLog.append(self.zobristKey)
+        self.enpassantLog.append(self.enpassantSq)
+        self.castleRightsLog.append(self.castlingRights)
+        self.scoreLog.append((self.middleScore, self.endScore, self.phase))
+        self.halfmoveLog.append(self.halfmoveClock)
+        # Remove the old castling and en passant state from the key, the new one is added at the end
+        key = self.zobristKey ^ ZOBRIST_CASTLING[self.castlingRights] ^ self.zobrist_enpassant()
+        pieceMoved = move.pieceMoved
+        piecePlaced = move.promotionPiece if move.promotionPiece != EMPTY else pieceMoved
+
+        pieceSquares = self.pieceSquares
+
+        board[move.startSq] = EMPTY                         # Empty the start square
+        board[move.endSq] = piecePlaced                     # Move the piece to the end square
+        key ^= ZOBRIST_PIECES[pieceMoved + 6][move.startSq] ^ ZOBRIST_PIECES[piecePlaced + 6][move.endSq]
+        pieceSquares[pieceMoved + 6].remove(move.startSq)
+        pieceSquares[piecePlaced + 6].add(move.endSq)
+        if move.pieceCaptured != EMPTY:
+            if move.isEnpassantMove: # The captured pawn is next to the start square, not on the end square
+                capturedSq = enpassant_captured_sq(move.startSq, move.endSq)
+                board[capturedSq] = EMPTY
+            else:
+                capturedSq = move.endSq
+            key ^= ZOBRIST_PIECES[move.pieceCaptured + 6][capturedSq]
+            pieceSquares[move.pieceCaptured + 6].remove(capturedSq)
+        if move.isCastleMove: # Move the rook to the other side of the king
+            rookStart, rookEnd = castle_rook_squares(move.endSq)
+            rook = board[rookStart]
+            board[rookStart] = EMPTY
+            board[rookEnd] = rook
+            key ^= ZOBRIST_PIECES[rook + 6][rookStart] ^ ZOBRIST_PIECES[rook + 6][rookEnd]
+            pieceSquares[rook + 6].remove(rookStart)
+            pieceSquares[rook + 6].add(rookEnd)
+        middle, end, phase = Evaluation.move_delta(move)
+        self.middleScore += middle
+        self.endScore += end
+        self.phase += phase
+        if pieceMoved == KING:
+            self.whiteKingSq = move.endSq
+        elif pieceMoved == -KING:
+            self.blackKingSq = move.endSq
+
+        # A 2 square pawn advance allows en passant on the square it skipped
+        if (pieceMoved == PAWN or pieceMoved == -PAWN) and abs(move.endSq - move.startSq) == 2 * DIMENSION:
+            self.enpassantSq = (move.startSq + move.endSq) // 2
+        else:
+            self.enpassantSq = None
+        # Moving the king or a rook (or capturing a rook) loses the castling rights of that rook
+        self.castlingRights &= CASTLE_RIGHTS_MASK[move.startSq] & CASTLE_RIGHTS_MASK[move.endSq]
+        if pieceMoved == PAWN or pieceMoved == -PAWN or move.pieceCaptured != EMPTY:
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        if not self.whiteToMove: # Black finished the move
+            self.fullmoveNumber += 1
+
+        self.moveLog.append(move)                           # Log the move
+        self.whiteToMove = not self.whiteToMove             # Swap the turn
+        self.zobristKey = key ^ ZOBRIST_WHITE_TO_MOVE ^ ZOBRIST_CASTLING[self.castlingRights] ^ self.zobrist_enpassant()
+        if self.bitboards is not None:
+            self.bitboards.make_move(move)
 
     # Undo the last move made
     def undo_move(self):
         if len(self.moveLog) != 0:
+            board = self.board
+            pieceSquares = self.pieceSquares
             move = self.moveLog.pop()
-            self.board[move.startRow][move.startCol] = move.pieceMoved
-            self.board[move.endRow][move.endCol] = move.pieceCaptured
+            pieceMoved = move.pieceMoved
+            piecePlaced = board[move.endSq]
+            board[move.startSq] = pieceMoved
+            pieceSquares[piecePlaced + 6].remove(move.endSq)
+            pieceSquares[pieceMoved + 6].add(move.startSq)
+            if move.isEnpassantMove: # Put the captured pawn back next to the start square
+                board[move.endSq] = EMPTY
+                capturedSq = enpassant_captured_sq(move.startSq, move.endSq)
+                board[capturedSq] = move.pieceCaptured
+            else:
+                capturedSq = move.endSq
+                board[capturedSq] = move.pieceCaptured
+            if move.pieceCaptured != EMPTY:
+                pieceSquares[move.pieceCaptured + 6].add(capturedSq)
+            if move.isCastleMove: # Put the rook back in the corner
+                rookStart, rookEnd = castle_rook_squares(move.endSq)
+                rook = board[rookEnd]
+                board[rookStart] = rook
+                board[rookEnd] = EMPTY
+                pieceSquares[rook + 6].remove(rookEnd)
+                pieceSquares[rook + 6].add(rookStart)
+            self.middleScore, self.endScore, self.phase = self.scoreLog.pop()
+            if move.pieceMoved == KING:
+                self.whiteKingSq = move.startSq
+            elif move.pieceMoved == -KING:
+                self.blackKingSq = move.startSq
             self.whiteToMove = not self.whiteToMove
+            if not self.whiteToMove: # Black's move was taken back
+                self.fullmoveNumber -= 1
+            self.halfmoveClock = self.halfmoveLog.pop()
+            self.enpassantSq = self.enpassantLog.pop()
+            self.castlingRights = self.castleRightsLog.pop()
+            self.zobristKey = self.zobristLog.pop()
+            self.checkmate = False
+            self.stalemate = False
+            if self.bitboards is not None:
+                self.bitboards.undo_move(move)
 
     """
     Functions to get all possible moves
     """
-    # All moves considering checks
+    # All moves considering checks. Checking pieces and pins are found once for the position,
+    # then every possible move is kept or dropped with a lookup instead of making it and testing for check
     def get_valid_moves(self):
-        return self.get_all_possible_moves() #! We will not consider checks for now
+        ally = 1 if self.whiteToMove else -1
+        kingSq = self.whiteKingSq if self.whiteToMove else self.blackKingSq
+        self.inCheck, pins, checks = self.check_for_pins_and_checks(kingSq, ally)
+        validMoves = self.legal_moves(self.get_all_possible_moves(), kingSq, ally, pins, checks)
+        if len(validMoves) == 0:
+            self.checkmate = self.inCheck
+            self.stalemate = not self.inCheck
+        else:
+            self.checkmate = False
+            self.stalemate = False
+        return validMoves
+
+    # Legal captures and promotions for the quiescence search, or every legal move (all the evasions) when the side
+    # to move is in check. Returns (inCheck, moves), checkmate and stalemate are left alone since quiet moves
+    # aren't looked at
+    def get_valid_captures(self):
+        ally = 1 if self.whiteToMove else -1
+        kingSq = self.whiteKingSq if self.whiteToMove else self.blackKingSq
+        self.inCheck, pins, checks = self.check_for_pins_and_checks(kingSq, ally)
+        moves = self.get_all_possible_moves() if self.inCheck else self.get_all_possible_captures()
+        return self.inCheck, self.legal_moves(moves, kingSq, ally, pins, checks)
+
+    # The possible moves that don't leave the king in check, given the pins and checks of the position
+    def legal_moves(self, moves, kingSq, ally, pins, checks):
+        board = self.board
+        # When in check, other pieces may only capture the checking piece or block its line
+        blockSquares = checks[0] if len(checks) == 1 else None
+        doubleCheck = len(checks) > 1
+
+        validMoves = []
+        for move in moves:
+            if move.startSq == kingSq:
+                if move.isCastleMove:
+                    passSq = (move.startSq + move.endSq) // 2
+                    if not checks and not self.square_under_attack(passSq, -ally) \
+                            and not self.square_under_attack(move.endSq, -ally):
+                        validMoves.append(move)
+                else:
+                    # Take the king off the board so a slider's line doesn't stop at the king itself
+                    board[kingSq] = EMPTY
+                    if not self.square_under_attack(move.endSq, -ally):
+                        validMoves.append(move)
+                    board[kingSq] = move.pieceMoved
+            elif doubleCheck: # Only the king can move out of a double check
+                continue
+            elif move.isEnpassantMove: # Rare, so simply try it (it can expose the king along the rank)
+                if self.enpassant_is_legal(move, kingSq, ally):
+                    validMoves.append(move)
+            elif blockSquares is not None and move.endSq not in blockSquares:
+                continue
+            elif move.startSq in pins and move.endSq not in pins[move.startSq]:
+                continue
+            else:
+                validMoves.append(move)
+        return validMoves
     
     # All moves without considering checks
     def get_all_possible_moves(self):
+        if self.bitboards is not None:
+            return self.bitboards.get_all_possible_moves(self)
         moves = [] 
-        for row in range(len(self.board)):
-            for col in range(len(self.board[row])):
-                turn = self.board[row][col][0] # Get the color of the piece
-                if (turn == 'w' and self.whiteToMove) or (turn == 'b' and not self.whiteToMove): # If it's the correct turn
-                    piece = self.board[row][col][1] # Get the piece type
-                    self.moveFunctions[piece](row, col, moves)
+        color = 1 if self.whiteToMove else -1
+        pieceSquares = self.pieceSquares
+        moveFunctions = self.moveFunctions
+        for kind in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING): # Only the squares of the side to move's pieces
+            squares = pieceSquares[color * kind + 6]
+            if squares:
+                moveFunction = moveFunctions[kind]
+                for sq in squares:
+                    moveFunction(sq, moves)
+        return moves
+
+    # Captures (en passant included) and promotions without considering checks
+    def get_all_possible_captures(self):
+        if self.bitboards is not None:
+            return self.bitboards.get_all_possible_moves(self, capturesOnly=True)
+        board = self.board
+        ally = 1 if self.whiteToMove else -1
+        pieceSquares = self.pieceSquares
+        moves = []
+        pawnAttacks = WHITE_PAWN_ATTACKS if ally == 1 else BLACK_PAWN_ATTACKS
+        lastRow = 1 if ally == 1 else DIMENSION - 2 # Row from which an advance promotes
+        for sq in pieceSquares[ally * PAWN + 6]:
+            if ROW_COL[sq][0] == lastRow: # Every move of this pawn is a promotion
+                self.get_pawn_moves(sq, moves)
+                continue
+            for endSq in pawnAttacks[sq]:
+                if board[endSq] * ally < 0:
+                    moves.append(Move(sq, endSq, board))
+                elif endSq == self.enpassantSq:
+                    moves.append(Move(sq, endSq, board, isEnpassantMove=True))
+        for kind, targets in ((KNIGHT, KNIGHT_TARGETS), (KING, KING_TARGETS)):
+            for sq in pieceSquares[ally * kind + 6]:
+                for endSq in targets[sq]:
+                    if board[endSq] * ally < 0:
+                        moves.append(Move(sq, endSq, board))
+        for kind, tables in ((BISHOP, (BISHOP_RAYS,)), (ROOK, (ROOK_RAYS,)), (QUEEN, (ROOK_RAYS, BISHOP_RAYS))):
+            for sq in pieceSquares[ally * kind + 6]:
+                for table in tables:
+                    for ray in table[sq]:
+                        for endSq in ray: # Only the first piece on the ray can be captured
+                            piece = board[endSq]
+                            if piece != EMPTY:
+                                if piece * ally < 0:
+                                    moves.append(Move(sq, endSq, board))
+                                break
         return moves
+
+    """
+    Functions to find checks, pins and attacked squares
+    """
+    # Walk out from the king in every direction: the first own piece on a line towards an enemy slider is pinned,
+    # an enemy slider with nothing in between is giving check. Returns (inCheck, pins, checks) where pins maps the
+    # square of a pinned piece to the squares it may still move to, and checks holds for every checking piece
+    # the squares that capture it or block it
+    def check_for_pins_and_checks(self, kingSq, ally):
+        board = self.board
+        pins = {}
+        checks = []
+        for rays, slider in ((ROOK_RAYS[kingSq], ROOK), (BISHOP_RAYS[kingSq], BISHOP)):
+            for ray in rays:
+                possiblePin = None
+                for i, sq in enumerate(ray):
+                    piece = board[sq] * ally # Positive for own pieces, negative for enemy pieces
+                    if piece > 0:
+                        if possiblePin is not None: # Second own piece, nothing is pinned on this line
+                            break
+                        possiblePin = sq
+                    elif piece < 0:
+                        if piece == -slider or piece == -QUEEN:
+                            if possiblePin is None:
+                                checks.append(set(ray[:i + 1]))
+                            else:
+                                pins[possiblePin] = set(ray[:i + 1])
+                        break
+        for sq in KNIGHT_TARGETS[kingSq]:
+            if board[sq] == -ally * KNIGHT:
+                checks.append({sq})
+        pawnAttacks = WHITE_PAWN_ATTACKS if ally == 1 else BLACK_PAWN_ATTACKS
+        for sq in pawnAttacks[kingSq]:
+            if board[sq] == -ally * PAWN:
+                checks.append({sq})
+        return len(checks) > 0, pins, checks
+
+    # True if any piece of the color enemy (1 white, -1 black) attacks the square
+    def square_under_attack(self, sq, enemy):
+        board = self.board
+        for attackSq in KNIGHT_TARGETS[sq]:
+            if board[attackSq] == enemy * KNIGHT:
+                return True
+        for attackSq in KING_TARGETS[sq]:
+            if board[attackSq] == enemy * KING:
+                return True
+        # Enemy pawns attacking the square stand where a pawn of the other color on the square would attack
+        pawnAttacks = BLACK_PAWN_ATTACKS if enemy == 1 else WHITE_PAWN_ATTACKS
+        for attackSq in pawnAttacks[sq]:
+            if board[attackSq] == enemy * PAWN:
+                return True
+        for rays, slider in ((ROOK_RAYS[sq], enemy * ROOK), (BISHOP_RAYS[sq], enemy * BISHOP)):
+            for ray in rays:
+                for attackSq in ray:
+                    piece = board[attackSq]
+                    if piece != EMPTY:
+                        if piece == slider or piece == enemy * QUEEN:
+                            return True
+                        break
+        return False
+
+    # En passant removes two pawns from the same rank, which can uncover an attack on the king
+    def enpassant_is_legal(self, move, kingSq, ally):
+        board = self.board
+        capturedSq = enpassant_captured_sq(move.startSq, move.endSq)
+        board[move.startSq] = EMPTY
+        board[capturedSq] = EMPTY
+        board[move.endSq] = move.pieceMoved
+        legal = not self.square_under_attack(kingSq, -ally)
+        board[move.startSq] = move.pieceMoved
+        board[capturedSq] = move.pieceCaptured
+        board[move.endSq] = EMPTY
+        return legal
     
     """
     Functions to get all possible moves for each piece
     """
-    def get_pawn_moves(self, row, col, moves):
+    def get_pawn_moves(self, sq, moves):
+        board = self.board
+        row, col = ROW_COL[sq]
         if self.whiteToMove: # White pawn moves
-            next_row = row - 1
-            next_2_row = row - 2
-            start_row = self.lenRow - 2
-            other_player = 'b'
+            step = -DIMENSION
+            start_row = DIMENSION - 2
+            last_row = 1 # Row from which an advance promotes
+            enemy = -1
         else: # Black pawn moves
-            next_row = row + 1
-            next_2_row = row + 2
-            start_row = self.lenRow - 7
-            other_player = 'w'
-
-        if self.board[next_row][col] == "--": # 1 square pawn advance
-                moves.append(Move((row, col), (next_row, col), self.board))
-                if row == start_row and self.board[next_2_row][col] == "--": # 2 square pawn advance if at starting position
-                    moves.append(Move((row, col), (next_2_row, col), self.board))
+            step = DIMENSION
+            start_row = 1
+            last_row = DIMENSION - 2
+            enemy = 1
+
+        targets = []
+        next_sq = sq + step
+        if board[next_sq] == EMPTY: # 1 square pawn advance
+                targets.append(next_sq)
+                if row == start_row and board[next_sq + step] == EMPTY: # 2 square pawn advance if at starting position
+                    targets.append(next_sq + step)
         if col - 1 >= 0: # Capture to the left/right
-            if self.board[next_row][col - 1][0] == other_player:
-                moves.append(Move((row, col), (next_row, col - 1), self.board))
-        if col + 1 <= self.lenCol - 1: # Capture to the right/left
-            if self.board[next_row][col + 1][0] == other_player:
-                moves.append(Move((row, col), (next_row, col + 1), self.board))     
-        #^ add pawn promotion, en-passant
+            if board[next_sq - 1] * enemy > 0:
+                targets.append(next_sq - 1)
+            elif next_sq - 1 == self.enpassantSq:
+                moves.append(Move(sq, next_sq - 1, board, isEnpassantMove=True))
+        if col + 1 <= DIMENSION - 1: # Capture to the right/left
+            if board[next_sq + 1] * enemy > 0:
+                targets.append(next_sq + 1)
+            elif next_sq + 1 == self.enpassantSq:
+                moves.append(Move(sq, next_sq + 1, board, isEnpassantMove=True))
+        for endSq in targets:
+            if row == last_row: # Pawn promotion, one move for every piece it can become
+                for piece in PROMOTION_PIECES:
+                    moves.append(Move(sq, endSq, board, promotionPiece=-enemy * piece))
+            else:
+                moves.append(Move(sq, endSq, board))
         
-    def get_rook_moves(self, row, col, moves):
-        directions = [(1, 0), (-1, 0), (0, 1), (0, -1)] # up left down right
-        self.bishop_rook_helper(row, col, moves, directions)               
+    def get_rook_moves(self, sq, moves):
+        self.bishop_rook_helper(sq, moves, ROOK_RAYS[sq]) # down up right left
 
-    def get_bishop_moves(self, row, col, moves):
-        directions = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
-        self.bishop_rook_helper(row, col, moves, directions)   
+    def get_bishop_moves(self, sq, moves):
+        self.bishop_rook_helper(sq, moves, BISHOP_RAYS[sq])
     
-    def bishop_rook_helper(self, row, col, moves, directions):
-        enemyColor = "b" if self.whiteToMove else "w"
-        for d in directions:
-            for i in range(1, self.lenRow):
-                endRow = row + d[0] * i
-                endCol = col + d[1] * i
-                if 0 <= endRow < self.lenRow and 0 <= endCol < self.lenCol:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece == "--":
-                        moves.append(Move((row, col), (endRow, endCol), self.board))
-                    elif endPiece[0] == enemyColor:
-                        moves.append(Move((row, col), (endRow, endCol), self.board))
-                        break
-                    else:
-                        break
+    def bishop_rook_helper(self, sq, moves, rays):
+        board = self.board
+        enemy = -1 if self.whiteToMove else 1
+        for ray in rays:
+            for endSq in ray:
+                endPiece = board[endSq]
+                if endPiece == EMPTY:
+                    moves.append(Move(sq, endSq, board))
+                elif endPiece * enemy > 0:
+                    moves.append(Move(sq, endSq, board))
+                    break
                 else:
                     break
                 
-    def get_knight_moves(self, row, col, moves):
-        knight_moves = [
-            (row - 2, col - 1), (row - 2, col + 1),
-            (row + 2, col - 1), (row + 2, col + 1),
-            (row - 1, col - 2), (row - 1, col + 2),
-            (row + 1, col - 2), (row + 1, col + 2)
-        ]
-        
-        for move in knight_moves:
-            r, c = move
-            if 0 <= r < self.lenRow and 0 <= c < self.lenCol:
-                if self.board[r][c] == "--" or self.board[r][c][0] != self.board[row][col][0]:
-                    moves.append(Move((row, col), (r, c), self.board))
-
-    def get_queen_moves(self, row, col, moves):
-        self.get_rook_moves(row, col, moves)
-        self.get_bishop_moves(row, col, moves)
-
-    def get_king_moves(self, row, col, moves):
-        directions = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)]
-        allyColor = "w" if self.whiteToMove else "b"
-        for i in range(len(directions)):
-            r = row + directions[i][0]
-            c = col + directions[i][1]
-            if 0 <= r < self.lenRow and 0 <= c < self.lenCol:
-                endPiece = self.board[r][c]
-                if endPiece[0] != allyColor:
-                    moves.append(Move((row, col), (r, c), self.board))      
+    def get_knight_moves(self, sq, moves):
+        board = self.board
+        ally = 1 if self.whiteToMove else -1
+        for endSq in KNIGHT_TARGETS[sq]:
+            if board[endSq] * ally <= 0: # Empty or enemy square
+                moves.append(Move(sq, endSq, board))
+
+    def get_queen_moves(self, sq, moves):
+        self.get_rook_moves(sq, moves)
+        self.get_bishop_moves(sq, moves)
+
+    def get_king_moves(self, sq, moves):
+        board = self.board
+        ally = 1 if self.whiteToMove else -1
+        for endSq in KING_TARGETS[sq]:
+            if board[endSq] * ally <= 0: # Empty or enemy square
+                moves.append(Move(sq, endSq, board))      
+        self.get_castle_moves(sq, moves)
+
+    # Castling while the king and rook haven't moved and the squares between them are empty
+    # (whether the king passes through check is tested in get_valid_moves)
+    def get_castle_moves(self, sq, moves):
+        board = self.board
+        if self.whiteToMove:
+            kingside, queenside, ally = WHITE_KINGSIDE, WHITE_QUEENSIDE, 1
+        else:
+            kingside, queenside, ally = BLACK_KINGSIDE, BLACK_QUEENSIDE, -1
+        if sq != CASTLE_KING_SQUARES[ally] or board[sq] != ally * KING:
+            return
+        if self.castlingRights & kingside and board[sq + 1] == EMPTY and board[sq + 2] == EMPTY \
+                and board[sq + 3] == ally * ROOK:
+            moves.append(Move(sq, sq + 2, board, isCastleMove=True))
+        if self.castlingRights & queenside and board[sq - 1] == EMPTY and board[sq - 2] == EMPTY \
+                and board[sq - 3] == EMPTY and board[sq - 4] == ally * ROOK:
+            moves.append(Move(sq, sq - 2, board, isCastleMove=True))
 
     """
-    Functions to get the evaluation of the current position. FEN NEEDS TO BE FIXED
+    Functions to get the evaluation of the current position
     """
+    # FEN of the position with all six fields. The en passant square is only given when a pawn can take there,
+    # like python-chess writes it, so the same position gives the same FEN (and evaluation cache key) everywhere
     def get_fen(self):
-        fen = ""
-        for row in self.board:
-            empty_count = 0
-            for square in row:
-                if square == "--":
-                    empty_count += 1
-                else:
-                    if empty_count > 0:
-                        fen += str(empty_count)
-                        empty_count = 0
-                    # Translate the piece based on color
-                    piece = square[1]  # Piece type
-                    color = square[0]  # Piece color
-                    # Use uppercase for white and lowercase for black
-                    fen += piece.upper() if color == 'w' else piece.lower()
-            if empty_count > 0:
-                fen += str(empty_count)
-            fen += "/"    
-        # Remove the last slash
-        fen = fen[:-1]
-        # Add the turn to move
-        fen += " " + ("w" if self.whiteToMove else "b")  
-        # Add castling availability (not implemented, so we just add "-" for simplicity)
-        fen += " -"   
-        # Add en passant target square (not implemented, so we just add "-" for simplicity)
-        fen += " -"      
-        # Add halfmove clock (not implemented, so we just add "0")
-        fen += " 0"   
-        # Add fullmove number (not implemented, so we just add "1")
-        fen += " 1"
-        return fen   
-    
-    # Function to map the numpy array to the chess.Board() object (FOW NOW FOR EVAL TO WORK PROPERLY, I WILL FIX GET_FEN() LATER)
-    # def to_chess_board(self):
-    #     # Create the empty board object
-    #     board = chess.Board(fen="8/8/8/8/8/8/8/8 w - - 0 1")
-        
-    #     # Map the numpy array to the chessboard's squares
-    #     for row in range(8):
-    #         for col in range(8):
-    #             piece = self.board[row][col]
-    #             if piece != "--":
-    #                 # Determine the piece and place it on the board
-    #                 chess_piece = piece[1].upper() if piece[0] == "w" else piece[1].lower()
-    #                 square = chess.square(col, 7 - row)  # Flip rows to match board orientation
-    #                 board.set_piece_at(square, chess.Piece.from_symbol(chess_piece)) 
-    #     return board
-    
+        return Fen.encode(self.board, self.whiteToMove, self.castlingRights,
+                          self.enpassantSq if self.enpassant_capturable() else None,
+                          self.halfmoveClock, self.fullmoveNumber)
+
+    # Stockfish comes from the shared EnginePool (set STOCKFISH_PATH to point it at the binary), repeats from the EvalCache
     def get_evaluation(self):
         try:
-            stockfish = Stockfish(r"/opt/homebrew/bin/stockfish", parameters={"Threads": 2, "Hash": 1024}) 
             fen = self.get_fen()
-            stockfish.set_fen_position(fen)
-            evaluation = stockfish.get_evaluation()
-            # Convert evaluation to centipawns if not mate
-            if evaluation["type"] == "cp":
-                eval_value = round(evaluation["value"] * 0.01, 1)
-                mate_moves = None
-            elif evaluation["type"] == "mate":
-                eval_value = 10      
-                mate_moves = abs(evaluation["value"])   
-        except StockfishException:
+            evaluation = EnginePool.get_pool().get_evaluation(fen)
+            eval_value, mate_moves = convert_evaluation(evaluation)
+        except EnginePool.EngineError:
             eval_value = 0
             mate_moves = None
             print("Stockfish failed to evaluate the position, evaluation set to 0")
         return eval_value, mate_moves
 
+# Convert a Stockfish evaluation ({"type": "cp"/"mate", "value": n}) to (pawns, mate in n moves or None)
+def convert_evaluation(evaluation):
+    # Convert evaluation to centipawns if not mate
+    if evaluation["type"] == "cp":
+        eval_value = round(evaluation["value"] * 0.01, 1)
+        mate_moves = None
+    elif evaluation["type"] == "mate":
+        eval_value = 10      
+        mate_moves = abs(evaluation["value"])   
+    return eval_value, mate_moves
+
 class Move():
     # Maps keys to values
     # key : value
 
     ranksToRows = {"1": 7, "2": 6, "3": 5, "4": 4,
                    "5": 3, "6": 2, "7": 1, "8": 0}
-    rowsToRanks = {v: k for k, v in ranksToRows.items()} # Reverse the dictionary
     filesToCols = {"a": 0, "b": 1, "c": 2, "d": 3,
                    "e": 4, "f": 5, "g": 6, "h": 7}
-    colsToFiles = {v: k for k, v in filesToCols.items()}
 
-    def __init__(self, startSq, endSq, board):
-        
-        self.startRow, self.startCol = startSq
-        self.endRow, self.endCol = endSq
-        self.pieceMoved = board[self.startRow][self.startCol] # The piece you want to move
-        self.pieceCaptured = board[self.endRow][self.endCol]  # The piece you want to capture
+    # Fixed attributes instead of a __dict__, moves are created by the million during a search
+    __slots__ = ("startSq", "endSq", "pieceMoved", "pieceCaptured", "isPawnPromotion", "promotionPiece",
+                 "isEnpassantMove", "isCastleMove", "moveID")
+
+    # startSq and endSq are indexes into the flat GameState.board (row * 8 + col)
+    def __init__(self, startSq, endSq, board, isEnpassantMove=False, isCastleMove=False, promotionPiece=None):
+        self.startSq = startSq
+        self.endSq = endSq
+        self.pieceMoved = pieceMoved = board[startSq]  # The piece you want to move (piece code)
+        self.pieceCaptured = board[endSq]              # The piece you want to capture (EMPTY if none)
+        # Pawn promotion (a pawn reaching the last row becomes a queen unless another piece is given)
+        self.isPawnPromotion = (pieceMoved == PAWN and endSq < DIMENSION) or \
+                               (pieceMoved == -PAWN and endSq >= DIMENSION * (DIMENSION - 1))
+        if self.isPawnPromotion:
+            if promotionPiece is None:
+                promotionPiece = QUEEN if pieceMoved > 0 else -QUEEN
+            self.promotionPiece = promotionPiece
+            # Packed 16-bit move: start square (bits 0-5), end square (bits 6-11), promotion piece type (bits 12-14)
+            self.moveID = startSq | (endSq << 6) | (abs(promotionPiece) << 12)
+        else:
+            self.promotionPiece = EMPTY
+            self.moveID = startSq | (endSq << 6)
+        # En passant (the captured pawn is not on the end square)
+        self.isEnpassantMove = isEnpassantMove
+        if isEnpassantMove:
+            self.pieceCaptured = -pieceMoved
+        # Castling (the king moves 2 squares, the rook is moved by GameState.make_move)
+        self.isCastleMove = isCastleMove
 
-    # Overriding the equals method
+    # Overriding the equals method (the special move flags follow from the squares, so they are not compared)
     def __eq__(self, other):
-        return isinstance(other, Move) and self.startRow == other.startRow and self.startCol == other.startCol and self.endRow == other.endRow and self.endCol == other.endCol
+        return isinstance(other, Move) and self.moveID == other.moveID
+
+    # Moves can be looked up in sets and dictionaries (e.g. the clicked move among the valid moves)
+    def __hash__(self):
+        return self.moveID
+
     def get_chess_notation(self):
         # make all chess noations for captures etc.
-        return self.get_rank_file(self.startRow, self.startCol) + self.get_rank_file(self.endRow, self.endCol)
-
-    def get_rank_file(self, row, col):
-        return self.colsToFiles[col] + self.rowsToRanks[row]
\ No newline at end of file
+        notation = Fen.SQUARE_NAMES[self.startSq] + Fen.SQUARE_NAMES[self.endSq]
+        if self.promotionPiece != EMPTY: # e.g. e7e8q like UCI
+            notation += PIECE_TO_FEN[-abs(self.promotionPiece)]
+        return notation
\ No newline at end of file
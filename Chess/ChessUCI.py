@@ -0,0 +1,231 @@
+"""
+UCI front end for the built-in engine (ChessAI searching a ChessEngine.GameState), so any UCI GUI, match runner or
+tool that drives Stockfish can drive it too.
+
+    python Chess/ChessUCI.py
+    STOCKFISH_PATH="python Chess/ChessUCI.py" python Stockfish/elo_rating.py ...
+
+Supported commands: uci, isready, setoption (Hash), ucinewgame, position startpos/fen ... moves ...,
+go depth/movetime/wtime/btime/winc/binc/movestogo/nodes/infinite, stop, quit.
+The search runs on its own thread, so isready and stop are answered while it searches, and an info line is printed
+after every completed iteration. A position command that continues the current game (the same start position and
+the moves so far plus some more) only makes the new moves instead of setting the position up again.
+"""
+
+import sys
+import threading
+import ChessAI
+import ChessEngine
+from TranspositionTable import TranspositionTable, DEFAULT_SIZE_MB
+
+ENGINE_NAME = "ChessAI"
+ENGINE_AUTHOR = "frottori"
+MOVE_OVERHEAD = 0.05            # Seconds kept back per move for the GUI and the pipes
+DEFAULT_MOVES_TO_GO = 30        # Moves the remaining time is shared by when the GUI doesn't say
+MAX_HASH_MB = 1024
+
+# Searcher that also stops when the GUI sends stop (checked with the time and node budget)
+class UCISearcher(ChessAI.Searcher):
+    def __init__(self, stopEvent, **kwargs):
+        super().__init__(**kwargs)
+        self.stopEvent = stopEvent
+
+    def check_limits(self):
+        super().check_limits()
+        if self.stopEvent.is_set():
+            self.stopped = True
+
+class UCIEngine():
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.outputLock = threading.Lock()  # The search thread prints too
+        self.hashMB = DEFAULT_SIZE_MB
+        self.tt = TranspositionTable(self.hashMB)
+        self.gs = ChessEngine.GameState()
+        self.startFen = None                # FEN of the position command's start position (None is startpos)
+        self.moves = []                     # UCI moves made on gs since the start position
+        self.searchThread = None
+        self.stopEvent = threading.Event()
+
+    def send(self, line):
+        with self.outputLock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    # Read commands until quit (or the end of the input)
+    def loop(self, lines=sys.stdin):
+        for line in lines:
+            if not self.handle(line.strip()):
+                break
+        self.stop()
+
+    # Run one command, returns False on quit
+    def handle(self, line):
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send(f"option name Hash type spin default {DEFAULT_SIZE_MB} min 1 max {MAX_HASH_MB}")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.set_option(args)
+        elif command == "ucinewgame":
+            # ucinewgame, position and go stop a running search first (go infinite never ends on its own),
+            # so its bestmove is sent before anything else happens
+            self.stop()
+            self.tt.clear()
+            self.set_position(None, [])
+        elif command == "position":
+            self.stop()
+            self.position(args)
+        elif command == "go":
+            self.stop()
+            self.go(args)
+        elif command == "stop":
+            self.stop()
+        elif command == "quit":
+            return False
+        return True
+
+    """
+    Position
+    """
+    def position(self, args):
+        if not args:
+            return
+        movesAt = args.index("moves") if "moves" in args else len(args)
+        startFen = " ".join(args[1:movesAt]) if args[0] == "fen" else None
+        self.set_position(startFen, args[movesAt + 1:])
+
+    # Make the position, reusing the current one when the new one continues it
+    def set_position(self, startFen, moves):
+        if startFen != self.startFen or moves[:len(self.moves)] != self.moves:
+            # Another game (or a take back): start over unless only the last moves differ
+            common = 0
+            if startFen == self.startFen:
+                while common < min(len(moves), len(self.moves)) and moves[common] == self.moves[common]:
+                    common += 1
+            if common == 0:
+                try:
+                    gs = ChessEngine.GameState(startFen)
+                except ValueError as error: # A bad FEN keeps the previous position
+                    self.send(f"info string {error}")
+                    return
+                self.gs = gs
+                self.startFen = startFen
+                self.moves = []
+            else:
+                for _ in range(len(self.moves) - common):
+                    self.gs.undo_move()
+                del self.moves[common:]
+        for uci in moves[len(self.moves):]:
+            move = find_move(self.gs, uci)
+            if move is None:
+                self.send(f"info string illegal move {uci}")
+                break
+            self.gs.make_move(move)
+            self.moves.append(uci)
+
+    """
+    Search
+    """
+    def go(self, args):
+        try:
+            limits = parse_go(args)
+        except ValueError as error: # e.g. "go depth x", nothing is searched
+            self.send(f"info string {error}")
+            return
+        timeLimit = self.time_limit(limits)
+        self.stopEvent.clear()
+        searcher = UCISearcher(self.stopEvent, maxDepth=limits.get("depth", ChessAI.MAX_DEPTH), timeLimit=timeLimit,
+                               nodeLimit=limits.get("nodes"), onIteration=self.send_info, tt=self.tt)
+        infinite = "infinite" in limits
+        self.searchThread = threading.Thread(target=self.search, args=(searcher, infinite), daemon=True)
+        self.searchThread.start()
+
+    def search(self, searcher, infinite):
+        result = searcher.search(self.gs)
+        if infinite: # The best move may only be sent after stop
+            self.stopEvent.wait()
+        bestMove = result.bestMove.get_chess_notation() if result.bestMove is not None else "0000"
+        self.send(f"bestmove {bestMove}")
+
+    # Seconds for this move: movetime, or a share of the clock, or None (until depth, nodes or stop)
+    def time_limit(self, limits):
+        if "movetime" in limits:
+            return max(0.01, limits["movetime"] / 1000 - MOVE_OVERHEAD)
+        clock, increment = ("wtime", "winc") if self.gs.whiteToMove else ("btime", "binc")
+        if clock not in limits:
+            return None
+        remaining = limits[clock] / 1000
+        share = remaining / limits.get("movestogo", DEFAULT_MOVES_TO_GO) + 0.75 * limits.get(increment, 0) / 1000
+        return max(0.01, min(share, remaining / 2) - MOVE_OVERHEAD)
+
+    def send_info(self, result):
+        pv = " ".join(move.get_chess_notation() for move in result.pv)
+        self.send(f"info depth {result.depth} score {uci_score(result.score)} nodes {result.nodes} "
+                  f"nps {result.nps} time {int(result.seconds * 1000)} pv {pv}")
+
+    def stop(self):
+        self.stopEvent.set()
+        self.wait()
+
+    # Wait for the running search (if any) to send its bestmove
+    def wait(self):
+        if self.searchThread is not None:
+            self.searchThread.join()
+            self.searchThread = None
+
+    def set_option(self, args):
+        # setoption name <name> value <value>
+        if "name" not in args:
+            return
+        valueAt = args.index("value") if "value" in args else len(args)
+        name = " ".join(args[args.index("name") + 1:valueAt]).lower()
+        value = " ".join(args[valueAt + 1:])
+        if name == "hash" and value.isdigit():
+            self.stop()
+            self.hashMB = max(1, min(MAX_HASH_MB, int(value)))
+            self.tt = TranspositionTable(self.hashMB)
+
+# Numbers of a go command, e.g. {"wtime": 60000, "btime": 60000, "movestogo": 40} ("infinite" maps to True).
+# Raises ValueError for a value that isn't an integer
+def parse_go(args):
+    limits = {}
+    i = 0
+    while i < len(args):
+        if args[i] in ("depth", "movetime", "wtime", "btime", "winc", "binc", "movestogo", "nodes") \
+                and i + 1 < len(args):
+            try:
+                limits[args[i]] = int(args[i + 1])
+            except ValueError:
+                raise ValueError(f"Invalid go {args[i]} '{args[i + 1]}'")
+            i += 2
+        else:
+            if args[i] == "infinite":
+                limits["infinite"] = True
+            i += 1
+    return limits
+
+# "cp <centipawns>" or "mate <moves>" (negative when the side to move gets mated)
+def uci_score(score):
+    if score >= ChessAI.MATE_THRESHOLD:
+        return f"mate {(ChessAI.CHECKMATE - score + 1) // 2}"
+    if score <= -ChessAI.MATE_THRESHOLD:
+        return f"mate {-((ChessAI.CHECKMATE + score) // 2)}"
+    return f"cp {score}"
+
+# The valid move with this UCI notation, None if there is none
+def find_move(gs, uci):
+    for move in gs.get_valid_moves():
+        if move.get_chess_notation() == uci:
+            return move
+    return None
+
+if __name__ == "__main__":
+    UCIEngine().loop()
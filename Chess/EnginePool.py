@@ -0,0 +1,393 @@
+"""
+Long-lived Stockfish processes shared by everything that asks for an evaluation (the evaluation bar in Chess.py,
+GameState.get_evaluation and the scripts in Stockfish/). Starting Stockfish and allocating its hash table is paid once,
+the engines are handed out to callers and restarted if they crash.
+Any program that speaks UCI works, so the tests run a fake engine script (tests/fake_uci.py) instead of Stockfish.
+Evaluations go through the shared EvalCache, so a position is only searched again to go deeper.
+
+The engine is found with (first match wins): the path given to EnginePool/get_pool, the STOCKFISH_PATH environment
+variable, stockfish on the PATH, the Homebrew location /opt/homebrew/bin/stockfish.
+"""
+
+import atexit
+import os
+import queue
+import shlex
+import shutil
+import subprocess
+import threading
+from contextlib import contextmanager
+import EvalCache
+
+HOMEBREW_PATH = "/opt/homebrew/bin/stockfish"
+DEFAULT_PARAMETERS = {"Threads": 2, "Hash": 1024}
+DEFAULT_DEPTH = 15 # Same default depth as the stockfish python library
+PERFORMANCE_OPTIONS = {"Threads", "Hash", "Minimum Thinking Time", "Ponder", "Move Overhead", "Slow Mover"} # Don't change the evaluation
+
+class EngineError(Exception):
+    pass
+
+# Command that starts the engine: a path or a command line string, or a list (e.g. [sys.executable, "fake_uci.py"])
+def engine_command(path=None):
+    if path is None:
+        path = os.environ.get("STOCKFISH_PATH") or shutil.which("stockfish") or HOMEBREW_PATH
+    if isinstance(path, (list, tuple)):
+        return list(path)
+    if os.path.exists(path):
+        return [path]
+    return shlex.split(path)
+
+# Parse a UCI "info" line into a dict (depth, seldepth, nodes, nps, time, multipv, score, pv, ...)
+def parse_info(line):
+    tokens = line.split()
+    info = {}
+    i = 1
+    while i < len(tokens):
+        token = tokens[i]
+        if token == "string": # Free text until the end of the line
+            info["string"] = " ".join(tokens[i + 1:])
+            break
+        if token == "pv":
+            info["pv"] = tokens[i + 1:]
+            break
+        if token == "score" and i + 2 < len(tokens):
+            info["score"] = {"type": tokens[i + 1], "value": int(tokens[i + 2])}
+            i += 3
+            if i < len(tokens) and tokens[i] in ("lowerbound", "upperbound"):
+                info["score"]["bound"] = tokens[i]
+                i += 1
+            continue
+        if token in ("depth", "seldepth", "multipv", "nodes", "nps", "time", "hashfull", "tbhits", "currmovenumber") \
+                and i + 1 < len(tokens):
+            info[token] = int(tokens[i + 1])
+            i += 2
+            continue
+        i += 1
+    return info
+
+class UCIEngine():
+    def __init__(self, command, parameters=None):
+        self.command = command
+        self.parameters = dict(parameters or {})
+        self.name = "unknown"       # From "id name", e.g. "Stockfish 17"
+        self.process = None
+        self.start()
+
+    """
+    Functions to run the process and talk UCI
+    """
+    def start(self):
+        try:
+            self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                            stderr=subprocess.DEVNULL, text=True, bufsize=1)
+        except OSError as e:
+            raise EngineError(f"Could not start the engine {self.command}: {e}")
+        self.send("uci")
+        while True:
+            line = self.read_line()
+            if line.startswith("id name "):
+                self.name = line[len("id name "):].strip()
+            elif line == "uciok":
+                break
+        for name, value in self.parameters.items():
+            self.set_option(name, value)
+        self.is_ready()
+
+    def send(self, command):
+        try:
+            self.process.stdin.write(command + "\n")
+            self.process.stdin.flush()
+        except (OSError, ValueError) as e:
+            raise EngineError(f"The engine stopped responding: {e}")
+
+    def read_line(self):
+        line = self.process.stdout.readline()
+        if line == "": # EOF, the process is gone
+            raise EngineError(f"The engine {self.command} exited")
+        return line.strip()
+
+    def is_ready(self):
+        self.send("isready")
+        while self.read_line() != "readyok":
+            pass
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def set_option(self, name, value):
+        if isinstance(value, bool):
+            value = "true" if value else "false"
+        self.send(f"setoption name {name} value {value}")
+        self.parameters[name] = value
+
+    def new_game(self):
+        self.send("ucinewgame")
+        self.is_ready()
+
+    def restart(self):
+        self.quit()
+        self.start()
+
+    def quit(self):
+        if self.process is None:
+            return
+        try:
+            self.send("quit")
+            self.process.wait(timeout=2)
+        except (EngineError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+    """
+    Functions to search a position
+    """
+    # Search the position and return (bestmove, last info dict). onInfo is called with every parsed "info" line,
+    # stopEvent (a threading.Event) interrupts the search with "stop" when it is set
+    def go(self, fen, moves=None, depth=None, movetime=None, nodes=None, onInfo=None, stopEvent=None):
+        position = f"position fen {fen}"
+        if moves:
+            position += " moves " + " ".join(moves)
+        self.send(position)
+        command = "go"
+        if depth is not None:
+            command += f" depth {depth}"
+        if movetime is not None:
+            command += f" movetime {int(movetime)}"
+        if nodes is not None:
+            command += f" nodes {nodes}"
+        if command == "go":
+            command += f" depth {DEFAULT_DEPTH}"
+        self.send(command)
+
+        lastInfo = {}
+        stopSent = False
+        while True:
+            line = self.read_line()
+            if line.startswith("info"):
+                info = parse_info(line)
+                if "score" in info and "bound" not in info["score"]:
+                    lastInfo = info
+                    if onInfo is not None:
+                        onInfo(info)
+            elif line.startswith("bestmove"):
+                tokens = line.split()
+                bestMove = tokens[1] if len(tokens) > 1 and tokens[1] != "(none)" else None
+                return bestMove, lastInfo
+            if stopEvent is not None and stopEvent.is_set() and not stopSent:
+                self.send("stop")
+                stopSent = True
+
+    # Evaluation in the format of the stockfish python library: {"type": "cp" or "mate", "value": n},
+    # from white's point of view (UCI scores are from the side to move)
+    def get_evaluation(self, fen, depth=DEFAULT_DEPTH):
+        _, info = self.go(fen, depth=depth)
+        return white_score(info.get("score", {"type": "cp", "value": 0}), fen)
+
+    def get_best_move(self, fen, moves=None, depth=None, movetime=None):
+        bestMove, _ = self.go(fen, moves=moves, depth=depth, movetime=movetime)
+        return bestMove
+
+# UCI scores are from the side to move, turn them to white's point of view
+def white_score(score, fen):
+    whiteToMove = len(fen.split()) < 2 or fen.split()[1] == "w"
+    return {"type": score["type"], "value": score["value"] if whiteToMove else -score["value"]}
+
+class EnginePool():
+    # cache is an EvalCache, None for the shared one or False to always search
+    def __init__(self, path=None, size=1, parameters=None, depth=DEFAULT_DEPTH, cache=None):
+        self.command = engine_command(path)
+        self.size = size                                    # Most engines running at the same time
+        self.parameters = dict(DEFAULT_PARAMETERS if parameters is None else parameters)
+        self.depth = depth                                  # Default depth of get_evaluation
+        self.cache = EvalCache.get_cache() if cache is None else (cache or None)
+        self.cacheKey = None                                # Engine part of the cache key, see engine_key
+        self.idle = queue.Queue()                           # Started engines that nobody is using
+        self.engines = []                                   # Every started engine
+        self.lock = threading.Lock()
+
+    """
+    Functions to hand out engines
+    """
+    # Take an engine (starting one if the pool isn't full yet, otherwise waiting for one to be released)
+    def acquire(self):
+        try:
+            engine = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                startNew = len(self.engines) < self.size
+                if startNew:
+                    engine = UCIEngine(self.command, self.parameters)
+                    self.engines.append(engine)
+            if not startNew:
+                engine = self.idle.get()
+        if not engine.is_alive(): # Crashed while idle
+            engine.restart()
+        return engine
+
+    def release(self, engine):
+        self.idle.put(engine)
+
+    # with pool.engine() as engine: ...
+    @contextmanager
+    def engine(self):
+        engine = self.acquire()
+        try:
+            yield engine
+        except Exception:
+            engine.restart() # The engine may be dead or halfway through a search, hand back a fresh one
+            raise
+        finally:
+            self.release(engine)
+
+    # Evaluation of a FEN ({"type": "cp"/"mate", "value": n} from white's point of view), retried once after a crash.
+    # Answered from the cache if the position was already searched at least this deep
+    def get_evaluation(self, fen, depth=None):
+        depth = depth or self.depth
+        if self.cache is not None:
+            cached = self.cache.get(fen, self.engine_key(), depth)
+            if cached is not None:
+                return cached[1]
+        try:
+            with self.engine() as engine:
+                evaluation = engine.get_evaluation(fen, depth)
+        except EngineError:
+            with self.engine() as engine:
+                evaluation = engine.get_evaluation(fen, depth)
+        if self.cache is not None:
+            self.cache.put(fen, self.engine_key(), depth, evaluation)
+        return evaluation
+
+    # Name of the engine (e.g. "Stockfish 17"), starts one if needed
+    def engine_name(self):
+        with self.engine() as engine:
+            return engine.name
+
+    # Engine name plus the options that change its evaluation (e.g. "Stockfish 17;Skill Level=5"),
+    # so results of differently configured engines are cached apart
+    def engine_key(self):
+        if self.cacheKey is None:
+            options = sorted(f"{name}={value}" for name, value in self.parameters.items() if name not in PERFORMANCE_OPTIONS)
+            self.cacheKey = ";".join([self.engine_name()] + options)
+        return self.cacheKey
+
+    def close(self):
+        with self.lock:
+            for engine in self.engines:
+                engine.quit()
+            self.engines = []
+            self.idle = queue.Queue()
+
+# Pools shared within the process, one per engine command and settings
+pools = {}
+poolsLock = threading.Lock()
+
+def get_pool(path=None, size=1, parameters=None, depth=DEFAULT_DEPTH):
+    command = engine_command(path)
+    settings = dict(DEFAULT_PARAMETERS if parameters is None else parameters)
+    key = (tuple(command), tuple(sorted(settings.items())), depth)
+    with poolsLock:
+        if key not in pools:
+            pools[key] = EnginePool(command, size, settings, depth)
+        elif pools[key].size < size:
+            pools[key].size = size
+        return pools[key]
+
+@atexit.register
+def close_all():
+    for pool in pools.values():
+        pool.close()
+
+class AnalysisThread(threading.Thread):
+    # Analyses the latest position on a worker thread so the caller (the pygame loop) never waits for the engine.
+    # Every "info" line updates the result, so the evaluation improves as the depth grows, and asking for
+    # a new position stops the search of the old one
+    def __init__(self, pool=None, depth=None):
+        super().__init__(daemon=True)
+        self.pool = pool if pool is not None else get_pool()
+        self.depth = depth or self.pool.depth
+        self.cache = self.pool.cache
+        self.condition = threading.Condition()
+        self.pendingFen = None          # Position waiting to be analysed
+        self.currentFen = None          # Position being analysed
+        self.stopEvent = None           # Set to stop the current search
+        self.engine = None              # Engine running the current search
+        self.result = None              # (fen, evaluation, depth) of the newest info line for currentFen
+        self.version = 0                # Increases with every new result, so the caller knows when to redraw
+        self.running = True
+
+    # Analyse this position from now on (the search of any older position is stopped)
+    def analyse(self, fen):
+        with self.condition:
+            self.pendingFen = fen
+            self.currentFen = fen
+            self.result = None
+            self.version += 1
+            self.stop_search()
+            self.condition.notify()
+
+    # Newest (fen, evaluation, depth) for the position last passed to analyse, None until the first info line
+    def get_result(self):
+        with self.condition:
+            return self.result
+
+    def stop_search(self):
+        if self.stopEvent is not None:
+            self.stopEvent.set()
+            if self.engine is not None:
+                try:
+                    self.engine.send("stop") # Don't wait for the next info line to notice the stop event
+                except EngineError:
+                    pass
+
+    def close(self):
+        with self.condition:
+            self.running = False
+            self.stop_search()
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and self.pendingFen is None:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                fen = self.pendingFen
+                self.pendingFen = None
+                stopEvent = self.stopEvent = threading.Event()
+            try:
+                # Show any cached result right away, and only search if it isn't deep enough
+                if self.cache is not None:
+                    cached = self.cache.get(fen, self.pool.engine_key(), 1)
+                    if cached is not None:
+                        with self.condition:
+                            if fen == self.currentFen:
+                                self.result = (fen, cached[1], cached[0])
+                                self.version += 1
+                        if cached[0] >= self.depth:
+                            continue
+                with self.pool.engine() as engine:
+                    with self.condition:
+                        self.engine = engine
+                        if stopEvent.is_set(): # A newer position came in while waiting for the engine
+                            continue
+                    try:
+                        _, info = engine.go(fen, depth=self.depth, stopEvent=stopEvent,
+                                            onInfo=lambda info: self.on_info(fen, stopEvent, info))
+                    finally:
+                        with self.condition:
+                            self.engine = None
+                # A stopped search may have been cut off in the middle of its last depth, only complete ones are cached
+                if self.cache is not None and not stopEvent.is_set() and "score" in info:
+                    self.cache.put(fen, self.pool.engine_key(), info.get("depth", 0), white_score(info["score"], fen))
+            except EngineError:
+                pass # The pool restarts the engine, the next position gets a fresh one
+
+    def on_info(self, fen, stopEvent, info):
+        with self.condition:
+            if not stopEvent.is_set() and fen == self.currentFen:
+                if self.result is not None and self.result[2] > info.get("depth", 0):
+                    return # Keep the deeper result from the cache
+                self.result = (fen, white_score(info["score"], fen), info.get("depth", 0))
+                self.version += 1
@@ -0,0 +1,136 @@
+"""
+Cache of Stockfish evaluations shared by everything that evaluates positions (GameState.get_evaluation, the evaluation
+bar and the scripts in Stockfish/). Results are keyed by the normalized FEN, the engine (name and settings that change
+its evaluation) and the search depth. A result from a deeper search also answers any shallower request.
+An in-memory LRU sits in front of an SQLite file, which is shared between processes and runs and is capped in size
+(the least recently used positions are evicted first).
+
+The file is CHESS_EVAL_CACHE if that environment variable is set, otherwise ~/.cache/chess/evaluations.sqlite
+"""
+
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "chess", "evaluations.sqlite")
+DEFAULT_MEMORY_ENTRIES = 100000     # Positions kept in memory
+DEFAULT_MAX_ENTRIES = 5000000       # Positions kept on disk (about 120 bytes each)
+EVICT_EVERY = 1000                  # Writes between two checks of the disk size cap
+TOUCH_EVERY = 1000                  # Memory hits whose use times are written to disk together
+
+# Only placement, turn, castling and en passant decide the evaluation, the move clocks are dropped
+def normalize_fen(fen):
+    return " ".join(fen.split()[:4])
+
+class EvalCache():
+    def __init__(self, path=None, memoryEntries=DEFAULT_MEMORY_ENTRIES, maxEntries=DEFAULT_MAX_ENTRIES):
+        self.path = path or os.environ.get("CHESS_EVAL_CACHE") or DEFAULT_PATH
+        self.memoryEntries = memoryEntries
+        self.maxEntries = maxEntries
+        self.memory = OrderedDict()     # (fen, engine) -> (depth, evaluation), most recently used last
+        self.touched = {}               # (fen, engine) -> time of memory hits not yet written to the used column
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.hits = 0
+        self.misses = 0
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Autocommit, WAL lets several processes (e.g. the batch evaluation workers) read and write at once
+        self.db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS evaluations (
+                               fen TEXT NOT NULL, engine TEXT NOT NULL, depth INTEGER NOT NULL,
+                               type TEXT NOT NULL, value INTEGER NOT NULL, used REAL NOT NULL,
+                               PRIMARY KEY (fen, engine))""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS evaluations_used ON evaluations (used)")
+
+    # Cached (depth, evaluation) of the position searched at least to depth, or None
+    def get(self, fen, engine, depth):
+        key = (normalize_fen(fen), engine)
+        with self.lock:
+            cached = self.memory.get(key)
+            if cached is not None and cached[0] >= depth:
+                self.memory.move_to_end(key)
+                # The disk LRU has to see memory hits too, or the most used positions would look the oldest
+                self.touched[key] = time.time()
+                if len(self.touched) >= TOUCH_EVERY:
+                    self.write_touched()
+            else:
+                # Not in memory, or too shallow there: another process (or a put after an eviction) may have
+                # written a deeper result to disk
+                stored = self.read(key)
+                if stored is not None and (cached is None or stored[0] > cached[0]):
+                    cached = stored
+                    self.db.execute("UPDATE evaluations SET used = ? WHERE fen = ? AND engine = ?", (time.time(),) + key)
+                    self.remember(key, cached)
+            if cached is None or cached[0] < depth:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return cached
+
+    # Store the evaluation of a search to depth (a deeper result that is already cached is kept)
+    def put(self, fen, engine, depth, evaluation):
+        key = (normalize_fen(fen), engine)
+        with self.lock:
+            cached = self.memory.get(key)
+            if cached is not None and cached[0] > depth:
+                return
+            self.touched.pop(key, None) # Written with a newer use time below
+            self.write_touched()
+            self.db.execute("""INSERT INTO evaluations (fen, engine, depth, type, value, used) VALUES (?, ?, ?, ?, ?, ?)
+                               ON CONFLICT (fen, engine) DO UPDATE SET depth = excluded.depth, type = excluded.type,
+                               value = excluded.value, used = excluded.used WHERE excluded.depth >= evaluations.depth""",
+                            key + (depth, evaluation["type"], evaluation["value"], time.time()))
+            # The disk keeps the deeper of the two results (the memory may have lost a deeper one to eviction)
+            stored = self.read(key)
+            self.remember(key, stored if stored is not None and stored[0] > depth else (depth, evaluation))
+            self.writes += 1
+            if self.writes % EVICT_EVERY == 0:
+                self.evict()
+
+    # (depth, evaluation) stored on disk, or None
+    def read(self, key):
+        row = self.db.execute("SELECT depth, type, value FROM evaluations WHERE fen = ? AND engine = ?", key).fetchone()
+        return (row[0], {"type": row[1], "value": row[2]}) if row is not None else None
+
+    def remember(self, key, cached):
+        self.memory[key] = cached
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.memoryEntries:
+            self.memory.popitem(last=False)
+
+    # Write the use times of the memory hits to the used column (in one statement)
+    def write_touched(self):
+        if self.touched:
+            self.db.executemany("UPDATE evaluations SET used = ? WHERE fen = ? AND engine = ?",
+                                [(used,) + key for key, used in self.touched.items()])
+            self.touched = {}
+
+    # Remove the least recently used positions above the disk cap
+    def evict(self):
+        count = self.db.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0]
+        if count > self.maxEntries:
+            self.db.execute("""DELETE FROM evaluations WHERE rowid IN
+                               (SELECT rowid FROM evaluations ORDER BY used LIMIT ?)""", (count - self.maxEntries,))
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.write_touched()
+                self.db.close()
+                self.db = None
+
+# Cache shared within the process
+sharedCache = None
+
+def get_cache():
+    global sharedCache
+    if sharedCache is None:
+        sharedCache = EvalCache()
+        atexit.register(sharedCache.close) # Writes the use times of the last memory hits
+    return sharedCache
@@ -0,0 +1,319 @@
+"""
+Static evaluation of positions without Stockfish: material, piece-square tables (tapered between middle game and
+end game), mobility and king safety. Scores are centipawns from white's point of view unless noted otherwise.
+Two ways in:
+    evaluate_state  scores one GameState from the material and piece-square totals and piece lists that
+                    GameState.make_move/undo_move keep up to date (with move_delta)
+    evaluate_batch  scores a stacked (N, 8, 8) array of boards with vectorized NumPy operations (bulk PGN scans,
+                    ordering moves at the search root)
+Both give exactly the same score for the same board.
+
+Boards use the piece codes of Geometry, like ChessEngine (white positive, black negative, row 0 is the 8th rank).
+The module doesn't import ChessEngine so that ChessEngine can import it.
+"""
+
+import numpy as np
+import Fen
+from Geometry import (DIMENSION, EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, castle_rook_squares,
+                      enpassant_captured_sq, KNIGHT_OFFSETS, KING_OFFSETS, ROOK_DIRECTIONS, BISHOP_DIRECTIONS,
+                      KNIGHT_TARGETS, KING_TARGETS, ROOK_RAYS, BISHOP_RAYS, targets)
+
+PIECE_VALUES = [0, 100, 320, 330, 500, 900, 0]      # By piece type
+PHASE_WEIGHTS = [0, 0, 1, 1, 2, 4, 0]               # Game phase: 24 with all pieces on the board, 0 with only pawns
+MAX_PHASE = 24
+MOBILITY_WEIGHTS = [0, 0, 4, 5, 2, 1, 0]            # Per square a knight, bishop, rook or queen can go to
+SHIELD_BONUS = 10                                   # Per own pawn in front of the king (middle game)
+ZONE_ATTACK_PENALTY = 8                             # Per square next to the king the opponent attacks (middle game)
+
+# Piece-square tables for white (row 0 is the 8th rank), black uses them mirrored
+PAWN_TABLE = [
+     0,   0,   0,   0,   0,   0,   0,   0,
+    50,  50,  50,  50,  50,  50,  50,  50,
+    10,  10,  20,  30,  30,  20,  10,  10,
+     5,   5,  10,  25,  25,  10,   5,   5,
+     0,   0,   0,  20,  20,   0,   0,   0,
+     5,  -5, -10,   0,   0, -10,  -5,   5,
+     5,  10,  10, -20, -20,  10,  10,   5,
+     0,   0,   0,   0,   0,   0,   0,   0]
+KNIGHT_TABLE = [
+   -50, -40, -30, -30, -30, -30, -40, -50,
+   -40, -20,   0,   0,   0,   0, -20, -40,
+   -30,   0,  10,  15,  15,  10,   0, -30,
+   -30,   5,  15,  20,  20,  15,   5, -30,
+   -30,   0,  15,  20,  20,  15,   0, -30,
+   -30,   5,  10,  15,  15,  10,   5, -30,
+   -40, -20,   0,   5,   5,   0, -20, -40,
+   -50, -40, -30, -30, -30, -30, -40, -50]
+BISHOP_TABLE = [
+   -20, -10, -10, -10, -10, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,  10,  10,   5,   0, -10,
+   -10,   5,   5,  10,  10,   5,   5, -10,
+   -10,   0,  10,  10,  10,  10,   0, -10,
+   -10,  10,  10,  10,  10,  10,  10, -10,
+   -10,   5,   0,   0,   0,   0,   5, -10,
+   -20, -10, -10, -10, -10, -10, -10, -20]
+ROOK_TABLE = [
+     0,   0,   0,   0,   0,   0,   0,   0,
+     5,  10,  10,  10,  10,  10,  10,   5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+     0,   0,   0,   5,   5,   0,   0,   0]
+QUEEN_TABLE = [
+   -20, -10, -10,  -5,  -5, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,   5,   5,   5,   0, -10,
+    -5,   0,   5,   5,   5,   5,   0,  -5,
+     0,   0,   5,   5,   5,   5,   0,  -5,
+   -10,   5,   5,   5,   5,   5,   0, -10,
+   -10,   0,   5,   0,   0,   0,   0, -10,
+   -20, -10, -10,  -5,  -5, -10, -10, -20]
+KING_MIDDLE_TABLE = [
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -20, -30, -30, -40, -40, -30, -30, -20,
+   -10, -20, -20, -20, -20, -20, -20, -10,
+    20,  20,   0,   0,   0,   0,  20,  20,
+    20,  30,  10,   0,   0,  10,  30,  20]
+KING_END_TABLE = [
+   -50, -40, -30, -20, -20, -30, -40, -50,
+   -30, -20, -10,   0,   0, -10, -20, -30,
+   -30, -10,  20,  30,  30,  20, -10, -30,
+   -30, -10,  30,  40,  40,  30, -10, -30,
+   -30, -10,  30,  40,  40,  30, -10, -30,
+   -30, -10,  20,  30,  30,  20, -10, -30,
+   -30, -30,   0,   0,   0,   0, -30, -30,
+   -50, -30, -30, -30, -30, -30, -30, -50]
+MIDDLE_TABLES = [None, PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_MIDDLE_TABLE]
+END_TABLES = [None, PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_END_TABLE]
+
+def _square_values(tables):
+    # values[code + 6][sq]: material plus piece-square value of the piece on the square, negative for black
+    values = [[0] * (DIMENSION * DIMENSION) for _ in range(13)]
+    for kind in range(PAWN, KING + 1):
+        for sq in range(DIMENSION * DIMENSION):
+            values[kind + 6][sq] = PIECE_VALUES[kind] + tables[kind][sq]
+            values[-kind + 6][sq] = -(PIECE_VALUES[kind] + tables[kind][sq ^ 56]) # sq ^ 56 mirrors the row
+    return values
+
+MIDDLE_VALUES = _square_values(MIDDLE_TABLES)   # MIDDLE_VALUES[code + 6][sq]
+END_VALUES = _square_values(END_TABLES)         # END_VALUES[code + 6][sq]
+PHASES = [PHASE_WEIGHTS[abs(code)] for code in range(-6, 7)] # PHASES[code + 6]
+
+# Attack tables shared with ChessEngine
+SLIDER_DIRECTIONS = {BISHOP: BISHOP_DIRECTIONS, ROOK: ROOK_DIRECTIONS, QUEEN: ROOK_DIRECTIONS + BISHOP_DIRECTIONS}
+SLIDER_RAYS = {BISHOP: BISHOP_RAYS, ROOK: ROOK_RAYS,
+               QUEEN: [rookRays + bishopRays for rookRays, bishopRays in zip(ROOK_RAYS, BISHOP_RAYS)]}
+# Squares in front of the king (the 3 files around it, 1 and 2 rows ahead) where own pawns shield it
+WHITE_SHIELD = targets([(-1, -1), (-1, 0), (-1, 1), (-2, -1), (-2, 0), (-2, 1)])
+BLACK_SHIELD = targets([(1, -1), (1, 0), (1, 1), (2, -1), (2, 0), (2, 1)])
+
+"""
+Scoring one board
+"""
+# Material and piece-square totals of a board: (middle game, end game, phase)
+def board_totals(board):
+    middle = end = phase = 0
+    for sq, piece in enumerate(board):
+        if piece != EMPTY:
+            middle += MIDDLE_VALUES[piece + 6][sq]
+            end += END_VALUES[piece + 6][sq]
+            phase += PHASES[piece + 6]
+    return middle, end, phase
+
+# Blend the middle game and end game scores by how much material is left
+def tapered(middle, end, phase):
+    phase = min(phase, MAX_PHASE)
+    return (middle * phase + end * (MAX_PHASE - phase)) // MAX_PHASE
+
+# Change of (middle, end, phase) totals made by a move (a ChessEngine.Move, read before or after it is made)
+def move_delta(move):
+    moved = move.pieceMoved + 6
+    placed = (move.promotionPiece if move.promotionPiece != EMPTY else move.pieceMoved) + 6
+    start, end = move.startSq, move.endSq
+    middle = MIDDLE_VALUES[placed][end] - MIDDLE_VALUES[moved][start]
+    endGame = END_VALUES[placed][end] - END_VALUES[moved][start]
+    phase = PHASES[placed] - PHASES[moved]
+    if move.pieceCaptured != EMPTY:
+        captured = move.pieceCaptured + 6
+        capturedSq = enpassant_captured_sq(start, end) if move.isEnpassantMove else end
+        middle -= MIDDLE_VALUES[captured][capturedSq]
+        endGame -= END_VALUES[captured][capturedSq]
+        phase -= PHASES[captured]
+    if move.isCastleMove: # The rook moves to the other side of the king
+        rook = (ROOK if move.pieceMoved > 0 else -ROOK) + 6
+        rookStart, rookEnd = castle_rook_squares(end)
+        middle += MIDDLE_VALUES[rook][rookEnd] - MIDDLE_VALUES[rook][rookStart]
+        endGame += END_VALUES[rook][rookEnd] - END_VALUES[rook][rookStart]
+    return middle, endGame, phase
+
+# Mobility and king safety of a board: (white - black mobility, white - black king safety before the phase scaling).
+# squares are the squares of the knights, bishops, rooks, queens and kings (every square of the board by default)
+def positional_terms(board, squares=None):
+    mobility = [0, 0]           # White, black
+    targets = [set(), set()]    # Squares each side's knights, bishops, rooks and queens can go to
+    kings = [None, None]
+    for sq in range(DIMENSION * DIMENSION) if squares is None else squares:
+        piece = board[sq]
+        if piece == EMPTY or piece == PAWN or piece == -PAWN:
+            continue
+        side = 0 if piece > 0 else 1
+        kind = piece if piece > 0 else -piece
+        if kind == KING:
+            kings[side] = sq
+            continue
+        reach = []
+        if kind == KNIGHT:
+            for target in KNIGHT_TARGETS[sq]:
+                other = board[target]
+                if other == EMPTY or (other > 0) != (piece > 0):
+                    reach.append(target)
+        else:
+            for ray in SLIDER_RAYS[kind][sq]:
+                for target in ray:
+                    other = board[target]
+                    if other == EMPTY:
+                        reach.append(target)
+                        continue
+                    if (other > 0) != (piece > 0):
+                        reach.append(target)
+                    break
+        mobility[side] += MOBILITY_WEIGHTS[kind] * len(reach)
+        targets[side].update(reach)
+
+    safety = [0, 0]
+    for side, pawn, shield in ((0, PAWN, WHITE_SHIELD), (1, -PAWN, BLACK_SHIELD)):
+        kingSq = kings[side]
+        if kingSq is None:
+            continue
+        shieldPawns = sum(1 for sq in shield[kingSq] if board[sq] == pawn)
+        zoneAttacks = sum(1 for sq in KING_TARGETS[kingSq] + (kingSq,) if sq in targets[1 - side])
+        safety[side] = SHIELD_BONUS * shieldPawns - ZONE_ATTACK_PENALTY * zoneAttacks
+    return mobility[0] - mobility[1], safety[0] - safety[1]
+
+# Score of a board from the totals of board_totals (or kept up to date with move_delta)
+def score(board, middle, end, phase, squares=None):
+    mobility, safety = positional_terms(board, squares)
+    return tapered(middle, end, phase) + mobility + safety * min(phase, MAX_PHASE) // MAX_PHASE
+
+# Score of a board computed from scratch
+def evaluate_board(board):
+    return score(board, *board_totals(board))
+
+PIECE_CODES = [code for kind in (KNIGHT, BISHOP, ROOK, QUEEN, KING) for code in (kind, -kind)]
+
+# Score of a GameState from the point of view of the side to move (as the search wants it), using its running
+# totals and piece lists instead of scanning the board
+def evaluate_state(gs):
+    pieceSquares = gs.pieceSquares
+    squares = [sq for code in PIECE_CODES for sq in pieceSquares[code + 6]]
+    value = score(gs.board, gs.middleScore, gs.endScore, gs.phase, squares)
+    return value if gs.whiteToMove else -value
+
+"""
+Scoring many boards at once: boards is an (N, 8, 8) integer array of piece codes
+"""
+MIDDLE_ARRAY = np.array(MIDDLE_VALUES, dtype=np.int32)  # [code + 6, sq]
+END_ARRAY = np.array(END_VALUES, dtype=np.int32)
+PHASE_ARRAY = np.array(PHASES, dtype=np.int32)
+SQUARES = np.arange(DIMENSION * DIMENSION)
+
+# Move every set square of the (N, 8, 8) masks dr rows and dc columns, squares pushed off the board are dropped
+def shift(masks, dr, dc):
+    shifted = np.zeros_like(masks)
+    rows = slice(max(dr, 0), DIMENSION + min(dr, 0)), slice(max(-dr, 0), DIMENSION + min(-dr, 0))
+    cols = slice(max(dc, 0), DIMENSION + min(dc, 0)), slice(max(-dc, 0), DIMENSION + min(-dc, 0))
+    shifted[:, rows[0], cols[0]] = masks[:, rows[1], cols[1]]
+    return shifted
+
+def count(masks):
+    return masks.sum(axis=(1, 2), dtype=np.int32)
+
+# Mobility (weighted) and the union of the target squares of one side's knights, bishops, rooks and queens
+def batch_mobility(boards, sign, own, empty):
+    mobility = np.zeros(len(boards), dtype=np.int32)
+    targets = np.zeros_like(own)
+    free = ~own
+    knights = boards == sign * KNIGHT
+    for dr, dc in KNIGHT_OFFSETS:
+        reach = shift(knights, dr, dc) & free
+        mobility += MOBILITY_WEIGHTS[KNIGHT] * count(reach)
+        targets |= reach
+    # Rays of one piece type in one direction never overlap (the ray behind stops at the piece in front),
+    # so counting the squares of all rays together counts every piece's squares
+    for kind, directions in SLIDER_DIRECTIONS.items():
+        sliders = boards == sign * kind
+        if not sliders.any():
+            continue
+        for dr, dc in directions:
+            alive = sliders
+            for _ in range(DIMENSION - 1):
+                reached = shift(alive, dr, dc)
+                if not reached.any():
+                    break
+                reach = reached & free
+                mobility += MOBILITY_WEIGHTS[kind] * count(reach)
+                targets |= reach
+                alive = reached & empty # Only empty squares let the ray go on
+    return mobility, targets
+
+# King shield and attacked king zone of one side (before the phase scaling)
+def batch_king_safety(boards, sign, enemyTargets):
+    king = boards == sign * KING
+    pawns = boards == sign * PAWN
+    forward = -sign # White pawns shield from the rows above the king (lower row numbers)
+    shield = np.zeros(len(boards), dtype=np.int32)
+    for rows in (1, 2):
+        for dc in (-1, 0, 1):
+            shield += count(shift(king, forward * rows, dc) & pawns)
+    zone = king.copy()
+    for dr, dc in KING_OFFSETS:
+        zone |= shift(king, dr, dc)
+    return SHIELD_BONUS * shield - ZONE_ATTACK_PENALTY * count(zone & enemyTargets)
+
+# Scores of the boards from white's point of view (whiteToMove, a bool array, turns them to the side to move)
+def evaluate_batch(boards, whiteToMove=None):
+    boards = np.asarray(boards, dtype=np.int8).reshape(-1, DIMENSION, DIMENSION)
+    flat = boards.reshape(len(boards), -1).astype(np.intp) + 6
+    middle = MIDDLE_ARRAY[flat, SQUARES].sum(axis=1)
+    end = END_ARRAY[flat, SQUARES].sum(axis=1)
+    phase = np.minimum(PHASE_ARRAY[flat].sum(axis=1), MAX_PHASE)
+    values = (middle * phase + end * (MAX_PHASE - phase)) // MAX_PHASE
+
+    empty = boards == EMPTY
+    white, black = boards > 0, boards < 0
+    whiteMobility, whiteTargets = batch_mobility(boards, 1, white, empty)
+    blackMobility, blackTargets = batch_mobility(boards, -1, black, empty)
+    safety = batch_king_safety(boards, 1, blackTargets) - batch_king_safety(boards, -1, whiteTargets)
+    values += whiteMobility - blackMobility + safety * phase // MAX_PHASE
+    if whiteToMove is not None:
+        values = np.where(whiteToMove, values, -values)
+    return values
+
+# (8, 8) array of a FEN's piece placement
+def fen_to_array(fen):
+    return np.frombuffer(Fen.decode_placement(fen.split()[0]), dtype=np.int8).reshape(DIMENSION, DIMENSION)
+
+# Scores of many FENs from white's point of view
+def evaluate_fens(fens):
+    if not fens:
+        return np.zeros(0, dtype=np.int32)
+    return evaluate_batch(Fen.decode_many(fens)[0])
+
+# Score every move of a GameState with one batched evaluation of the positions after them,
+# from the point of view of the side making the moves
+def score_moves(gs, moves):
+    if not moves:
+        return []
+    boards = np.empty((len(moves), DIMENSION * DIMENSION), dtype=np.int8)
+    for i, move in enumerate(moves):
+        gs.make_move(move)
+        boards[i] = gs.board
+        gs.undo_move()
+    values = evaluate_batch(boards)
+    return (values if gs.whiteToMove else -values).tolist()
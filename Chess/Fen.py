@@ -0,0 +1,173 @@
+"""
+FEN codec for the flat boards of ChessEngine (64 signed piece codes, white positive, row 0 is the 8th rank).
+All six fields are read and written: placement, side to move, castling rights, en passant square, halfmove clock and
+fullmove number. GameState.load_fen/get_fen use encode/decode. decode_many and encode_many are convenience wrappers
+for the analysis tools: they loop over decode/encode one FEN at a time and gather the fields into NumPy arrays
+(ready for Evaluation.evaluate_batch) or back into FENs.
+
+Placements are built and parsed a rank at a time through caches (8 board bytes <-> FEN rank text). Real games only
+have a few thousand distinct ranks, so after warming up a conversion is 8 dictionary lookups and a join. A cache is
+emptied when it reaches MAX_CACHED_RANKS, so decoding arbitrary input can't grow it without bound.
+The module doesn't import ChessEngine so that ChessEngine and Evaluation can import it, the piece codes and castling
+flags come from Geometry.
+"""
+
+import numpy as np
+from Geometry import (DIMENSION, EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, WHITE_KINGSIDE, WHITE_QUEENSIDE,
+                      BLACK_KINGSIDE, BLACK_QUEENSIDE)
+
+FEN_TO_CODE = {"P": PAWN, "N": KNIGHT, "B": BISHOP, "R": ROOK, "Q": QUEEN, "K": KING}
+FEN_TO_CODE.update({char.lower(): -code for char, code in FEN_TO_CODE.items()})
+CODE_TO_FEN = {code: char for char, code in FEN_TO_CODE.items()}
+CASTLING_FLAGS = [("K", WHITE_KINGSIDE), ("Q", WHITE_QUEENSIDE), ("k", BLACK_KINGSIDE), ("q", BLACK_QUEENSIDE)]
+CASTLING_TO_FEN = ["".join(char for char, flag in CASTLING_FLAGS if rights & flag) or "-" for rights in range(16)]
+FEN_TO_CASTLING = {char: flag for char, flag in CASTLING_FLAGS}
+SQUARE_NAMES = ["abcdefgh"[sq % DIMENSION] + str(DIMENSION - sq // DIMENSION) for sq in range(DIMENSION * DIMENSION)]
+SQUARE_INDEX = {name: sq for sq, name in enumerate(SQUARE_NAMES)}
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+MAX_CACHED_RANKS = 1 << 16
+
+rankTexts = {}      # 8 board bytes -> FEN rank ("rnbqkbnr", "4P3", ...)
+rankBytes = {}      # FEN rank -> 8 board bytes
+
+"""
+Placement
+"""
+def encode_rank(data):
+    text = rankTexts.get(data)
+    if text is None:
+        text = ""
+        empty = 0
+        for byte in data:
+            code = byte - 256 if byte > 127 else byte # Bytes are unsigned, the codes signed
+            if code == EMPTY:
+                empty += 1
+            else:
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                text += CODE_TO_FEN[code]
+        if empty:
+            text += str(empty)
+        if len(rankTexts) >= MAX_CACHED_RANKS:
+            rankTexts.clear()
+        rankTexts[data] = text
+    return text
+
+def decode_rank(text):
+    data = rankBytes.get(text)
+    if data is None:
+        codes = []
+        for char in text:
+            if char.isdigit():
+                codes.extend([EMPTY] * int(char))
+            elif char in FEN_TO_CODE:
+                codes.append(FEN_TO_CODE[char])
+            else:
+                raise ValueError(f"Invalid FEN piece '{char}' in rank '{text}'")
+        if len(codes) != DIMENSION:
+            raise ValueError(f"Invalid FEN rank '{text}'")
+        data = bytes(code & 0xFF for code in codes)
+        if len(rankBytes) >= MAX_CACHED_RANKS:
+            rankBytes.clear()
+        rankBytes[text] = data
+    return data
+
+# Placement field of a board (an array('b'), a NumPy int8 array or bytes of the 64 codes)
+def encode_placement(board):
+    data = board if isinstance(board, bytes) else board.tobytes()
+    return "/".join([encode_rank(data[start:start + DIMENSION]) for start in range(0, DIMENSION * DIMENSION, DIMENSION)])
+
+# The 64 codes of a placement field as bytes (array('b', data) or np.frombuffer(data, np.int8) turn them to codes)
+def decode_placement(placement):
+    ranks = placement.split("/")
+    if len(ranks) != DIMENSION:
+        raise ValueError(f"Invalid FEN board '{placement}'")
+    return b"".join([decode_rank(rank) for rank in ranks])
+
+"""
+Whole FENs
+"""
+def encode(board, whiteToMove=True, castlingRights=0, enpassantSq=None, halfmoveClock=0, fullmoveNumber=1):
+    return (f"{encode_placement(board)} {'w' if whiteToMove else 'b'} {CASTLING_TO_FEN[castlingRights]} "
+            f"{SQUARE_NAMES[enpassantSq] if enpassantSq is not None else '-'} {halfmoveClock} {fullmoveNumber}")
+
+# (board bytes, white to move, castling rights, en passant square or None, halfmove clock, fullmove number).
+# Missing fields take their start position value, so placements and 4-field EPD positions work too
+def decode(fen):
+    fields = fen.split()
+    if not fields:
+        raise ValueError("Empty FEN")
+    data = decode_placement(fields[0])
+    if len(fields) > 1 and fields[1] not in ("w", "b"):
+        raise ValueError(f"Invalid side to move '{fields[1]}' in '{fen}'")
+    whiteToMove = len(fields) < 2 or fields[1] == "w"
+    castlingRights = 0
+    if len(fields) > 2 and fields[2] != "-":
+        for char in fields[2]:
+            if char not in FEN_TO_CASTLING:
+                raise ValueError(f"Invalid castling rights '{fields[2]}' in '{fen}'")
+            castlingRights |= FEN_TO_CASTLING[char]
+    enpassantSq = None
+    if len(fields) > 3 and fields[3] != "-":
+        # Behind the pawn that just moved two squares: rank 6 with a black pawn on rank 5 when white is to move,
+        # rank 3 with a white pawn on rank 4 when black is
+        if whiteToMove:
+            rank, pawnOffset, pawn = "6", DIMENSION, FEN_TO_CODE["p"]
+        else:
+            rank, pawnOffset, pawn = "3", -DIMENSION, FEN_TO_CODE["P"]
+        if fields[3] not in SQUARE_INDEX or fields[3][1] != rank or \
+                data[SQUARE_INDEX[fields[3]] + pawnOffset] != pawn & 0xFF:
+            raise ValueError(f"Invalid en passant square '{fields[3]}' in '{fen}'")
+        enpassantSq = SQUARE_INDEX[fields[3]]
+    try:
+        halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+        fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+    except ValueError:
+        raise ValueError(f"Invalid move counters in '{fen}'")
+    if halfmoveClock < 0 or fullmoveNumber < 0:
+        raise ValueError(f"Invalid move counters in '{fen}'")
+    # Some tools write fullmove number 0
+    return data, whiteToMove, castlingRights, enpassantSq, halfmoveClock, max(1, fullmoveNumber)
+
+"""
+Lists of FENs
+"""
+# Decode a list of FENs (one decode call each) into arrays: boards (N, 64) int8, whiteToMove (N,) bool, castling rights (N,) uint8,
+# en passant squares (N,) int8 (-1 for none), halfmove clocks and fullmove numbers (N,) int32
+def decode_many(fens):
+    count = len(fens)
+    data = []
+    whiteToMove = np.ones(count, dtype=bool)
+    castling = np.zeros(count, dtype=np.uint8)
+    enpassant = np.full(count, -1, dtype=np.int8)
+    halfmove = np.zeros(count, dtype=np.int32)
+    fullmove = np.ones(count, dtype=np.int32)
+    for i, fen in enumerate(fens):
+        board, white, rights, enpassantSq, halfmoveClock, fullmoveNumber = decode(fen)
+        data.append(board)
+        if not white:
+            whiteToMove[i] = False
+        if rights:
+            castling[i] = rights
+        if enpassantSq is not None:
+            enpassant[i] = enpassantSq
+        halfmove[i] = halfmoveClock
+        fullmove[i] = fullmoveNumber
+    boards = np.frombuffer(b"".join(data), dtype=np.int8).reshape(count, DIMENSION * DIMENSION)
+    return boards, whiteToMove, castling, enpassant, halfmove, fullmove
+
+# FENs of stacked boards ((N, 64) or (N, 8, 8)), the other fields default to the start position values
+def encode_many(boards, whiteToMove=None, castling=None, enpassant=None, halfmove=None, fullmove=None):
+    boards = np.ascontiguousarray(boards, dtype=np.int8).reshape(-1, DIMENSION * DIMENSION)
+    count = len(boards)
+    data = boards.tobytes()
+    whiteToMove = [True] * count if whiteToMove is None else np.asarray(whiteToMove).tolist()
+    castling = [0] * count if castling is None else np.asarray(castling).tolist()
+    enpassant = [-1] * count if enpassant is None else np.asarray(enpassant).tolist()
+    halfmove = [0] * count if halfmove is None else np.asarray(halfmove).tolist()
+    fullmove = [1] * count if fullmove is None else np.asarray(fullmove).tolist()
+    size = DIMENSION * DIMENSION
+    return [encode(data[i * size:(i + 1) * size], whiteToMove[i], castling[i],
+                   enpassant[i] if enpassant[i] >= 0 else None, halfmove[i], fullmove[i]) for i in range(count)]
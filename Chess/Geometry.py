@@ -0,0 +1,72 @@
+"""
+Board encoding and attack geometry of the flat 64-square board, shared by ChessEngine (move generation), Evaluation
+(mobility and king safety), Fen, MoveOrdering (static exchange evaluation) and Bitboard. Square index of (row, col)
+is row * 8 + col, row 0 is the 8th rank. The tables are precomputed, so nothing that uses them has to check the
+board edges. The module imports nothing from the engine, so every other module can import it.
+"""
+
+DIMENSION = 8 # Dimensions of a chess board are 8x8
+
+# Piece codes stored in GameState.board (one signed byte per square)
+# White pieces are positive, black pieces are negative, the absolute value is the piece type
+EMPTY = 0
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = 1, 2, 3, 4, 5, 6
+
+# Castling rights are a bitmask of these flags
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+CASTLE_KING_SQUARES = {1: 60, -1: 4} # e1 and e8
+# make_move ands the rights with the mask of the start and end square, so moving the king or a rook
+# (or capturing a rook in its corner) removes the matching rights
+CASTLE_RIGHTS_MASK = [15] * (DIMENSION * DIMENSION)
+CASTLE_RIGHTS_MASK[60] = 15 & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)   # e1
+CASTLE_RIGHTS_MASK[63] = 15 & ~WHITE_KINGSIDE                       # h1
+CASTLE_RIGHTS_MASK[56] = 15 & ~WHITE_QUEENSIDE                      # a1
+CASTLE_RIGHTS_MASK[4] = 15 & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)    # e8
+CASTLE_RIGHTS_MASK[7] = 15 & ~BLACK_KINGSIDE                        # h8
+CASTLE_RIGHTS_MASK[0] = 15 & ~BLACK_QUEENSIDE                       # a8
+
+# Rook start and end square of the castling move whose king lands on kingEndSq
+def castle_rook_squares(kingEndSq):
+    if kingEndSq % DIMENSION == 6: # Kingside
+        return kingEndSq + 1, kingEndSq - 1
+    return kingEndSq - 2, kingEndSq + 1 # Queenside
+
+# Square of the pawn taken en passant: on the start row of the capturing pawn, in the column of its end square
+def enpassant_captured_sq(startSq, endSq):
+    return startSq - startSq % DIMENSION + endSq % DIMENSION
+
+ROW_COL = [divmod(sq, DIMENSION) for sq in range(DIMENSION * DIMENSION)]
+
+# For every square the squares reachable with a single jump of the given (row, col) offsets
+def targets(offsets):
+    table = []
+    for row, col in ROW_COL:
+        table.append(tuple((row + dr) * DIMENSION + col + dc for dr, dc in offsets
+                           if 0 <= row + dr < DIMENSION and 0 <= col + dc < DIMENSION))
+    return table
+
+# For every square one tuple of squares per direction, ordered from the nearest to the edge
+def rays(directions):
+    table = []
+    for row, col in ROW_COL:
+        squareRays = []
+        for dr, dc in directions:
+            ray = []
+            r, c = row + dr, col + dc
+            while 0 <= r < DIMENSION and 0 <= c < DIMENSION:
+                ray.append(r * DIMENSION + c)
+                r, c = r + dr, c + dc
+            squareRays.append(tuple(ray))
+        table.append(tuple(squareRays))
+    return table
+
+KNIGHT_OFFSETS = [(-2, -1), (-2, 1), (2, -1), (2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2)]
+KING_OFFSETS = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+ROOK_DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+BISHOP_DIRECTIONS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+KNIGHT_TARGETS = targets(KNIGHT_OFFSETS)
+KING_TARGETS = targets(KING_OFFSETS)
+ROOK_RAYS = rays(ROOK_DIRECTIONS)
+BISHOP_RAYS = rays(BISHOP_DIRECTIONS)
+WHITE_PAWN_ATTACKS = targets([(-1, -1), (-1, 1)]) # Squares a white pawn on the square attacks
+BLACK_PAWN_ATTACKS = targets([(1, -1), (1, 1)])   # Squares a black pawn on the square attacks
@@ -0,0 +1,170 @@
+"""
+Move ordering for the search. Alpha-beta prunes the most when the best move is searched first, so the moves of a
+node are searched in this order:
+    1. the move the transposition table remembers for the position
+    2. captures and promotions, most valuable victim first and least valuable attacker first among those (MVV-LVA)
+    3. the killer moves of the ply (quiet moves that caused a beta cutoff in a sibling node)
+    4. the other quiet moves by their history score (how often and how deep they caused cutoffs anywhere)
+Moves are picked lazily: only the best remaining move is looked for each time, so a node that is cut off after its
+first move or two never pays for sorting the whole list.
+see() is the static exchange evaluation of a capture, used by the quiescence search to skip losing captures.
+"""
+
+from Geometry import (DIMENSION, EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, enpassant_captured_sq,
+                      KNIGHT_TARGETS, KING_TARGETS, ROOK_RAYS, BISHOP_RAYS, WHITE_PAWN_ATTACKS, BLACK_PAWN_ATTACKS)
+from Evaluation import PIECE_VALUES
+
+MAX_PLY = 128
+KILLERS_PER_PLY = 2
+HISTORY_MAX = 1 << 14                   # History scores are halved when one gets this big
+
+TT_MOVE_SCORE = 1 << 30
+CAPTURE_SCORE = 1 << 24                 # Plus the MVV-LVA score
+KILLER_SCORE = 1 << 20                  # Minus the killer's slot, the newest killer goes first
+SEE_VALUES = PIECE_VALUES[:KING] + [20000]   # The king is worth more than anything it could win
+# MVV_LVA[victim][attacker] by piece type: the victim decides, a cheaper attacker breaks the tie
+MVV_LVA = [[PIECE_VALUES[victim] * 8 - attacker if victim != EMPTY else 0 for attacker in range(KING + 1)]
+           for victim in range(KING + 1)]
+
+class MoveOrderer():
+    def __init__(self, maxPly=MAX_PLY):
+        self.maxPly = maxPly
+        self.clear()
+
+    def clear(self):
+        self.killers = [[None] * KILLERS_PER_PLY for _ in range(self.maxPly + 1)] # moveIDs per ply
+        self.history = [0] * (13 * 64) # history[(piece code + 6) * 64 + end square]
+
+    # Call once per search: killers belong to the old positions, history is kept but counts less
+    def new_search(self):
+        self.killers = [[None] * KILLERS_PER_PLY for _ in range(self.maxPly + 1)]
+        self.history = [score >> 1 for score in self.history]
+
+    """
+    Scoring
+    """
+    def score_moves(self, moves, ply, ttMoveID=None):
+        killers = self.killers[ply] if ply <= self.maxPly else ()
+        history = self.history
+        scores = []
+        for move in moves:
+            if move.moveID == ttMoveID:
+                scores.append(TT_MOVE_SCORE)
+            elif move.pieceCaptured != EMPTY or move.promotionPiece != EMPTY:
+                score = CAPTURE_SCORE + MVV_LVA[abs(move.pieceCaptured)][abs(move.pieceMoved)]
+                if move.promotionPiece != EMPTY:
+                    score += PIECE_VALUES[abs(move.promotionPiece)]
+                scores.append(score)
+            elif move.moveID in killers:
+                scores.append(KILLER_SCORE - killers.index(move.moveID))
+            else:
+                scores.append(history[(move.pieceMoved + 6) * 64 + move.endSq])
+        return scores
+
+    # Yield the moves best score first, finding the best of the rest only when the next move is asked for
+    def pick(self, moves, ply, ttMoveID=None):
+        scores = self.score_moves(moves, ply, ttMoveID)
+        moves = list(moves)
+        count = len(moves)
+        for i in range(count):
+            best = i
+            bestScore = scores[i]
+            for j in range(i + 1, count):
+                if scores[j] > bestScore:
+                    best, bestScore = j, scores[j]
+            if best != i:
+                moves[i], moves[best] = moves[best], moves[i]
+                scores[i], scores[best] = scores[best], scores[i]
+            yield moves[i]
+
+    """
+    Learning from cutoffs
+    """
+    # A quiet move caused a beta cutoff: make it a killer of the ply and raise its history, the quiet moves searched
+    # before it (which didn't cut off) lose some history
+    def cutoff(self, move, ply, depth, quietsTried=()):
+        if ply <= self.maxPly:
+            killers = self.killers[ply]
+            if killers[0] != move.moveID:
+                killers.insert(0, move.moveID)
+                killers.pop()
+        bonus = depth * depth
+        history = self.history
+        history[(move.pieceMoved + 6) * 64 + move.endSq] += bonus
+        for quiet in quietsTried:
+            history[(quiet.pieceMoved + 6) * 64 + quiet.endSq] -= bonus
+        if history[(move.pieceMoved + 6) * 64 + move.endSq] >= HISTORY_MAX:
+            self.history = [score >> 1 for score in history]
+
+# Quiet moves don't change the material (no capture, no promotion)
+def is_quiet(move):
+    return move.pieceCaptured == EMPTY and move.promotionPiece == EMPTY
+
+"""
+Static exchange evaluation: what the side making a capture wins (in centipawns) if both sides keep recapturing on the
+square with their least valuable piece, and either side may stop when recapturing would lose more.
+Pieces behind an attacker (x-rays) join in as the squares in front of them empty. Pins are not taken into account.
+"""
+def see(board, move):
+    board = list(board)
+    sq = move.endSq
+    placed = move.promotionPiece if move.promotionPiece != EMPTY else move.pieceMoved
+    gains = [SEE_VALUES[abs(move.pieceCaptured)]]
+    if move.promotionPiece != EMPTY:
+        gains[0] += SEE_VALUES[abs(placed)] - SEE_VALUES[PAWN]
+    board[move.startSq] = EMPTY
+    if move.isEnpassantMove:
+        board[enpassant_captured_sq(move.startSq, move.endSq)] = EMPTY
+    board[sq] = placed
+    onSquare = SEE_VALUES[abs(placed)] # Value of the piece the next capture takes
+    side = -1 if placed > 0 else 1
+    while True:
+        attacker = least_valuable_attacker(board, sq, side)
+        if attacker is None:
+            break
+        attackSq, kind = attacker
+        if kind == KING and least_valuable_attacker_after(board, attackSq, sq, -side) is not None:
+            break # The king can't capture onto a defended square
+        gains.append(onSquare - gains[-1])
+        onSquare = SEE_VALUES[kind]
+        board[attackSq] = EMPTY
+        board[sq] = side * kind
+        side = -side
+    # Going back from the last capture, each side only captures if it gains by it
+    for i in range(len(gains) - 1, 0, -1):
+        gains[i - 1] = -max(-gains[i - 1], gains[i])
+    return gains[0]
+
+# (square, piece type) of the least valuable piece of side (1 white, -1 black) attacking sq, None if there is none
+def least_valuable_attacker(board, sq, side):
+    pawnAttacks = BLACK_PAWN_ATTACKS if side == 1 else WHITE_PAWN_ATTACKS # Where a side's pawn attacking sq stands
+    for attackSq in pawnAttacks[sq]:
+        if board[attackSq] == side * PAWN:
+            return attackSq, PAWN
+    for attackSq in KNIGHT_TARGETS[sq]:
+        if board[attackSq] == side * KNIGHT:
+            return attackSq, KNIGHT
+    # Nearest piece on every line from the square
+    sliders = {}
+    for rays, slider in ((BISHOP_RAYS[sq], BISHOP), (ROOK_RAYS[sq], ROOK)):
+        for ray in rays:
+            for attackSq in ray:
+                piece = board[attackSq]
+                if piece != EMPTY:
+                    if piece == side * slider or piece == side * QUEEN:
+                        sliders.setdefault(piece * side, attackSq)
+                    break
+    for kind in (BISHOP, ROOK, QUEEN):
+        if kind in sliders:
+            return sliders[kind], kind
+    for attackSq in KING_TARGETS[sq]:
+        if board[attackSq] == side * KING:
+            return attackSq, KING
+    return None
+
+# Least valuable attacker of sq after the piece on fromSq moved there
+def least_valuable_attacker_after(board, fromSq, sq, side):
+    board = list(board)
+    board[sq] = board[fromSq]
+    board[fromSq] = EMPTY
+    return least_valuable_attacker(board, sq, side)
@@ -0,0 +1,240 @@
+"""
+Opening book built from PGN files (PGNs/ and the archives from Chess.com_API/sync_archives.py).
+The book is a Polyglot .bin file, so other programs can read it too: 16-byte big-endian entries (position hash,
+move, weight, learn) sorted by hash, and looked up with a binary search on a memory map.
+    weight: number of games that played the move from the position
+    learn:  bits 16-31 score of the move for the side that played it in per mille (NO_SCORE if no game finished),
+            bits 0-15 evaluation in centipawns after the move for the side that played it (NO_EVAL if not evaluated)
+The position hash is the Polyglot Zobrist key, which is also GameState.zobristKey.
+
+    python Chess/OpeningBook.py build PGNs/*.pgn --max-ply 20 --evaluate --depth 12
+    python Chess/OpeningBook.py probe --fen "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+"""
+
+import argparse
+import mmap
+import os
+import random
+import struct
+import chess
+import chess.polyglot
+import EnginePool
+import PGNIndex
+
+DEFAULT_PATH = os.environ.get("CHESS_BOOK") or \
+               os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "PGNs", "book.bin")
+ENTRY = struct.Struct(">QHHI")      # key, move, weight, learn
+KEY = struct.Struct(">Q")
+DEFAULT_MAX_PLY = 20
+NO_SCORE = 0xFFFF
+NO_EVAL = -0x8000
+MAX_EVAL = 30000                    # Mates are stored as +-MAX_EVAL
+PROMOTIONS = " nbrq"                # Polyglot promotion codes 1-4
+
+class BookEntry():
+    __slots__ = ("move", "weight", "score", "evaluation")
+
+    def __init__(self, move, weight, score, evaluation):
+        self.move = move                # Polyglot move in UCI (castling is king takes rook, e.g. e1h1)
+        self.weight = weight            # Games that played it
+        self.score = score              # 0..1 for the side that played it, None if unknown
+        self.evaluation = evaluation    # Centipawns after the move for the side that played it, None if unknown
+
+    def __repr__(self):
+        return f"BookEntry({self.move}, weight={self.weight}, score={self.score}, evaluation={self.evaluation})"
+
+    # UCI of the move as GameState/python-chess write it (castling as the king's move)
+    def uci(self, kingMove=False):
+        if kingMove and self.move in CASTLING_MOVES:
+            return CASTLING_MOVES[self.move]
+        return self.move
+
+# Polyglot castling (king takes rook) -> king move, only valid when the king is the piece moving
+CASTLING_MOVES = {"e1h1": "e1g1", "e1a1": "e1c1", "e8h8": "e8g8", "e8a8": "e8c8"}
+
+"""
+Polyglot move encoding: to file bits 0-2, to rank 3-5, from file 6-8, from rank 9-11, promotion 12-14
+"""
+def encode_move(board, move):
+    toSquare = move.to_square
+    if board.is_kingside_castling(move):
+        toSquare = chess.square(7, chess.square_rank(move.from_square))
+    elif board.is_queenside_castling(move):
+        toSquare = chess.square(0, chess.square_rank(move.from_square))
+    promotion = PROMOTIONS.index(chess.piece_symbol(move.promotion)) if move.promotion else 0
+    return toSquare | move.from_square << 6 | promotion << 12
+
+def decode_move(code):
+    uci = chess.square_name((code >> 6) & 63) + chess.square_name(code & 63)
+    promotion = (code >> 12) & 7
+    return uci + PROMOTIONS[promotion] if promotion else uci
+
+def pack_learn(score, evaluation):
+    scoreBits = NO_SCORE if score is None else round(score * 1000)
+    evaluation = NO_EVAL if evaluation is None else max(-MAX_EVAL, min(MAX_EVAL, evaluation))
+    return scoreBits << 16 | (evaluation & 0xFFFF)
+
+def unpack_learn(learn):
+    scoreBits, evaluation = learn >> 16, learn & 0xFFFF
+    evaluation = evaluation - 0x10000 if evaluation >= 0x8000 else evaluation
+    return (None if scoreBits == NO_SCORE else scoreBits / 1000), (None if evaluation == NO_EVAL else evaluation)
+
+class OpeningBook():
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.size = size // ENTRY.size
+
+    def __len__(self):
+        return self.size
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Index of the first entry with a key >= key (binary search, O(log n))
+    def lower_bound(self, key):
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(self.map, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    # Every book move of the position with this Polyglot key, most played first
+    def entries(self, key):
+        found = []
+        index = self.lower_bound(key)
+        while index < self.size:
+            entryKey, move, weight, learn = ENTRY.unpack_from(self.map, index * ENTRY.size)
+            if entryKey != key:
+                break
+            score, evaluation = unpack_learn(learn)
+            found.append(BookEntry(decode_move(move), weight, score, evaluation))
+            index += 1
+        return found
+
+    # Book entry of the move (a python-chess move) in the position (a python-chess board), None if it isn't a book move
+    def find(self, board, move):
+        polyglotMove = decode_move(encode_move(board, move))
+        for entry in self.entries(chess.polyglot.zobrist_hash(board)):
+            if entry.move == polyglotMove:
+                return entry
+        return None
+
+    # Pick a book move at random, proportional to how often it was played (None if the position isn't in the book)
+    def choose(self, key, rng=random):
+        entries = [entry for entry in self.entries(key) if entry.weight > 0]
+        if not entries:
+            return None
+        return rng.choices(entries, weights=[entry.weight for entry in entries])[0]
+
+    # Book entries of the leading moves of a chess.pgn.Game, up to the first move that isn't in the book
+    def leading_moves(self, game):
+        board = game.board()
+        found = []
+        for move in game.mainline_moves():
+            entry = self.find(board, move)
+            if entry is None:
+                break
+            found.append(entry)
+            board.push(move)
+        return found
+
+# The book at path, or None if it hasn't been built
+def load_book(path=DEFAULT_PATH):
+    try:
+        return OpeningBook(path)
+    except OSError:
+        return None
+
+"""
+Building a book
+"""
+# Centipawns for the side that played the move from a white's point of view evaluation ({"type", "value"})
+def mover_centipawns(evaluation, whiteMoved):
+    if evaluation["type"] == "mate":
+        value = MAX_EVAL if evaluation["value"] > 0 else -MAX_EVAL
+    else:
+        value = max(-MAX_EVAL, min(MAX_EVAL, evaluation["value"]))
+    return value if whiteMoved else -value
+
+# Count the first maxPly moves of every game and write the book, returns the number of entries.
+# With a pool (an EnginePool) the position after every book move is evaluated (through the evaluation cache)
+def build_book(paths, output=DEFAULT_PATH, maxPly=DEFAULT_MAX_PLY, minGames=1, pool=None, **criteria):
+    moves = {} # (key, move) -> [games, scored games, points for the side that played it, fen after the move]
+    for _, _, game in PGNIndex.stream_games(paths, **criteria):
+        result = game.headers.get("Result", "*")
+        whitePoints = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}.get(result)
+        board = game.board()
+        for ply, move in enumerate(game.mainline_moves()):
+            if ply >= maxPly:
+                break
+            key = (chess.polyglot.zobrist_hash(board), encode_move(board, move))
+            whiteMoved = board.turn == chess.WHITE
+            board.push(move)
+            stats = moves.setdefault(key, [0, 0, 0.0, board.fen()])
+            stats[0] += 1
+            if whitePoints is not None:
+                stats[1] += 1
+                stats[2] += whitePoints if whiteMoved else 1.0 - whitePoints
+
+    entries = []
+    for (key, move), (games, scored, points, fen) in moves.items():
+        if games < minGames:
+            continue
+        evaluation = None
+        if pool is not None:
+            whiteMoved = fen.split()[1] == "b" # Black to move after a white move
+            evaluation = mover_centipawns(pool.get_evaluation(fen), whiteMoved)
+        score = points / scored if scored else None
+        entries.append((key, move, min(games, 0xFFFF), pack_learn(score, evaluation)))
+    entries.sort(key=lambda entry: (entry[0], -entry[2])) # By key, most played move first
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "wb") as bookFile:
+        for entry in entries:
+            bookFile.write(ENTRY.pack(*entry))
+    return len(entries)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query a Polyglot opening book from PGN files")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build the book from PGN files")
+    build.add_argument("pgns", nargs="+", help="PGN files (any number of games each)")
+    build.add_argument("--output", default=DEFAULT_PATH, help="book file (default: CHESS_BOOK or PGNs/book.bin)")
+    build.add_argument("--max-ply", type=int, default=DEFAULT_MAX_PLY, help="moves per game that go in the book")
+    build.add_argument("--min-games", type=int, default=1, help="leave out moves played in fewer games")
+    build.add_argument("--evaluate", action="store_true", help="store a Stockfish evaluation of every book move")
+    build.add_argument("--depth", type=int, default=12, help="search depth of --evaluate")
+    PGNIndex.add_filter_arguments(build)
+    probe = commands.add_parser("probe", help="print the book moves of a position")
+    probe.add_argument("--fen", default=chess.STARTING_FEN, help="position (default: start position)")
+    probe.add_argument("--book", default=DEFAULT_PATH, help="book file")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        pool = None
+        if args.evaluate:
+            pool = EnginePool.get_pool(depth=args.depth)
+        count = build_book(args.pgns, args.output, args.max_ply, args.min_games, pool,
+                           **PGNIndex.filters_from_arguments(args))
+        print(f"Wrote {count} entries to {args.output}")
+    else:
+        with OpeningBook(args.book) as book:
+            for entry in book.entries(chess.polyglot.zobrist_hash(chess.Board(args.fen))):
+                print(entry)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Index of the games in a (multi-game) PGN file. The file is scanned once through a memory map to find where every
+game starts and ends and what its main headers (players, date, result, ECO) are, so games can be filtered by header
+and fetched on their own without parsing the rest of the file. The index is saved next to the file (<file>.idx);
+when the file only grew (e.g. new games were appended) just the new part is scanned.
+
+    index = PGNIndex("PGNs/games.pgn")
+    for entry, game in index.stream(index.filter(player="MagnusCarlsen", eco="C4")):
+        ...
+"""
+
+import io
+import json
+import mmap
+import os
+import re
+import chess.pgn
+
+INDEXED_HEADERS = ["Event", "Date", "White", "Black", "Result", "ECO", "WhiteElo", "BlackElo", "TimeControl"]
+INDEX_VERSION = 1
+
+# A tag pair at the start of a line: [Name "Value"]
+TAG_PATTERN = re.compile(rb'^\[([A-Za-z0-9_]+)\s+"((?:[^"\\]|\\.)*)"\]', re.MULTILINE)
+
+class GameEntry():
+    __slots__ = ("number", "offset", "length", "headers")
+
+    def __init__(self, number, offset, length, headers):
+        self.number = number        # Position of the game in the file, from 0
+        self.offset = offset        # Byte offset of the first tag pair
+        self.length = length        # Bytes up to the next game (or the end of the file)
+        self.headers = headers      # {name: value} of the INDEXED_HEADERS the game has
+
+    def __repr__(self):
+        return f"GameEntry({self.number}, {self.headers.get('White', '?')} - {self.headers.get('Black', '?')}, " \
+               f"{self.headers.get('Date', '?')}, {self.headers.get('Result', '*')})"
+
+    # Does the game match every given criterion (None matches anything)?
+    # player is either side, eco matches by prefix ("C4" is C40-C49), dates are "YYYY.MM.DD" and inclusive
+    def matches(self, player=None, white=None, black=None, result=None, eco=None, since=None, until=None):
+        headers = self.headers
+        if player is not None and player.lower() not in (headers.get("White", "").lower(), headers.get("Black", "").lower()):
+            return False
+        if white is not None and headers.get("White", "").lower() != white.lower():
+            return False
+        if black is not None and headers.get("Black", "").lower() != black.lower():
+            return False
+        if result is not None and headers.get("Result") != result:
+            return False
+        if eco is not None and not headers.get("ECO", "").startswith(eco):
+            return False
+        if since is not None and headers.get("Date", "") < since:
+            return False
+        if until is not None and headers.get("Date", "9999") > until:
+            return False
+        return True
+
+class PGNIndex():
+    def __init__(self, path, save=True):
+        self.path = path
+        self.indexPath = path + ".idx"
+        self.games = []
+        self.scannedSize = 0        # Bytes of the file the index covers
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else None
+        if not self.load():
+            self.games = []
+            self.scannedSize = 0
+        if self.scannedSize != size:
+            self.scan()
+            if save:
+                self.save()
+
+    def __len__(self):
+        return len(self.games)
+
+    def __getitem__(self, number):
+        return self.games[number]
+
+    def __iter__(self):
+        return iter(self.games)
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    """
+    Building the index
+    """
+    # Find the games from the last indexed game on (the whole file if nothing is indexed yet)
+    def scan(self):
+        if self.map is None:
+            self.games, self.scannedSize = [], 0
+            return
+        # The last indexed game may have been cut off, scan it again
+        start = self.games.pop().offset if self.games else 0
+        data = self.map
+        gameStart = None
+        headers = {}
+        previousEnd = start
+        for match in TAG_PATTERN.finditer(data, start):
+            # A tag pair with only whitespace before it continues the header section, otherwise it starts a new game
+            if gameStart is None or data[previousEnd:match.start()].strip():
+                if gameStart is not None:
+                    self.add_game(gameStart, match.start(), headers)
+                gameStart = match.start()
+                headers = {}
+            name = match.group(1).decode("ascii")
+            if name in INDEXED_HEADERS:
+                headers[name] = match.group(2).decode("utf-8", "replace").replace('\\"', '"')
+            previousEnd = match.end()
+        if gameStart is not None:
+            self.add_game(gameStart, len(data), headers)
+        self.scannedSize = len(data)
+
+    def add_game(self, start, end, headers):
+        self.games.append(GameEntry(len(self.games), start, end - start, headers))
+
+    # Index file: the covered size and [offset, length, headers] per game
+    def save(self):
+        index = {"version": INDEX_VERSION, "size": self.scannedSize,
+                 "games": [[game.offset, game.length, game.headers] for game in self.games]}
+        try:
+            with open(self.indexPath, "w") as indexFile:
+                json.dump(index, indexFile)
+        except OSError:
+            pass # A read-only directory only costs a rescan next time
+
+    # Load a saved index if it still fits the file (same start of the last game), returns False otherwise
+    def load(self):
+        try:
+            with open(self.indexPath) as indexFile:
+                index = json.load(indexFile)
+        except (OSError, ValueError):
+            return False
+        if index.get("version") != INDEX_VERSION or self.map is None or index["size"] > len(self.map):
+            return False
+        self.games = [GameEntry(number, offset, length, headers)
+                      for number, (offset, length, headers) in enumerate(index["games"])]
+        if self.games and not TAG_PATTERN.match(self.map, self.games[-1].offset): # The file was rewritten
+            self.games = []
+            return False
+        self.scannedSize = index["size"]
+        return True
+
+    """
+    Reading games
+    """
+    # Games matching the criteria of GameEntry.matches
+    def filter(self, **criteria):
+        return [game for game in self.games if game.matches(**criteria)]
+
+    def read_text(self, entry):
+        if isinstance(entry, int):
+            entry = self.games[entry]
+        return self.map[entry.offset:entry.offset + entry.length].decode("utf-8", "replace")
+
+    # The game as a chess.pgn.Game, parsed from its own bytes only
+    def read_game(self, entry):
+        return chess.pgn.read_game(io.StringIO(self.read_text(entry)))
+
+    # Parse the games lazily, one at a time (every game of the file by default)
+    def stream(self, entries=None):
+        for entry in self.games if entries is None else entries:
+            yield entry, self.read_game(entry)
+
+# Stream (path, entry, game) for the games of several files that match the criteria
+def stream_games(paths, **criteria):
+    for path in paths:
+        with PGNIndex(path) as index:
+            for entry, game in index.stream(index.filter(**criteria)):
+                yield path, entry, game
+
+# The last game of the file (e.g. the latest game of a player, appended last), None if the file has no games or
+# doesn't exist yet
+def read_last_game(path):
+    if not os.path.exists(path):
+        return None
+    with PGNIndex(path) as index:
+        return index.read_game(index[-1]) if len(index) else None
+
+"""
+Command line filters shared by the tools that read PGN files
+"""
+def add_filter_arguments(parser):
+    parser.add_argument("--player", help="only games of this player (either colour)")
+    parser.add_argument("--white", help="only games with this player as white")
+    parser.add_argument("--black", help="only games with this player as black")
+    parser.add_argument("--result", choices=["1-0", "0-1", "1/2-1/2", "*"], help="only games with this result")
+    parser.add_argument("--eco", help="only games whose ECO code starts with this (e.g. B or C42)")
+    parser.add_argument("--since", help="only games played on or after this date (YYYY.MM.DD)")
+    parser.add_argument("--until", help="only games played on or before this date (YYYY.MM.DD)")
+
+def filters_from_arguments(args):
+    return {name: getattr(args, name) for name in ("player", "white", "black", "result", "eco", "since", "until")}
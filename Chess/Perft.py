@@ -0,0 +1,114 @@
+"""
+Perft (performance test) of the move generator: counts the leaf nodes of the move tree to a given depth.
+The counts of the reference positions below are known exactly, so any change to the move generation of
+ChessEngine.py can be checked for speed (nodes per second) and correctness (node counts) with:
+
+    python Chess/Perft.py --suite               # every reference position, exit code 1 on a wrong count
+    python Chess/Perft.py --fen "<FEN>" --depth 4 --divide
+"""
+
+import argparse
+import sys
+import time
+import ChessEngine
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# Reference positions (from the Chess Programming Wiki perft results) with their node counts for depth 1, 2, 3, ...
+POSITIONS = [
+    ("Start position", START_FEN,
+     [20, 400, 8902, 197281, 4865609]),
+    ("Kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("Position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("Position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("Position 4 mirrored", "r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1",
+     [6, 264, 9467, 422333]),
+    ("Position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487]),
+    ("Position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+]
+
+# Number of leaf nodes depth plies below the current position
+def perft(gs, depth):
+    moves = gs.get_valid_moves()
+    if depth == 1: # Bulk counting: the leaves don't have to be made
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        gs.make_move(move)
+        nodes += perft(gs, depth - 1)
+        gs.undo_move()
+    return nodes
+
+# Perft split by root move, the usual way to find which move a generator gets wrong
+def divide(gs, depth):
+    counts = {}
+    for move in gs.get_valid_moves():
+        gs.make_move(move)
+        counts[move.get_chess_notation()] = perft(gs, depth - 1) if depth > 1 else 1
+        gs.undo_move()
+    return counts
+
+# Run perft on a FEN and print the nodes, time and nodes per second (and every root move with divide)
+def run(fen, depth, showDivide=False, bitboards=False):
+    gs = ChessEngine.GameState(fen)
+    if bitboards:
+        gs.use_bitboards()
+    start = time.perf_counter()
+    if showDivide:
+        counts = divide(gs, depth)
+        for notation in sorted(counts):
+            print(f"{notation}: {counts[notation]}")
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(gs, depth)
+    seconds = time.perf_counter() - start
+    nps = int(nodes / seconds) if seconds > 0 else 0
+    print(f"depth {depth} nodes {nodes} time {seconds:.2f}s nps {nps}")
+    return nodes
+
+# Check every reference position up to maxNodes leaves per position, returns True if every count is right
+def run_suite(maxNodes=200000, bitboards=False):
+    allCorrect = True
+    totalNodes = 0
+    totalSeconds = 0.0 # Only the perft calls, not setting up the positions (or building the bitboard tables)
+    for name, fen, counts in POSITIONS:
+        for depth, expected in enumerate(counts, start=1):
+            if expected > maxNodes:
+                break
+            gs = ChessEngine.GameState(fen)
+            if bitboards:
+                gs.use_bitboards()
+            positionStart = time.perf_counter()
+            nodes = perft(gs, depth)
+            seconds = time.perf_counter() - positionStart
+            totalNodes += nodes
+            totalSeconds += seconds
+            status = "ok" if nodes == expected else f"WRONG (expected {expected})"
+            print(f"{name:<20} depth {depth} nodes {nodes:>9} time {seconds:6.2f}s {status}")
+            if nodes != expected:
+                allCorrect = False
+    nps = int(totalNodes / totalSeconds) if totalSeconds > 0 else 0
+    print(f"total nodes {totalNodes} time {totalSeconds:.2f}s nps {nps}")
+    return allCorrect
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft node counts of the ChessEngine move generator")
+    parser.add_argument("--fen", default=START_FEN, help="position to count from (default: start position)")
+    parser.add_argument("--depth", type=int, default=3, help="plies to count")
+    parser.add_argument("--divide", action="store_true", help="print the node count of every root move")
+    parser.add_argument("--suite", action="store_true", help="check the reference positions")
+    parser.add_argument("--max-nodes", type=int, default=200000, help="largest count to check per position with --suite")
+    parser.add_argument("--bitboards", action="store_true", help="use the bitboard move generator")
+    args = parser.parse_args()
+
+    if args.suite:
+        sys.exit(0 if run_suite(args.max_nodes, args.bitboards) else 1)
+    run(args.fen, args.depth, args.divide, args.bitboards)
+
+if __name__ == "__main__":
+    main()
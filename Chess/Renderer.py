@@ -0,0 +1,97 @@
+"""
+Board rendering with dirty rectangles for the pygame front ends (ChessMain.py and Chess.py).
+The empty board is drawn once onto a cached background surface. After that only the squares whose piece or
+highlight changed are drawn again (a background blit, the piece and the highlight), and only their rectangles
+are pushed to the window with display.update(rects). A frame where nothing changed draws and pushes nothing.
+"""
+
+import pygame as p
+
+DIMENSION = 8
+LIGHT_COLOR = "#a0b9cf"
+DARK_COLOR = "#7e98ac"
+LIGHT_SELECTED_COLOR = "#8ec7e9"
+DARK_SELECTED_COLOR = "#378ccc"
+SELECTION_WIDTH = 4                 # Width of the border of a selected square
+
+class BoardRenderer():
+    def __init__(self, screen, images, squareSize, offsetX=0, offsetY=0):
+        self.screen = screen
+        self.images = images            # Piece code -> surface of squareSize x squareSize
+        self.squareSize = squareSize
+        self.offsetX = offsetX          # Top left corner of the board in the window
+        self.offsetY = offsetY
+        self.background = self.draw_background()
+        self.shown = [None] * (DIMENSION * DIMENSION)  # Piece code drawn on every square (None: not drawn yet)
+        self.selected = set()           # Squares drawn with the selection border
+        self.dirty = []                 # Rectangles drawn since the last present()
+
+    # The empty board, drawn once
+    def draw_background(self):
+        size = self.squareSize
+        background = p.Surface((size * DIMENSION, size * DIMENSION))
+        colors = [p.Color(LIGHT_COLOR), p.Color(DARK_COLOR)] # The top left square is light
+        for row in range(DIMENSION):
+            for col in range(DIMENSION):
+                background.fill(colors[(row + col) % 2], p.Rect(col * size, row * size, size, size))
+        return background
+
+    def square_rect(self, sq):
+        row, col = divmod(sq, DIMENSION)
+        return p.Rect(self.offsetX + col * self.squareSize, self.offsetY + row * self.squareSize,
+                      self.squareSize, self.squareSize)
+
+    """
+    Drawing
+    """
+    # Draw the squares whose piece differs from what is on the screen (the squares of the last move or undo)
+    def update_board(self, board):
+        shown = self.shown
+        for sq in range(DIMENSION * DIMENSION):
+            if board[sq] != shown[sq]:
+                self.draw_square(sq, board[sq])
+
+    # Draw every square again (e.g. after the window was covered)
+    def redraw(self, board):
+        self.shown = [None] * (DIMENSION * DIMENSION)
+        self.update_board(board)
+
+    # Highlight a square (row, col) or take its highlight away, squares off the board are ignored
+    def select(self, row, col, selected=True):
+        if not (0 <= row < DIMENSION and 0 <= col < DIMENSION):
+            return
+        sq = row * DIMENSION + col
+        if selected == (sq in self.selected):
+            return
+        if selected:
+            self.selected.add(sq)
+        else:
+            self.selected.discard(sq)
+        self.draw_square(sq, self.shown[sq])
+
+    def clear_selection(self):
+        for sq in list(self.selected):
+            self.select(*divmod(sq, DIMENSION), selected=False)
+
+    # Background, piece and selection border of one square
+    def draw_square(self, sq, piece):
+        rect = self.square_rect(sq)
+        self.screen.blit(self.background, rect, rect.move(-self.offsetX, -self.offsetY))
+        if piece:
+            self.screen.blit(self.images[piece], rect)
+        if sq in self.selected:
+            row, col = divmod(sq, DIMENSION)
+            color = LIGHT_SELECTED_COLOR if (row + col) % 2 == 0 else DARK_SELECTED_COLOR
+            p.draw.rect(self.screen, p.Color(color), rect, SELECTION_WIDTH)
+        self.shown[sq] = piece
+        self.dirty.append(rect)
+
+    # Something outside the board (e.g. the evaluation bar) was drawn in rect
+    def mark_dirty(self, rect):
+        self.dirty.append(p.Rect(rect))
+
+    # Push the changed rectangles to the window
+    def present(self):
+        if self.dirty:
+            p.display.update(self.dirty)
+            self.dirty = []
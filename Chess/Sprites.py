@@ -0,0 +1,96 @@
+"""
+Piece images for the pygame front ends. Every theme (a directory of 12 PNGs, one per piece) is packed into one
+texture atlas: a strip of 12 squares, the pieces in PIECES order. The pieces handed out are subsurfaces of the atlas,
+so a size costs one surface instead of 12.
+Nothing is loaded before a size is first asked for. Scaled atlases are saved in the cache directory
+(CHESS_SPRITE_CACHE, or ~/.cache/chess/sprites), so the next start decodes one PNG and scales nothing.
+The unscaled atlas of a theme is kept in memory, so resizing or switching back to a theme never decodes the PNGs again.
+
+    sprites = SpriteManager("blue")
+    images = sprites.images(SQUARE_SIZE)    # piece code -> surface
+"""
+
+import os
+import pygame as p
+import ChessEngine
+
+THEMES_DIR = os.path.dirname(os.path.abspath(__file__))
+THEMES = {"blue": "images_blue_theme", "std": "images_std_theme"}
+DEFAULT_THEME = "blue"
+DEFAULT_CACHE_DIR = os.environ.get("CHESS_SPRITE_CACHE") or \
+                    os.path.join(os.path.expanduser("~"), ".cache", "chess", "sprites")
+PIECES = ["wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK"] # File names and atlas order
+
+class SpriteManager():
+    def __init__(self, theme=DEFAULT_THEME, cacheDir=DEFAULT_CACHE_DIR):
+        self.theme = theme
+        self.cacheDir = cacheDir
+        self.sourceAtlases = {}     # theme -> (unscaled atlas, size of a piece in it)
+        self.atlas = None           # Scaled atlas in use
+        self.atlasKey = None        # (theme, size) of the scaled atlas in use
+        self.pieces = {}            # Piece code -> subsurface of the scaled atlas
+
+    # Switch theme, the next images() call loads it
+    def set_theme(self, theme):
+        if theme not in THEMES:
+            raise ValueError(f"Unknown theme {theme!r}, expected one of {', '.join(THEMES)}")
+        self.theme = theme
+
+    # Piece code -> image of size x size pixels (only the atlas of the current theme and size stays loaded)
+    def images(self, size):
+        key = (self.theme, size)
+        if key != self.atlasKey:
+            self.atlas = self.load_scaled(self.theme, size)
+            self.atlasKey = key
+            self.pieces = {ChessEngine.STR_TO_PIECE[piece]: self.atlas.subsurface(p.Rect(i * size, 0, size, size))
+                           for i, piece in enumerate(PIECES)}
+        return dict(self.pieces)
+
+    """
+    Atlases
+    """
+    def theme_dir(self, theme):
+        return os.path.join(THEMES_DIR, THEMES[theme])
+
+    # Cache file of a scaled atlas, named after the newest source file so edited themes are scaled again
+    def cache_path(self, theme, size):
+        stamp = max(int(os.path.getmtime(os.path.join(self.theme_dir(theme), piece + ".png"))) for piece in PIECES)
+        return os.path.join(self.cacheDir, f"{theme}-{size}-{stamp}.png")
+
+    def load_scaled(self, theme, size):
+        path = self.cache_path(theme, size)
+        try:
+            return optimize(p.image.load(path))
+        except (OSError, p.error):
+            pass
+        source, sourceSize = self.load_source(theme)
+        atlas = p.Surface((size * len(PIECES), size), p.SRCALPHA)
+        for i in range(len(PIECES)): # Scaled one piece at a time so neighbours don't bleed into each other
+            piece = source.subsurface(p.Rect(i * sourceSize, 0, sourceSize, sourceSize))
+            atlas.blit(p.transform.smoothscale(piece, (size, size)), (i * size, 0))
+        self.save(atlas, path)
+        return optimize(atlas)
+
+    # The 12 PNGs of the theme packed unscaled, decoded once per theme
+    def load_source(self, theme):
+        if theme not in self.sourceAtlases:
+            images = [p.image.load(os.path.join(self.theme_dir(theme), piece + ".png")) for piece in PIECES]
+            sourceSize = max(max(image.get_size()) for image in images)
+            source = p.Surface((sourceSize * len(PIECES), sourceSize), p.SRCALPHA)
+            for i, image in enumerate(images):
+                source.blit(image, (i * sourceSize, 0))
+            self.sourceAtlases[theme] = (source, sourceSize)
+        return self.sourceAtlases[theme]
+
+    def save(self, atlas, path):
+        try:
+            os.makedirs(self.cacheDir, exist_ok=True)
+            temporary = path[:-len(".png")] + ".tmp.png" # pygame picks the format from the extension
+            p.image.save(atlas, temporary)
+            os.replace(temporary, path) # Never leave a half-written atlas behind
+        except (OSError, p.error):
+            pass # A read-only cache only costs scaling again next time
+
+# Pixel format of the window for fast blits (only possible once the window exists)
+def optimize(surface):
+    return surface.convert_alpha() if p.display.get_surface() is not None else surface
@@ -0,0 +1,61 @@
+"""
+Fixed-size transposition table for the search. Remembers what was found about a position (by its Zobrist key),
+so transpositions and the next iterative-deepening pass can reuse the work instead of searching it again.
+"""
+
+EXACT, LOWERBOUND, UPPERBOUND = 0, 1, 2    # Bound types: exact score, score >= stored, score <= stored
+ENTRY_BYTES = 160                           # Rough size of one entry (tuple + ints + list slot) in CPython
+DEFAULT_SIZE_MB = 16
+
+class TranspositionTable():
+    def __init__(self, sizeMB=DEFAULT_SIZE_MB):
+        # Number of slots is the largest power of 2 that fits in the memory cap (at least one bucket of 2)
+        slots = max(2, int(sizeMB * 1024 * 1024) // ENTRY_BYTES)
+        self.size = 1 << (slots.bit_length() - 1)
+        self.mask = self.size - 2   # Index of the first slot of a bucket (buckets are 2 slots)
+        self.sizeMB = sizeMB
+        self.clear()
+
+    def clear(self):
+        # Every entry is a tuple (key, depth, bound, score, moveID, age) or None (moveID is the packed Move.moveID)
+        self.entries = [None] * self.size
+        self.age = 0
+        self.hits = 0
+        self.probes = 0
+        self.stores = 0
+
+    # Call once per search, entries from older searches are replaced first
+    def new_search(self):
+        self.age += 1
+
+    """
+    Each bucket has 2 slots: the first keeps the deepest (most expensive) result of the current search,
+    the second always takes the newest result so recent positions are never locked out
+    """
+    def probe(self, key):
+        self.probes += 1
+        index = key & self.mask
+        entry = self.entries[index]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        entry = self.entries[index + 1]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key, depth, bound, score, moveID):
+        self.stores += 1
+        index = key & self.mask
+        old = self.entries[index]
+        newEntry = (key, depth, bound, score, moveID, self.age)
+        if old is None or old[0] == key or old[5] != self.age or depth >= old[1]:
+            self.entries[index] = newEntry
+        else:
+            self.entries[index + 1] = newEntry
+
+    # Fraction of the slots in use (per mille, like the UCI hashfull)
+    def hashfull(self):
+        sample = min(self.size, 1000)
+        return sum(1 for entry in self.entries[:sample] if entry is not None) * 1000 // sample
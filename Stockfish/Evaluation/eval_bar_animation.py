@@ -1,9 +1,19 @@
-import chess
-import chess.pgn
-from stockfish import Stockfish
+"""
+Animated evaluation bar over the moves of a game.
+
+    python Stockfish/Evaluation/eval_bar_animation.py                   # Asks for a username, shows its latest game
+    python Stockfish/Evaluation/eval_bar_animation.py PGNs/games.pgn --player MagnusCarlsen --game -1
+"""
+
+import argparse
+import os
 import pygame
 import sys
 import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Chess")) # Shared engine modules
+import EnginePool
+import OpeningBook
+import PGNIndex
 
 # Screen dimensions
 WIDTH, HEIGHT = 100, 500
@@ -54,29 +64,45 @@ def draw_eval_bar(eval_value, smooth_value, mate_moves):
     pygame.display.flip()
 
 def main():
-    # Path to Stockfish binary
-    stockfish = Stockfish("/opt/homebrew/bin/stockfish", parameters={"Threads": 2, "Hash": 1024})
+    parser = argparse.ArgumentParser(description="Animate the evaluation bar over a game")
+    parser.add_argument("pgn", nargs="?", help="PGN file (default: asks for a username and opens its latest game)")
+    parser.add_argument("--game", type=int, default=-1, help="which of the matching games, from 0 (default: the last)")
+    PGNIndex.add_filter_arguments(parser)
+    args = parser.parse_args()
 
-    # Path to your PGN file
-    username = input("Enter the username for the latest PGN game: ")
-    pgn_path = f"PGNs/{username}_latest_game.pgn"
-    if not username:
-        pgn_path = "PGNs/magnuscarlsen_latest_game.pgn"
+    # Shared Stockfish engine (set STOCKFISH_PATH to point it at the binary)
+    stockfish = EnginePool.get_pool(parameters={"Threads": 2, "Hash": 1024})
 
-    # Open the PGN file
-    with open(pgn_path) as pgn_file:
-        game = chess.pgn.read_game(pgn_file)
+    # Path to your PGN file
+    pgn_path = args.pgn
+    if pgn_path is None:
+        username = input("Enter the username for the latest PGN game: ")
+        pgn_path = f"PGNs/{username}_latest_game.pgn"
+        if not username:
+            pgn_path = "PGNs/magnuscarlsen_latest_game.pgn"
+
+    # Only the chosen game is parsed, the index finds it without reading the others
+    with PGNIndex.PGNIndex(pgn_path) as index:
+        games = index.filter(**PGNIndex.filters_from_arguments(args))
+        if not games:
+            sys.exit(f"No game in {pgn_path} matches")
+        game = index.read_game(games[args.game])
 
     # Initialize variables
     board = game.board()
     evaluations = []
     current_eval = 0.0 
+    book = OpeningBook.load_book()  # Book moves with a stored evaluation don't need Stockfish
 
     # Main game loop
     for move in game.mainline_moves():
+        entry = book.find(board, move) if book is not None else None
+        whiteMoved = board.turn
         board.push(move)  # Make the move on the board
-        stockfish.set_fen_position(board.fen())  # Set the position in Stockfish
-        evaluation = stockfish.get_evaluation()  # Get the evaluation from Stockfish
+        if entry is not None and entry.evaluation is not None:
+            evaluation = {"type": "cp", "value": entry.evaluation if whiteMoved else -entry.evaluation}
+        else:
+            evaluation = stockfish.get_evaluation(board.fen())  # Get the evaluation from Stockfish (or the evaluation cache)
 
         # Convert evaluation to centipawns if not mate
         if evaluation["type"] == "cp":
@@ -1,56 +1,264 @@
-import chess
-import chess.pgn
-from stockfish import Stockfish
-
-# Path to your Stockfish binary
-stockfish = Stockfish("/opt/homebrew/bin/stockfish", 
-                      parameters={"Threads": 2, 
-                                  "Hash": 1025,
-                                  })
-
-# Path to your PGN file
-username = input("Enter the username for latest PGN game: ")
-pgn_path = "PGNs/" + username + "_latest_game.pgn"
-if username == "":
-    pgn_path = "PGNs/magnuscarlsen_latest_game.pgn"
-
-# Open the PGN file
-with open(pgn_path) as pgn_file:
-    game = chess.pgn.read_game(pgn_file)
-
-# Initialize variables
-board = game.board()
-evaluations = []
-
-# Iterate through all moves in the game
-for move in game.mainline_moves():
-    board.push(move)  # Make the move on the board
-    stockfish.set_fen_position(board.fen())  # Set the position in Stockfish
-    evaluation = stockfish.get_evaluation()  # Get the evaluation from Stockfish
-    evaluations.append((move, evaluation))   # Save the move and evaluation
-
-# Print evaluations
-print("\nEvaluations: (Positive is advantage white, negative is advantage black)")
-i = 1
-num_move = 1
-for move, eval in evaluations:
-
-    player = "WHITE" if i % 2 == 1 else "BLACK"
-    if i % 2 == 1 and i != 1:
-        num_move += 1
-    
-    i += 1
-
-    if eval["type"] == "cp":
-        eval_value = round(eval["value"] * 0.01, 2)  # e.g -1.50 like chess.com
-        print(f"{num_move}. {player} Move: {move}, Evaluation: {eval_value} centipawns")
-    elif eval["type"] == "mate":
-        mate_in = eval["value"]
-        advantage = "WHITE" if mate_in > 0 else "BLACK"
-        print(f"{num_move}. {player} Move: {move}, Evaluation: Mate in {abs(mate_in)} moves, Advantage: {advantage}")
+"""
+Evaluate every position of every game in one or more (multi-game) PGN files with Stockfish.
+Positions are spread over a pool of worker processes, each with its own engine, and the evaluations are written
+per ply to a CSV file in a stable order (files in the order given, games and plies in file order).
+Finished games are recorded in a checkpoint file, so an interrupted run continues where it stopped (a CSV file
+without its checkpoint is written again from the start).
+Evaluations are shared through the evaluation cache (see Chess/EvalCache.py), so positions seen in earlier runs or
+other games (e.g. the opening) are not searched again. Moves from the opening book (see Chess/OpeningBook.py) take
+the evaluation stored in the book, or the type "book" if it has none, without asking the engine.
+With --static the positions are scored by the built-in evaluation (Chess/Evaluation.py, one NumPy batch per game)
+instead of Stockfish, for quick scans of large files.
+
+    python Stockfish/Evaluation/pgn_file_evaluation.py PGNs/*.pgn --workers 4 --depth 15 --output evaluations.csv
+    python Stockfish/Evaluation/pgn_file_evaluation.py PGNs/games.pgn --player MagnusCarlsen --eco C4
+    python Stockfish/Evaluation/pgn_file_evaluation.py          # Asks for a username and prints its latest game
+"""
+
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Chess")) # Shared engine modules
+import EnginePool
+import EvalCache
+import Evaluation
+import OpeningBook
+import PGNIndex
+
+DEFAULT_DEPTH = EnginePool.DEFAULT_DEPTH
+CSV_FIELDS = ["file", "game", "ply", "move", "fen", "type", "value"]
+BATCH_POSITIONS = 256       # Positions handed to the workers at a time (whole games, so a batch can be bigger)
+
+# Stream (file, game number, [(ply, move, fen, book evaluation), ...]) for the games of the files that match the
+# criteria (see PGNIndex.GameEntry.matches), parsing one game at a time
+def read_games(paths, book=None, **criteria):
+    for path, entry, game in PGNIndex.stream_games(paths, **criteria):
+        yield path, entry.number, game_positions(game, book)
+
+# [(ply, move, fen, book evaluation), ...] of the main line of a chess.pgn.Game. The book evaluation is None after
+# the game left the opening book
+def game_positions(game, book=None):
+    bookMoves = book.leading_moves(game) if book is not None else []
+    board = game.board()
+    positions = []
+    for ply, move in enumerate(game.mainline_moves(), start=1):
+        whiteMoved = board.turn
+        board.push(move)  # Make the move on the board
+        bookEvaluation = book_evaluation(bookMoves[ply - 1], whiteMoved) if ply <= len(bookMoves) else None
+        positions.append((ply, move.uci(), board.fen(), bookEvaluation))
+    return positions
+
+# Evaluation of a book move from white's point of view (the book stores it for the side that played it)
+def book_evaluation(entry, whiteMoved):
+    if entry.evaluation is None:
+        return {"type": "book", "value": ""}
+    return {"type": "cp", "value": entry.evaluation if whiteMoved else -entry.evaluation}
+
+"""
+Worker processes: every worker starts its own engine once and evaluates the positions it is handed
+"""
+workerPool = None
+
+# cachePath is the evaluation cache file, None for the default one or False to not use the cache
+def init_worker(path, parameters, depth, cachePath=None):
+    global workerPool
+    cache = EvalCache.EvalCache(cachePath) if cachePath else cachePath
+    workerPool = EnginePool.EnginePool(path, size=1, parameters=parameters, depth=depth, cache=cache)
+
+def evaluate_position(task):
+    key, ply, move, fen, evaluation = task
+    if fen is None or evaluation is not None: # Placeholder of a game without moves, or a book move
+        return task
+    return key, ply, move, fen, workerPool.get_evaluation(fen)
+
+"""
+Checkpoint: one line "file<TAB>game<TAB>end" per game whose evaluations are completely written, end is the size of
+the CSV file after its rows. The first line is the size of the CSV file after its header.
+Rows are written before the checkpoint lines of their games, so after a crash the CSV file can hold rows past the
+last end. They are cut off on resume and their games evaluated again, so no row is ever written twice.
+"""
+# (set of (file, game) already written, CSV size after the last of them or None if unknown)
+def load_checkpoint(path):
+    done = set()
+    end = None
+    if path is not None and os.path.exists(path):
+        with open(path) as checkpoint:
+            for line in checkpoint:
+                if not line.endswith("\n"): # Cut off by a crash
+                    break
+                fields = line.rstrip("\n").rsplit("\t", 2)
+                if len(fields) == 1 and fields[0].isdigit():
+                    end = int(fields[0])
+                elif len(fields) >= 2 and fields[1].isdigit():
+                    done.add((fields[0], int(fields[1])))
+                    end = int(fields[2]) if len(fields) == 3 and fields[2].isdigit() else None
+    return done, end
+
+# Drop a last line cut off by a crash, so the next line appended doesn't run into it
+def cut_partial_line(path):
+    if os.path.exists(path):
+        with open(path, "rb+") as checkpoint:
+            data = checkpoint.read()
+            if data and not data.endswith(b"\n"):
+                checkpoint.truncate(data.rfind(b"\n") + 1)
+
+# Batches of at least size tasks (key, ply, move, fen, book evaluation), the tasks of a game always in one batch.
+# Only one batch is read ahead of the workers, so memory doesn't grow with the size of the PGN files
+def task_batches(paths, done, book=None, criteria=None, size=None):
+    size = size or BATCH_POSITIONS
+    batch = []
+    count = 0
+    for path, gameNumber, positions in read_games(paths, book, **(criteria or {})):
+        key = (path, gameNumber)
+        if key in done:
+            continue
+        tasks = [(key, ply, move, fen, bookEvaluation) for ply, move, fen, bookEvaluation in positions]
+        batch.append(tasks or [(key, 0, None, None, None)]) # A placeholder for a game without moves
+        count += len(batch[-1])
+        if count >= size:
+            yield batch
+            batch = []
+            count = 0
+    if batch:
+        yield batch
+
+# Evaluate all games of the PGN files and write one CSV row per ply, skipping games already in the checkpoint.
+# book is an OpeningBook (or None to evaluate the opening moves too)
+def evaluate_files(paths, output, checkpoint=None, workers=None, depth=DEFAULT_DEPTH, enginePath=None, parameters=None,
+                   cachePath=None, criteria=None, book=None, batchSize=None):
+    workers = workers or os.cpu_count() or 1
+    # Each worker runs one single-threaded engine, the workers already use the cores
+    parameters = dict({"Threads": 1, "Hash": 256} if parameters is None else parameters)
+    checkpoint = checkpoint or output + ".checkpoint"
+    # A checkpoint without its CSV file is stale, and a CSV file without its checkpoint can't tell which games it
+    # holds (they would all be written again): either way the run starts over with a new CSV file and checkpoint
+    newFile = not os.path.exists(output) or os.path.getsize(output) == 0 or not os.path.exists(checkpoint)
+    done, end = (set(), None) if newFile else load_checkpoint(checkpoint)
+    if not newFile:
+        cut_partial_line(checkpoint)
+    if end is not None and os.path.getsize(output) > end:
+        with open(output, "r+b") as out:
+            out.truncate(end) # Rows of games missing from the checkpoint, they are evaluated again
+
+    gamesWritten = 0
+    with open(output, "w" if newFile else "a", newline="") as out, open(checkpoint, "w" if newFile else "a") as ckpt, \
+            multiprocessing.Pool(workers, init_worker, (enginePath, parameters, depth, cachePath)) as pool:
+        writer = csv.writer(out)
+        if newFile:
+            writer.writerow(CSV_FIELDS)
+            out.flush()
+            ckpt.write(f"{out.tell()}\n")
+            ckpt.flush()
+        for batch in task_batches(paths, done, book, criteria, batchSize or max(BATCH_POSITIONS, 16 * workers)):
+            # map keeps the order of the tasks, so the rows come back in file/game/ply order
+            results = iter(pool.map(evaluate_position, [task for tasks in batch for task in tasks], chunksize=4))
+            lines = []
+            for tasks in batch:
+                gameResults = [next(results) for _ in tasks]
+                writer.writerows([key[0], key[1], ply, move, fen, evaluation["type"], evaluation["value"]]
+                                 for key, ply, move, fen, evaluation in gameResults if ply > 0)
+                out.flush()
+                key = tasks[0][0]
+                lines.append(f"{key[0]}\t{key[1]}\t{out.tell()}\n")
+            # The games of the batch are only recorded once all of their rows are in the CSV file
+            ckpt.writelines(lines)
+            ckpt.flush()
+            gamesWritten += len(batch)
+    return gamesWritten
+
+# Score every ply with the static evaluation instead of Stockfish (type "static", centipawns from white's view)
+def evaluate_files_static(paths, output, criteria=None):
+    newFile = not os.path.exists(output)
+    games = 0
+    with open(output, "a", newline="") as out:
+        writer = csv.writer(out)
+        if newFile:
+            writer.writerow(CSV_FIELDS)
+        for path, gameNumber, positions in read_games(paths, **(criteria or {})):
+            values = Evaluation.evaluate_fens([fen for _, _, fen, _ in positions])
+            writer.writerows([path, gameNumber, ply, move, fen, "static", int(value)]
+                             for (ply, move, fen, _), value in zip(positions, values))
+            games += 1
+    return games
+
+# Print the evaluations of one game like chess.com does (positive is advantage white, negative is advantage black)
+def print_evaluations(evaluations):
+    print("\nEvaluations: (Positive is advantage white, negative is advantage black)")
+    i = 1
+    num_move = 1
+    for move, eval in evaluations:
+
+        player = "WHITE" if i % 2 == 1 else "BLACK"
+        if i % 2 == 1 and i != 1:
+            num_move += 1
+
+        i += 1
+
+        if eval["type"] == "cp":
+            eval_value = round(eval["value"] * 0.01, 2)  # e.g -1.50 like chess.com
+            print(f"{num_move}. {player} Move: {move}, Evaluation: {eval_value} centipawns")
+        elif eval["type"] == "mate":
+            mate_in = eval["value"]
+            advantage = "WHITE" if mate_in > 0 else "BLACK"
+            print(f"{num_move}. {player} Move: {move}, Evaluation: Mate in {abs(mate_in)} moves, Advantage: {advantage}")
+        elif eval["type"] == "book":
+            print(f"{num_move}. {player} Move: {move}, Book move")
+
+# Evaluate the latest game of a user on the shared engine and print it
+def evaluate_latest_game():
+    # Path to your PGN file
+    username = input("Enter the username for latest PGN game: ")
+    pgn_path = "PGNs/" + username + "_latest_game.pgn"
+    if username == "":
+        pgn_path = "PGNs/magnuscarlsen_latest_game.pgn"
+
+    game = PGNIndex.read_last_game(pgn_path) # The latest game is the last one of the file
+    if game is None:
+        print(f"No games in {pgn_path}")
+        return
+
+    # Shared Stockfish engine (set STOCKFISH_PATH to point it at the binary)
+    stockfish = EnginePool.get_pool(parameters={"Threads": 2, "Hash": 1024})
+    positions = game_positions(game, OpeningBook.load_book())
+    evaluations = [(move, bookEvaluation or stockfish.get_evaluation(fen)) for _, move, fen, bookEvaluation in positions]
+    print_evaluations(evaluations)
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate every ply of the games in PGN files with Stockfish")
+    parser.add_argument("pgns", nargs="*", help="PGN files (any number of games each)")
+    parser.add_argument("--output", default="evaluations.csv", help="CSV file the evaluations are written to")
+    parser.add_argument("--checkpoint", help="file recording finished games (default: <output>.checkpoint)")
+    parser.add_argument("--workers", type=int, help="worker processes, each with its own engine (default: CPU count)")
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH, help="search depth per position")
+    parser.add_argument("--engine", help="engine path or command (default: STOCKFISH_PATH or stockfish)")
+    parser.add_argument("--cache", help="evaluation cache file (default: CHESS_EVAL_CACHE or ~/.cache/chess)")
+    parser.add_argument("--no-cache", action="store_true", help="search every position, even if it is cached")
+    parser.add_argument("--static", action="store_true", help="use the built-in static evaluation, not Stockfish")
+    parser.add_argument("--book", default=OpeningBook.DEFAULT_PATH, help="opening book whose moves aren't searched")
+    parser.add_argument("--no-book", action="store_true", help="search the opening moves too")
+    PGNIndex.add_filter_arguments(parser)
+    args = parser.parse_args()
+
+    if not args.pgns:
+        evaluate_latest_game()
+        return
+    if args.static:
+        games = evaluate_files_static(args.pgns, args.output, PGNIndex.filters_from_arguments(args))
+        print(f"Scored {games} games into {args.output}")
+        return
+    cachePath = False if args.no_cache else args.cache
+    games = evaluate_files(args.pgns, args.output, args.checkpoint, args.workers, args.depth, args.engine,
+                           cachePath=cachePath, criteria=PGNIndex.filters_from_arguments(args),
+                           book=None if args.no_book else OpeningBook.load_book(args.book))
+    print(f"Evaluated {games} games into {args.output}")
 
 # Centipawn loss
-# This value can be used as an indicator of the quality of play. 
-# The fewer centipawns one loses per move, the stronger the play. 
-# The computer analysis on Lichess is powered by Stockfish. a centipawn cP 
-# is 1/100 of the worth of a pawn.
\ No newline at end of file
+# This value can be used as an indicator of the quality of play.
+# The fewer centipawns one loses per move, the stronger the play.
+# The computer analysis on Lichess is powered by Stockfish. a centipawn cP
+# is 1/100 of the worth of a pawn.
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,160 @@
-from stockfish import Stockfish
-
-# Initialize Stockfish engine
-stockfish = Stockfish(path="/opt/homebrew/bin/stockfish", 
-                      depth=18, 
-                      parameters={"Threads": 2, "Minimum Thinking Time": 30})
-stockfish.set_skill_level(20)  # Max strength
-
-# Example PGN (game in Portable Game Notation)
-moves = [
-    "e2e4", "e7e5",
-    "g1f3", "b8c6",
-    "f1b5", "a7a6",
-    "b5a4", "g8f6"
+"""
+Accuracy of the players in one or more (multi-game) PGN files: average centipawn loss (ACPL), the number of
+inaccuracies, mistakes and blunders per player and a rough rating band from the ACPL.
+Every position is searched once (the evaluation after a move is the evaluation before the next one, and positions
+repeated within the run, e.g. openings, or cached from earlier runs are not searched again), spread over a pool of
+shared engines. Moves from the opening book (see Chess/OpeningBook.py) are not judged and not searched.
+
+    python Stockfish/elo_rating.py PGNs/*.pgn --engines 4 --depth 18
+    python Stockfish/elo_rating.py PGNs/tournament.pgn --since 2025.01.01 --result 1-0
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import chess
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Chess")) # Shared engine modules
+import EnginePool
+import OpeningBook
+import PGNIndex
+
+DEFAULT_DEPTH = 18
+MAX_CP = 1000           # Evaluations (and mates) are capped, losing 15 pawns in a won position isn't 15 times worse
+INACCURACY, MISTAKE, BLUNDER = 50, 100, 300     # Centipawn loss of a move from which it counts as one
+
+# Rough strength from the ACPL: (highest ACPL, band)
+RATING_BANDS = [
+    (20, "Grandmaster level (2500+)"),
+    (35, "Master level (2200-2500)"),
+    (50, "Strong club player (1800-2200)"),
+    (100, "Intermediate player (1400-1800)"),
+    (150, "Casual player (1000-1400)"),
 ]
+BEGINNER_BAND = "Beginner (< 1000)"
+
+def rating_band(acpl):
+    for highest, band in RATING_BANDS:
+        if acpl < highest:
+            return band
+    return BEGINNER_BAND
+
+# Stream (white, black, [fen of the start position and after every ply], book moves) for the games of the files that
+# match the criteria (see PGNIndex.GameEntry.matches). The first book moves plies are from the opening book
+def read_games(paths, book=None, **criteria):
+    for _, _, game in PGNIndex.stream_games(paths, **criteria):
+        bookMoves = len(book.leading_moves(game)) if book is not None else 0
+        board = game.board()
+        fens = [board.fen()]
+        for move in game.mainline_moves():
+            board.push(move)
+            fens.append(board.fen())
+        yield game.headers.get("White", "?"), game.headers.get("Black", "?"), fens, bookMoves
+
+# Evaluation in centipawns from white's point of view, capped at MAX_CP (mates are worth MAX_CP)
+def centipawns(evaluation):
+    if evaluation["type"] == "mate":
+        return MAX_CP if evaluation["value"] > 0 else -MAX_CP
+    return max(-MAX_CP, min(MAX_CP, evaluation["value"]))
+
+# Finished games don't need the engine (and engines disagree on how to score them)
+def terminal_evaluation(fen):
+    board = chess.Board(fen)
+    if board.is_checkmate():
+        return -MAX_CP if board.turn == chess.WHITE else MAX_CP
+    if board.is_stalemate() or board.is_insufficient_material():
+        return 0
+    return None
+
+# Evaluate every distinct position once (in parallel on the shared engines), returns {fen: centipawns}
+def evaluate_positions(fens, pool, workers):
+    scores = {}
+    pending = []
+    for fen in dict.fromkeys(fens): # Distinct, in order
+        score = terminal_evaluation(fen)
+        if score is None:
+            pending.append(fen)
+        else:
+            scores[fen] = score
+    with ThreadPoolExecutor(workers) as executor: # Threads only wait for the engine processes
+        for fen, evaluation in zip(pending, executor.map(pool.get_evaluation, pending)):
+            scores[fen] = centipawns(evaluation)
+    return scores
+
+class PlayerStats():
+    def __init__(self, name):
+        self.name = name
+        self.games = 0
+        self.moves = 0
+        self.totalLoss = 0
+        self.inaccuracies = 0
+        self.mistakes = 0
+        self.blunders = 0
+        self.bookMoves = 0
+
+    def add_move(self, loss):
+        self.moves += 1
+        self.totalLoss += loss
+        if loss >= BLUNDER:
+            self.blunders += 1
+        elif loss >= MISTAKE:
+            self.mistakes += 1
+        elif loss >= INACCURACY:
+            self.inaccuracies += 1
+
+    @property
+    def acpl(self):
+        return self.totalLoss / self.moves if self.moves else 0.0
+
+# Analyse every game of the PGN files, returns {player name: PlayerStats}.
+# book is an OpeningBook (or None to judge the opening moves too)
+def analyse_files(paths, depth=DEFAULT_DEPTH, engines=1, enginePath=None, parameters=None, criteria=None, book=None):
+    games = list(read_games(paths, book, **(criteria or {})))
+    parameters = dict({"Threads": 1, "Hash": 256, "Skill Level": 20} if parameters is None else parameters)
+    pool = EnginePool.get_pool(enginePath, size=engines, parameters=parameters, depth=depth)
+    # Positions before the last book move are never compared, so they aren't searched
+    scores = evaluate_positions([fen for _, _, fens, bookMoves in games for fen in fens[bookMoves:]], pool, engines)
+
+    players = {}
+    for white, black, fens, bookMoves in games:
+        for name in (white, black):
+            players.setdefault(name, PlayerStats(name)).games += 1
+        for ply in range(1, len(fens)):
+            # The FEN before the move says who made it (games may start from a position with black to move)
+            whiteMoved = fens[ply - 1].split()[1] == "w"
+            if ply <= bookMoves:
+                players[white if whiteMoved else black].bookMoves += 1
+                continue
+            before, after = scores[fens[ply - 1]], scores[fens[ply]]
+            loss = max(0, before - after) if whiteMoved else max(0, after - before)
+            players[white if whiteMoved else black].add_move(loss)
+    return players
+
+def print_report(players):
+    print(f"{'Player':<24} {'Games':>5} {'Moves':>6} {'Book':>5} {'ACPL':>7} {'Inacc':>6} {'Mist':>5} {'Blund':>6}"
+          f"  Rating band")
+    for stats in sorted(players.values(), key=lambda stats: stats.acpl):
+        print(f"{stats.name:<24} {stats.games:>5} {stats.moves:>6} {stats.bookMoves:>5} {stats.acpl:>7.1f} "
+              f"{stats.inaccuracies:>6} {stats.mistakes:>5} {stats.blunders:>6}  {rating_band(stats.acpl)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="ACPL, mistakes and a rating estimate of the players in PGN files")
+    parser.add_argument("pgns", nargs="+", help="PGN files (any number of games each)")
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH, help="search depth per position")
+    parser.add_argument("--engines", type=int, default=os.cpu_count() or 1, help="engines searching at the same time")
+    parser.add_argument("--engine", help="engine path or command (default: STOCKFISH_PATH or stockfish)")
+    parser.add_argument("--book", default=OpeningBook.DEFAULT_PATH, help="opening book whose moves aren't judged")
+    parser.add_argument("--no-book", action="store_true", help="judge the opening moves too")
+    PGNIndex.add_filter_arguments(parser)
+    args = parser.parse_args()
+
+    book = None if args.no_book else OpeningBook.load_book(args.book)
+    print_report(analyse_files(args.pgns, args.depth, args.engines, args.engine,
+                               criteria=PGNIndex.filters_from_arguments(args), book=book))
+
+# Centipawn loss
+# This value can be used as an indicator of the quality of play.
+# The fewer centipawns one loses per move, the stronger the play.
 
-# Load the position and evaluate each move
-starting_fen = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
-stockfish.set_fen_position(starting_fen)
-errors = []
-for move in moves:
-    eval_before = stockfish.get_evaluation()
-    stockfish.make_moves_from_current_position([move])
-    eval_after = stockfish.get_evaluation()
-    
-    if eval_before["type"] == "cp" and eval_after["type"] == "cp":
-        # Compute centipawn loss for the move
-        cp_loss = abs(eval_after["value"] - eval_before["value"])
-        errors.append(cp_loss)
-
-# Calculate average centipawn loss
-acpl = sum(errors) / len(errors)
-print(f"Average Centipawn Loss (ACPL): {acpl}")
-
-# Interpret the ACPL (rough estimate of Elo strength)
-if acpl < 20:
-    print("Likely a Grandmaster-level player!")
-elif acpl < 50:
-    print("Strong club player (1800-2200).")
-elif acpl < 100:
-    print("Intermediate player (1400-1800).")
-else:
-    print("Beginner or casual player.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
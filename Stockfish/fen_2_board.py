@@ -1,29 +1,19 @@
-fen = input("Enter a FEN string: ")
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Chess")) # Shared engine modules
+import ChessEngine
 
-# Function to convert FEN to a 2D list with color and piece type
-def fen_to_board(fen):
-    board = []
-    fen_board = fen.split(" ")[0]  # Extract board part from FEN
-    piece_mapping = {
-        "r": "bR", "n": "bN", "b": "bB", "q": "bQ", "k": "bK", "p": "bp",  # black pieces
-        "R": "wR", "N": "wN", "B": "wB", "Q": "wQ", "K": "wK", "P": "wp"   # white pieces
-    }
-    
-    for row in fen_board.split("/"):
-        board_row = []
-        for char in row:
-            if char.isdigit():
-                board_row.extend(["--"] * int(char))  # Empty squares
-            else:
-                board_row.append(piece_mapping.get(char, "--"))  # Map piece to the new format
-        board.append(board_row)
-    return board
+# Print a FEN's position as the 2D list of strings ("wp", "bK", "--", ...) used for boards in the code.
+# The FEN is parsed by GameState (Chess/Fen.py), so invalid FENs are reported instead of giving a wrong board
+fen = " ".join(sys.argv[1:]) or input("Enter a FEN string: ")
 
-# Convert FEN to a 2D list
-board_state = fen_to_board(fen)
+try:
+    board_state = ChessEngine.GameState(fen).get_board_grid()
+except ValueError as error:
+    sys.exit(f"Invalid FEN: {error}")
 
 # Print the board in the requested format
 print("[")
 for row in board_state:
-    print(f'    {row},')
-print("]")
\ No newline at end of file
+    print(f'    {row.tolist()},')
+print("]")
@@ -0,0 +1,330 @@
+"""
+Headless match between the built-in engine (Chess/ChessAI.py searching a ChessEngine.GameState) and Stockfish
+limited to a skill level or an Elo (the Skill Level / UCI_Elo options that set_skill_level/set_elo_rating of the
+stockfish library set, see setup_stockfish.py).
+Games are played at the same time by a pool of worker processes, each with its own Stockfish. Every opening of the
+suite is played twice with the colours swapped, so neither side profits from a good or bad opening.
+All games are written to a PGN file and the report gives the Elo difference with a 95% error bar, the result of a
+sequential probability ratio test (SPRT) and the average time per move of both engines.
+
+    python Stockfish/match_runner.py --games 200 --workers 8 --skill 3 --engine-time 0.2
+    python Stockfish/match_runner.py --games 1000 --elo 1500 --sprt 0 50 --openings PGNs/openings.pgn
+"""
+
+import argparse
+import math
+import multiprocessing
+import os
+import sys
+import time
+import chess
+import chess.pgn
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Chess")) # Shared engine modules
+import ChessAI
+import ChessEngine
+import EnginePool
+import PGNIndex
+from TranspositionTable import TranspositionTable
+
+ENGINE_NAME = "ChessAI"
+DEFAULT_GAMES = 100
+DEFAULT_ENGINE_TIME = 0.2       # Seconds per move of the built-in engine
+DEFAULT_STOCKFISH_TIME = 100    # Milliseconds per move of Stockfish
+DEFAULT_MAX_PLIES = 300         # Games still going after this many plies are adjudicated a draw
+DEFAULT_OPENING_PLIES = 8       # Plies taken from every game of a PGN opening suite
+
+# Built-in opening suite: balanced main lines, in UCI moves from the start position
+OPENINGS = [
+    "e2e4 e7e5 g1f3 b8c6 f1b5 a7a6",        # Ruy Lopez
+    "e2e4 e7e5 g1f3 b8c6 f1c4 f8c5",        # Italian
+    "e2e4 c7c5 g1f3 d7d6 d2d4 c5d4",        # Sicilian
+    "e2e4 c7c5 b1c3 b8c6 g2g3",             # Closed Sicilian
+    "e2e4 e7e6 d2d4 d7d5 b1c3",             # French
+    "e2e4 c7c6 d2d4 d7d5 e4e5",             # Caro-Kann, advance
+    "e2e4 d7d5 e4d5 d8d5 b1c3",             # Scandinavian
+    "e2e4 g7g6 d2d4 f8g7",                  # Modern
+    "d2d4 d7d5 c2c4 e7e6 b1c3 g8f6",        # Queen's Gambit Declined
+    "d2d4 d7d5 c2c4 c7c6 g1f3 g8f6",        # Slav
+    "d2d4 g8f6 c2c4 g7g6 b1c3 f8g7",        # King's Indian
+    "d2d4 g8f6 c2c4 e7e6 b1c3 f8b4",        # Nimzo-Indian
+    "d2d4 f7f5 g2g3 g8f6",                  # Dutch
+    "c2c4 e7e5 b1c3 g8f6",                  # English
+    "g1f3 d7d5 g2g3 g8f6 f1g2",             # Reti
+    "e2e4 e7e5 f2f4",                       # King's Gambit
+]
+
+class Opening():
+    def __init__(self, fen=chess.STARTING_FEN, moves=()):
+        self.fen = fen                  # Start position
+        self.moves = list(moves)        # UCI moves played from it
+
+    def board(self):
+        board = chess.Board(self.fen)
+        for move in self.moves:
+            board.push_uci(move)
+        return board
+
+# Openings from a file: a PGN file gives the first plies of each game, any other file one FEN or line of UCI
+# moves per line (# starts a comment)
+def load_openings(path, plies=DEFAULT_OPENING_PLIES):
+    openings = []
+    if path.lower().endswith(".pgn"):
+        for _, _, game in PGNIndex.stream_games([path]):
+            moves = [move.uci() for move in game.mainline_moves()][:plies]
+            openings.append(Opening(game.board().fen(), moves))
+        return openings
+    with open(path) as openingFile:
+        for line in openingFile:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            if "/" in line: # A FEN (an EPD line has no move counters, python-chess fills them in)
+                openings.append(Opening(chess.Board(" ".join(line.split()[:6])).fen()))
+            else:
+                openings.append(Opening(moves=line.split()))
+    return openings
+
+"""
+Worker processes: every worker starts its own Stockfish once and plays the games it is handed
+"""
+workerEngine = None
+
+def init_worker(enginePath, parameters):
+    global workerEngine
+    workerEngine = EnginePool.UCIEngine(EnginePool.engine_command(enginePath), parameters)
+
+# Play one game, returns a dict with the result for the built-in engine (1, 0.5 or 0), the PGN and the move times
+def play_game(task):
+    number, opening, engineWhite, settings = task
+    board = opening.board()
+    gs = ChessEngine.GameState(board.fen())
+    searcher = ChessAI.Searcher(maxDepth=settings["engineDepth"], timeLimit=settings["engineTime"],
+                                tt=TranspositionTable())
+    workerEngine.new_game()
+    times = {"engine": [], "stockfish": []}
+    nodes = 0
+    result = None
+    termination = None
+    while result is None:
+        engineTurn = board.turn == (chess.WHITE if engineWhite else chess.BLACK)
+        start = time.perf_counter()
+        if engineTurn:
+            searchResult = searcher.search(gs)
+            uci = searchResult.bestMove.get_chess_notation() if searchResult.bestMove is not None else None
+            nodes += searchResult.nodes
+        else:
+            uci = workerEngine.get_best_move(board.root().fen(), [move.uci() for move in board.move_stack],
+                                             depth=settings["stockfishDepth"], movetime=settings["stockfishTime"])
+        times["engine" if engineTurn else "stockfish"].append(time.perf_counter() - start)
+
+        move = chess.Move.from_uci(uci) if uci else None
+        if move is None or move not in board.legal_moves: # An illegal move loses
+            result = "0-1" if board.turn == chess.WHITE else "1-0"
+            termination = f"illegal move {uci} by {'the built-in engine' if engineTurn else 'Stockfish'}"
+            break
+        board.push(move)
+        gs.make_move(uci_to_move(gs, uci))
+        outcome = board.outcome(claim_draw=True)
+        if outcome is not None:
+            result = outcome.result()
+            termination = outcome.termination.name.lower().replace("_", " ")
+        elif len(board.move_stack) - len(opening.moves) >= settings["maxPlies"]:
+            result = "1/2-1/2"
+            termination = "adjudicated draw (move limit)"
+
+    game = chess.pgn.Game.from_board(board)
+    game.headers["Event"] = "ChessAI vs Stockfish"
+    game.headers["Round"] = str(number)
+    game.headers["White"] = ENGINE_NAME if engineWhite else settings["stockfishName"]
+    game.headers["Black"] = settings["stockfishName"] if engineWhite else ENGINE_NAME
+    game.headers["Result"] = result
+    game.headers["Termination"] = termination
+    points = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}[result]
+    return {"number": number, "score": points if engineWhite else 1.0 - points, "pgn": str(game),
+            "engineTimes": times["engine"], "stockfishTimes": times["stockfish"], "nodes": nodes}
+
+# GameState move for a UCI string (the generated move knows castling, en passant and the promotion piece)
+def uci_to_move(gs, uci):
+    for move in gs.get_valid_moves():
+        if move.get_chess_notation() == uci:
+            return move
+    raise ValueError(f"{uci} is not a legal move in {gs.get_fen()}")
+
+"""
+Statistics
+"""
+class MatchStats():
+    def __init__(self):
+        self.wins = 0           # From the built-in engine's point of view
+        self.draws = 0
+        self.losses = 0
+        self.engineTimes = []
+        self.stockfishTimes = []
+        self.nodes = 0
+
+    @property
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+    def add(self, game):
+        if game["score"] == 1.0:
+            self.wins += 1
+        elif game["score"] == 0.0:
+            self.losses += 1
+        else:
+            self.draws += 1
+        self.engineTimes.extend(game["engineTimes"])
+        self.stockfishTimes.extend(game["stockfishTimes"])
+        self.nodes += game["nodes"]
+
+    # (mean score, variance of the score of one game)
+    def score(self):
+        games = self.games
+        mean = (self.wins + 0.5 * self.draws) / games
+        variance = (self.wins * (1 - mean) ** 2 + self.draws * (0.5 - mean) ** 2 + self.losses * mean ** 2) / games
+        return mean, variance
+
+    # Elo difference and the half width of its 95% confidence interval (None while it is unbounded)
+    def elo(self):
+        if self.games == 0:
+            return 0.0, None
+        mean, variance = self.score()
+        margin = 1.96 * math.sqrt(variance / self.games)
+        if mean - margin <= 0 or mean + margin >= 1:
+            return elo_from_score(mean), None
+        return elo_from_score(mean), (elo_from_score(mean + margin) - elo_from_score(mean - margin)) / 2
+
+    # Log-likelihood ratio of H1 (elo1) against H0 (elo0), from the normal approximation of the trinomial results
+    def llr(self, elo0, elo1):
+        if self.games == 0:
+            return 0.0
+        mean, variance = self.score()
+        if variance == 0:
+            return 0.0
+        score0, score1 = score_from_elo(elo0), score_from_elo(elo1)
+        return self.games * (score1 - score0) * (2 * mean - score0 - score1) / (2 * variance)
+
+def elo_from_score(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+def score_from_elo(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+# (lower bound, upper bound) of the LLR: below accepts H0, above accepts H1
+def sprt_bounds(alpha, beta):
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+def sprt_state(stats, sprt):
+    elo0, elo1, alpha, beta = sprt
+    llr = stats.llr(elo0, elo1)
+    lower, upper = sprt_bounds(alpha, beta)
+    if llr <= lower:
+        return llr, lower, upper, "H0 accepted"
+    if llr >= upper:
+        return llr, lower, upper, "H1 accepted"
+    return llr, lower, upper, "continue"
+
+"""
+Running the match
+"""
+def stockfish_parameters(skill=None, elo=None):
+    parameters = {"Threads": 1, "Hash": 16}
+    if elo is not None:
+        parameters.update({"UCI_LimitStrength": True, "UCI_Elo": elo})
+    else:
+        parameters.update({"UCI_LimitStrength": False, "Skill Level": 20 if skill is None else skill})
+    return parameters
+
+# Play the games (the openings in turn, each twice with the colours swapped), writing every game to the PGN file
+# as it finishes. With sprt (elo0, elo1, alpha, beta) no more games are started once a hypothesis is accepted
+def run_match(games=DEFAULT_GAMES, workers=None, openings=None, pgnPath=None, enginePath=None, skill=None, elo=None,
+              engineTime=DEFAULT_ENGINE_TIME, engineDepth=ChessAI.MAX_DEPTH, stockfishTime=DEFAULT_STOCKFISH_TIME,
+              stockfishDepth=None, maxPlies=DEFAULT_MAX_PLIES, sprt=None, onGame=None):
+    workers = workers or os.cpu_count() or 1
+    openings = openings or [Opening(moves=line.split()) for line in OPENINGS]
+    settings = {"engineTime": engineTime, "engineDepth": engineDepth, "stockfishTime": stockfishTime,
+                "stockfishDepth": stockfishDepth, "maxPlies": maxPlies,
+                "stockfishName": f"Stockfish (Elo {elo})" if elo is not None else f"Stockfish (Skill {20 if skill is None else skill})"}
+    tasks = ((number, openings[(number - 1) // 2 % len(openings)], number % 2 == 1, settings)
+             for number in range(1, games + 1))
+    stats = MatchStats()
+    pgnFile = open(pgnPath, "a") if pgnPath else None
+    # Stockfish is limited to one thread per worker, the workers already use the cores
+    pool = multiprocessing.Pool(workers, init_worker, (enginePath, stockfish_parameters(skill, elo)))
+    try:
+        for game in pool.imap_unordered(play_game, tasks):
+            stats.add(game)
+            if pgnFile is not None:
+                pgnFile.write(game["pgn"] + "\n\n")
+                pgnFile.flush()
+            if onGame is not None:
+                onGame(game, stats)
+            if sprt is not None and sprt_state(stats, sprt)[3] != "continue":
+                break # Games still running are thrown away
+    finally:
+        pool.terminate()
+        pool.join()
+        if pgnFile is not None:
+            pgnFile.close()
+    return stats
+
+def print_progress(game, stats):
+    elo, margin = stats.elo()
+    errorBar = f"+/- {margin:.0f}" if margin is not None else "+/- inf"
+    print(f"Game {game['number']:>4}: {['loss', 'draw', 'win'][int(game['score'] * 2)]:<5} "
+          f"W {stats.wins} D {stats.draws} L {stats.losses}  Elo {elo:+.0f} {errorBar}", flush=True)
+
+def print_report(stats, sprt=None, elo=None):
+    print(f"\nGames: {stats.games}  (W {stats.wins} / D {stats.draws} / L {stats.losses} for {ENGINE_NAME})")
+    if stats.games == 0:
+        return
+    mean, _ = stats.score()
+    diff, margin = stats.elo()
+    errorBar = f"+/- {margin:.0f}" if margin is not None else "+/- inf"
+    print(f"Score: {100 * mean:.1f}%   Elo difference: {diff:+.1f} {errorBar} (95%)")
+    if elo is not None:
+        print(f"Estimated rating of {ENGINE_NAME}: {elo + diff:.0f}")
+    if sprt is not None:
+        llr, lower, upper, state = sprt_state(stats, sprt)
+        print(f"SPRT elo0={sprt[0]} elo1={sprt[1]} alpha={sprt[2]} beta={sprt[3]}: "
+              f"LLR {llr:.2f} [{lower:.2f}, {upper:.2f}] {state}")
+    engineMoves, stockfishMoves = len(stats.engineTimes), len(stats.stockfishTimes)
+    if engineMoves:
+        engineTime = sum(stats.engineTimes)
+        nps = int(stats.nodes / engineTime) if engineTime > 0 else 0
+        print(f"{ENGINE_NAME}: {engineMoves} moves, {1000 * engineTime / engineMoves:.1f} ms/move, {nps} nps")
+    if stockfishMoves:
+        print(f"Stockfish: {stockfishMoves} moves, {1000 * sum(stats.stockfishTimes) / stockfishMoves:.1f} ms/move")
+
+def main():
+    parser = argparse.ArgumentParser(description="Play the built-in engine against a limited Stockfish")
+    parser.add_argument("--games", type=int, default=DEFAULT_GAMES, help="number of games")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="games played at the same time")
+    strength = parser.add_mutually_exclusive_group()
+    strength.add_argument("--skill", type=int, help="Stockfish Skill Level 0-20 (default 20)")
+    strength.add_argument("--elo", type=int, help="Stockfish UCI_Elo (limits the strength to this rating)")
+    parser.add_argument("--engine-time", type=float, default=DEFAULT_ENGINE_TIME, help="seconds per move of ChessAI")
+    parser.add_argument("--engine-depth", type=int, default=ChessAI.MAX_DEPTH, help="deepest search of ChessAI")
+    parser.add_argument("--stockfish-time", type=int, default=DEFAULT_STOCKFISH_TIME, help="ms per move of Stockfish")
+    parser.add_argument("--stockfish-depth", type=int, help="search depth of Stockfish (instead of a time)")
+    parser.add_argument("--max-plies", type=int, default=DEFAULT_MAX_PLIES, help="adjudicate a draw after this")
+    parser.add_argument("--openings", help="opening suite: a PGN file, or one FEN or line of UCI moves per line")
+    parser.add_argument("--opening-plies", type=int, default=DEFAULT_OPENING_PLIES, help="plies of a PGN opening")
+    parser.add_argument("--pgn", default="match.pgn", help="PGN file the games are appended to")
+    parser.add_argument("--stockfish", help="engine path or command (default: STOCKFISH_PATH or stockfish)")
+    parser.add_argument("--sprt", nargs=2, type=float, metavar=("ELO0", "ELO1"),
+                        help="stop once an SPRT of H0: elo = ELO0 against H1: elo = ELO1 is decided")
+    parser.add_argument("--sprt-alpha", type=float, default=0.05, help="SPRT false positive rate")
+    parser.add_argument("--sprt-beta", type=float, default=0.05, help="SPRT false negative rate")
+    args = parser.parse_args()
+
+    openings = load_openings(args.openings, args.opening_plies) if args.openings else None
+    sprt = (args.sprt[0], args.sprt[1], args.sprt_alpha, args.sprt_beta) if args.sprt else None
+    stats = run_match(args.games, args.workers, openings, args.pgn, args.stockfish, args.skill, args.elo,
+                      args.engine_time, args.engine_depth, args.stockfish_time if args.stockfish_depth is None else None,
+                      args.stockfish_depth, args.max_plies, sprt, onGame=print_progress)
+    print_report(stats, sprt, args.elo)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Fake UCI engine for the EnginePool tests: answers uci/isready/position/go/stop/quit like Stockfish, without searching.
+
+    python tests/fake_uci.py --score "mate 3" --delay 0.05 --crash-once /tmp/marker
+
+--score         score of every info line, from the side to move ("cp 30", "mate -2")
+--delay         seconds between two info lines, a search is stopped by "stop" in between
+--crash-once    exit in the middle of the first go (the file is created so only one engine crashes)
+"""
+
+import argparse
+import os
+import queue
+import sys
+import threading
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--score", default="cp 30")
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--crash-once")
+    args = parser.parse_args()
+
+    # Commands are read on a thread, so stop arrives while a search prints its info lines
+    commands = queue.Queue()
+    def read_commands():
+        for line in sys.stdin:
+            commands.put(line.strip())
+        commands.put("quit")
+    threading.Thread(target=read_commands, daemon=True).start()
+
+    def send(line):
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+    while True:
+        command = commands.get()
+        if command == "uci":
+            send("id name FakeFish 1")
+            send("uciok")
+        elif command == "isready":
+            send("readyok")
+        elif command.startswith("go"):
+            tokens = command.split()
+            depth = int(tokens[tokens.index("depth") + 1]) if "depth" in tokens else 5
+            if args.crash_once and not os.path.exists(args.crash_once):
+                open(args.crash_once, "w").close()
+                send("info depth 1 score cp 0 pv e2e4")
+                os._exit(1)
+            for d in range(1, depth + 1):
+                send(f"info depth {d} seldepth {d} multipv 1 score {args.score} nodes {100 * d} nps 1000 time {d} "
+                     "pv e2e4 e7e5")
+                if args.delay:
+                    try:
+                        if commands.get(timeout=args.delay) == "stop":
+                            break
+                    except queue.Empty:
+                        pass
+            send("bestmove e2e4 ponder e7e5")
+        elif command == "quit":
+            return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+EnginePool, UCIEngine and AnalysisThread against the fake UCI engine in fake_uci.py.
+"""
+
+import os
+import sys
+import time
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(TESTS_DIR, "..", "Chess"))
+import EnginePool
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+BLACK_FEN = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+
+def fake_pool(*args, size=1):
+    command = [sys.executable, os.path.join(TESTS_DIR, "fake_uci.py"), *args]
+    return EnginePool.EnginePool(command, size=size, parameters={}, depth=3, cache=False)
+
+@pytest.fixture
+def make_pool():
+    pools = []
+    def make(*args, **kwargs):
+        pool = fake_pool(*args, **kwargs)
+        pools.append(pool)
+        return pool
+    yield make
+    for pool in pools:
+        pool.close()
+
+# Poll until condition() is true, fail after timeout seconds
+def wait_for(condition, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.01)
+
+def test_parse_info():
+    info = EnginePool.parse_info("info depth 12 seldepth 18 multipv 1 score cp -35 upperbound nodes 5000 pv e2e4 e7e5")
+    assert info == {"depth": 12, "seldepth": 18, "multipv": 1, "score": {"type": "cp", "value": -35, "bound": "upperbound"},
+                    "nodes": 5000, "pv": ["e2e4", "e7e5"]}
+
+def test_centipawn_evaluation(make_pool):
+    pool = make_pool("--score", "cp 30")
+    assert pool.get_evaluation(START_FEN) == {"type": "cp", "value": 30}
+    assert pool.engine_name() == "FakeFish 1"
+
+def test_mate_evaluation(make_pool):
+    pool = make_pool("--score", "mate 3")
+    assert pool.get_evaluation(START_FEN) == {"type": "mate", "value": 3}
+
+def test_black_to_move_is_turned_to_white_point_of_view(make_pool):
+    assert make_pool("--score", "cp 30").get_evaluation(BLACK_FEN) == {"type": "cp", "value": -30}
+    assert make_pool("--score", "mate 2").get_evaluation(BLACK_FEN) == {"type": "mate", "value": -2}
+
+def test_engine_killed_while_idle_is_restarted(make_pool):
+    pool = make_pool()
+    pool.get_evaluation(START_FEN)
+    engine = pool.engines[0]
+    oldPid = engine.process.pid
+    engine.process.kill()
+    engine.process.wait()
+    assert pool.get_evaluation(START_FEN) == {"type": "cp", "value": 30}
+    assert engine.is_alive() and engine.process.pid != oldPid
+    assert len(pool.engines) == 1
+
+def test_engine_crashing_during_a_search_is_retried(make_pool, tmp_path):
+    marker = tmp_path / "crashed"
+    pool = make_pool("--crash-once", str(marker))
+    assert pool.get_evaluation(START_FEN) == {"type": "cp", "value": 30}
+    assert marker.exists() # The first search really crashed
+    assert pool.engines[0].is_alive()
+
+def test_analysis_replaces_the_position(make_pool):
+    pool = make_pool("--score", "cp 30", "--delay", "0.02")
+    analysis = EnginePool.AnalysisThread(pool, depth=1000) # Searches until it is stopped
+    analysis.start()
+    try:
+        analysis.analyse(START_FEN)
+        wait_for(lambda: analysis.get_result() is not None)
+        assert analysis.get_result()[:2] == (START_FEN, {"type": "cp", "value": 30})
+
+        analysis.analyse(BLACK_FEN)
+        assert analysis.get_result() is None # The old position's result is gone right away
+        # One engine: the new position is only searched once the old search was stopped
+        wait_for(lambda: analysis.get_result() is not None)
+        result = analysis.get_result()
+        assert result[:2] == (BLACK_FEN, {"type": "cp", "value": -30})
+        wait_for(lambda: analysis.get_result()[2] > result[2]) # Deeper results keep coming for the new position
+        assert analysis.get_result()[0] == BLACK_FEN
+    finally:
+        analysis.close()
+    analysis.join(timeout=5)
+    assert not analysis.is_alive() # close() stopped the running search
+    assert pool.engines[0].is_alive() and pool.idle.qsize() == 1 # and the engine went back to the pool
@@ -0,0 +1,71 @@
+"""
+EvalCache: the disk LRU sees hits answered from the in-memory layer, and the memory never hides a deeper result
+on disk.
+"""
+
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Chess"))
+import EvalCache
+
+ENGINE = "FakeFish 1"
+OLD_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+NEW_FEN = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+EVALUATION = {"type": "cp", "value": 30}
+
+def used(path, fen):
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT used FROM evaluations WHERE fen = ?", (EvalCache.normalize_fen(fen),)).fetchone()[0]
+
+def test_memory_hits_update_the_disk_use_time(tmp_path):
+    path = str(tmp_path / "evaluations.sqlite")
+    cache = EvalCache.EvalCache(path)
+    cache.put(OLD_FEN, ENGINE, 10, EVALUATION)
+    stored = used(path, OLD_FEN)
+    time.sleep(0.01)
+    assert cache.get(OLD_FEN, ENGINE, 10) == (10, EVALUATION) # From memory
+    cache.close()
+    assert used(path, OLD_FEN) > stored
+
+def test_position_used_from_memory_is_not_evicted_first(tmp_path):
+    path = str(tmp_path / "evaluations.sqlite")
+    cache = EvalCache.EvalCache(path)
+    cache.put(OLD_FEN, ENGINE, 10, EVALUATION)
+    time.sleep(0.01)
+    cache.put(NEW_FEN, ENGINE, 10, EVALUATION)
+    time.sleep(0.01)
+    cache.get(OLD_FEN, ENGINE, 10) # Only a memory hit, the older position is now the most recently used
+    cache.close()
+
+    reopened = EvalCache.EvalCache(path, maxEntries=1)
+    reopened.evict()
+    assert reopened.get(OLD_FEN, ENGINE, 10) == (10, EVALUATION)
+    assert reopened.get(NEW_FEN, ENGINE, 1) is None
+    reopened.close()
+
+def test_shallow_memory_entry_falls_back_to_a_deeper_disk_row(tmp_path):
+    path = str(tmp_path / "evaluations.sqlite")
+    cache = EvalCache.EvalCache(path)
+    other = EvalCache.EvalCache(path) # Another process
+    cache.put(OLD_FEN, ENGINE, 10, EVALUATION)
+    other.put(OLD_FEN, ENGINE, 20, {"type": "cp", "value": 45})
+    assert cache.get(OLD_FEN, ENGINE, 20) == (20, {"type": "cp", "value": 45})
+    assert cache.memory[(EvalCache.normalize_fen(OLD_FEN), ENGINE)][0] == 20 # Kept in memory from now on
+    assert cache.get(OLD_FEN, ENGINE, 25) is None
+    other.close()
+    cache.close()
+
+def test_put_after_an_eviction_keeps_the_deeper_disk_row(tmp_path):
+    path = str(tmp_path / "evaluations.sqlite")
+    cache = EvalCache.EvalCache(path, memoryEntries=1)
+    cache.put(OLD_FEN, ENGINE, 20, EVALUATION)
+    cache.put(NEW_FEN, ENGINE, 10, EVALUATION) # Evicts OLD_FEN from memory
+    cache.put(OLD_FEN, ENGINE, 5, {"type": "cp", "value": -80})
+    assert cache.get(OLD_FEN, ENGINE, 20) == (20, EVALUATION)
+    cache.close()
+    reopened = EvalCache.EvalCache(path)
+    assert reopened.get(OLD_FEN, ENGINE, 20) == (20, EVALUATION)
+    reopened.close()
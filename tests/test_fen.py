@@ -0,0 +1,72 @@
+"""
+Fen: encode/decode round trips (against python-chess) and the FENs decode turns down.
+"""
+
+import os
+import sys
+import pytest
+import chess
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Chess"))
+import ChessEngine
+import Fen
+
+FENS = [
+    Fen.START_FEN,
+    "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1",
+    "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3",             # En passant square
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w Kq - 5 17",         # Some castling rights
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 49 80",                                 # No castling rights
+    "rnbqkbnr/pppp1ppp/8/8/3Pp3/8/PPP1PPPP/RNBQKBNR b KQkq d3 0 2",               # Black takes en passant
+]
+
+@pytest.mark.parametrize("fen", FENS)
+def test_round_trip(fen):
+    assert Fen.encode(*Fen.decode(fen)) == fen
+    assert ChessEngine.GameState(fen).get_fen() == chess.Board(fen).fen() == fen
+
+def test_round_trip_of_a_game():
+    gs = ChessEngine.GameState()
+    board = chess.Board()
+    for uci in ["e2e4", "c7c5", "e4e5", "d7d5", "e5d6", "b8c6", "g1f3", "e7d6", "f1b5", "f8e7", "e1g1", "g8f6",
+                "b1c3", "e8g8"]:
+        move = next(move for move in gs.get_valid_moves() if move.get_chess_notation() == uci)
+        gs.make_move(move)
+        board.push_uci(uci)
+        assert gs.get_fen() == board.fen()
+        assert Fen.encode(*Fen.decode(gs.get_fen())) == gs.get_fen()
+
+def test_lists_of_fens():
+    boards, whiteToMove, castling, enpassant, halfmove, fullmove = Fen.decode_many(FENS)
+    assert boards.shape == (len(FENS), 64)
+    assert Fen.encode_many(boards, whiteToMove, castling, enpassant, halfmove, fullmove) == FENS
+
+@pytest.mark.parametrize("enpassant", ["e3", "c6", "e6", "i6", "f"]) # Wrong rank for the side, no pawn, no square
+def test_bad_enpassant_square(enpassant):
+    with pytest.raises(ValueError, match="en passant"):
+        Fen.decode(f"rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq {enpassant} 0 3")
+
+@pytest.mark.parametrize("castling", ["KX", "kq-", "w"])
+def test_bad_castling_rights(castling):
+    with pytest.raises(ValueError, match="castling"):
+        Fen.decode(f"r3k2r/8/8/8/8/8/8/R3K2R w {castling} - 0 1")
+
+@pytest.mark.parametrize("counters", ["x 1", "0 y", "-1 1", "0 -3", "1.5 2"])
+def test_bad_move_counters(counters):
+    with pytest.raises(ValueError, match="counters"):
+        Fen.decode(f"{Fen.START_FEN.rsplit(' ', 2)[0]} {counters}")
+
+@pytest.mark.parametrize("fen", ["", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP w",
+                                 "rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR",
+                                 "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNX", f"{Fen.START_FEN.split()[0]} x"])
+def test_bad_fen(fen):
+    with pytest.raises(ValueError):
+        Fen.decode(fen)
+
+def test_rank_caches_stay_bounded(monkeypatch):
+    monkeypatch.setattr(Fen, "MAX_CACHED_RANKS", 4)
+    monkeypatch.setattr(Fen, "rankTexts", {})
+    monkeypatch.setattr(Fen, "rankBytes", {})
+    for fen in FENS:
+        assert Fen.encode(*Fen.decode(fen)) == fen
+    assert len(Fen.rankTexts) <= 4 and len(Fen.rankBytes) <= 4
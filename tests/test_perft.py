@@ -0,0 +1,26 @@
+"""
+Perft node counts of the reference positions in Perft.py up to depth 3, with the default and the bitboard move
+generator. The deeper counts are left to python Chess/Perft.py --suite.
+"""
+
+import os
+import sys
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Chess"))
+import ChessEngine
+import Perft
+
+MAX_DEPTH = 3
+
+CASES = [(name, fen, depth, expected) for name, fen, counts in Perft.POSITIONS
+         for depth, expected in enumerate(counts[:MAX_DEPTH], start=1)]
+
+@pytest.mark.parametrize("bitboards", [False, True], ids=["default", "bitboards"])
+@pytest.mark.parametrize("name, fen, depth, expected", CASES, ids=[f"{case[0]} depth {case[2]}" for case in CASES])
+def test_perft(name, fen, depth, expected, bitboards):
+    gs = ChessEngine.GameState(fen)
+    if bitboards:
+        gs.use_bitboards()
+    assert Perft.perft(gs, depth) == expected
+    assert gs.get_fen() == ChessEngine.GameState(fen).get_fen() # Every move was taken back
@@ -0,0 +1,81 @@
+"""
+pgn_file_evaluation: a run that is killed midway and resumed writes the same CSV file as a run that wasn't, against
+the fake UCI engine in fake_uci.py.
+"""
+
+import os
+import sys
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(TESTS_DIR, "..", "Stockfish", "Evaluation"))
+import pgn_file_evaluation
+
+ENGINE = [sys.executable, os.path.join(TESTS_DIR, "fake_uci.py")]
+GAMES = ["1. e4 e5 2. Nf3 Nc6 3. Bb5 a6 1-0", "1. d4 d5 2. c4 e6 1/2-1/2", "1. e4 c5 2. Nf3 d6 3. d4 0-1",
+         "1. c4 e5 1-0", "1. Nf3 d5 2. g3 Nf6 3. Bg2 c6 1/2-1/2"]
+
+class Killed(Exception):
+    pass
+
+@pytest.fixture
+def pgn(tmp_path):
+    path = tmp_path / "games.pgn"
+    path.write_text("".join(f'[Event "Game {number}"]\n[Result "{moves.split()[-1]}"]\n\n{moves}\n\n'
+                            for number, moves in enumerate(GAMES, start=1)))
+    return str(path)
+
+def evaluate(pgn, output):
+    return pgn_file_evaluation.evaluate_files([pgn], output, workers=2, depth=3, enginePath=ENGINE, cachePath=False,
+                                              batchSize=1)
+
+# Let the run write batches games, then kill it
+def kill_after(monkeypatch, batches):
+    taskBatches = pgn_file_evaluation.task_batches
+    def killed_batches(*args, **kwargs):
+        for count, batch in enumerate(taskBatches(*args, **kwargs)):
+            if count == batches:
+                raise Killed()
+            yield batch
+    monkeypatch.setattr(pgn_file_evaluation, "task_batches", killed_batches)
+
+@pytest.fixture
+def expected(pgn, tmp_path):
+    output = str(tmp_path / "expected.csv")
+    assert evaluate(pgn, output) == len(GAMES)
+    with open(output) as csvFile:
+        return csvFile.read()
+
+def test_resumed_run_writes_the_same_file(pgn, tmp_path, monkeypatch, expected):
+    output = str(tmp_path / "evaluations.csv")
+    kill_after(monkeypatch, 2)
+    with pytest.raises(Killed):
+        evaluate(pgn, output)
+    monkeypatch.undo()
+    assert evaluate(pgn, output) == len(GAMES) - 2
+    with open(output) as csvFile:
+        assert csvFile.read() == expected
+    assert evaluate(pgn, output) == 0 # Nothing left to do
+
+def test_rows_and_checkpoint_line_cut_off_by_a_crash_are_written_again(pgn, tmp_path, monkeypatch, expected):
+    output = str(tmp_path / "evaluations.csv")
+    kill_after(monkeypatch, 3)
+    with pytest.raises(Killed):
+        evaluate(pgn, output)
+    monkeypatch.undo()
+    # Killed after the rows of the next game, before its checkpoint line was complete
+    with open(output, "a") as csvFile:
+        csvFile.write(expected.splitlines(keepends=True)[-1])
+    with open(output + ".checkpoint", "a") as checkpoint:
+        checkpoint.write(f"{pgn}\t4")
+    assert evaluate(pgn, output) == len(GAMES) - 3
+    with open(output) as csvFile:
+        assert csvFile.read() == expected
+
+def test_csv_file_without_checkpoint_is_written_again(pgn, tmp_path, expected):
+    output = str(tmp_path / "evaluations.csv")
+    assert evaluate(pgn, output) == len(GAMES)
+    os.remove(output + ".checkpoint")
+    assert evaluate(pgn, output) == len(GAMES)
+    with open(output) as csvFile:
+        assert csvFile.read() == expected
@@ -0,0 +1,99 @@
+"""
+PGNIndex: games appended to an indexed file are found by scanning only the new part, and the last game of a file is
+read (or reported missing) without an IndexError.
+"""
+
+import os
+import sys
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(TESTS_DIR, "..", "Chess"))
+sys.path.append(os.path.join(TESTS_DIR, "..", "Stockfish", "Evaluation"))
+import PGNIndex
+import pgn_file_evaluation
+
+def game_text(white, black, moves, result):
+    return f'[Event "Live Chess"]\n[White "{white}"]\n[Black "{black}"]\n[Result "{result}"]\n\n{moves} {result}\n\n'
+
+GAMES = [game_text("alice", "bob", "1. e4 e5 2. Nf3 Nc6", "1-0"), game_text("bob", "carol", "1. d4 d5", "0-1"),
+         game_text("carol", "alice", "1. c4 e5 2. Nc3", "1/2-1/2")]
+
+# Records where every scan of the file starts
+class ScanSpy():
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.starts = []
+
+    def finditer(self, data, start=0):
+        self.starts.append(start)
+        return self.pattern.finditer(data, start)
+
+    def match(self, data, pos=0):
+        return self.pattern.match(data, pos)
+
+def headers(index):
+    return [(entry.offset, entry.length, entry.headers) for entry in index]
+
+def test_appended_games_are_found_by_scanning_from_the_last_game(tmp_path, monkeypatch):
+    path = str(tmp_path / "games.pgn")
+    with open(path, "w") as pgn:
+        pgn.write("".join(GAMES[:2]))
+    with PGNIndex.PGNIndex(path) as index:
+        assert [entry.headers["White"] for entry in index] == ["alice", "bob"]
+        lastOffset = index[-1].offset
+    assert os.path.exists(path + ".idx")
+
+    with open(path, "a") as pgn:
+        pgn.write(GAMES[2])
+    spy = ScanSpy(PGNIndex.TAG_PATTERN)
+    monkeypatch.setattr(PGNIndex, "TAG_PATTERN", spy)
+    with PGNIndex.PGNIndex(path) as index:
+        assert spy.starts == [lastOffset] # Only the last indexed game and what follows it
+        assert [entry.headers["White"] for entry in index] == ["alice", "bob", "carol"]
+        assert [entry.number for entry in index] == [0, 1, 2]
+        assert str(index.read_game(2).mainline_moves()) == "1. c4 e5 2. Nc3"
+        rescanned = headers(index)
+    monkeypatch.undo()
+
+    os.remove(path + ".idx")
+    with PGNIndex.PGNIndex(path, save=False) as index:
+        assert headers(index) == rescanned # The same as a scan of the whole file
+
+def test_unchanged_file_is_not_scanned_again(tmp_path, monkeypatch):
+    path = str(tmp_path / "games.pgn")
+    with open(path, "w") as pgn:
+        pgn.write("".join(GAMES))
+    PGNIndex.PGNIndex(path).close()
+    spy = ScanSpy(PGNIndex.TAG_PATTERN)
+    monkeypatch.setattr(PGNIndex, "TAG_PATTERN", spy)
+    with PGNIndex.PGNIndex(path) as index:
+        assert len(index) == 3 and spy.starts == []
+
+def test_read_last_game(tmp_path):
+    path = str(tmp_path / "games.pgn")
+    with open(path, "w") as pgn:
+        pgn.write(GAMES[0])
+    assert PGNIndex.read_last_game(path).headers["Black"] == "bob"
+    with open(path, "a") as pgn:
+        pgn.write(GAMES[1])
+    assert PGNIndex.read_last_game(path).headers["Black"] == "carol"
+
+@pytest.mark.parametrize("content", [None, "", "\n\n"], ids=["missing", "empty", "blank"])
+def test_read_last_game_of_a_file_without_games(tmp_path, content):
+    path = str(tmp_path / "games.pgn")
+    if content is not None:
+        with open(path, "w") as pgn:
+            pgn.write(content)
+    assert PGNIndex.read_last_game(path) is None
+
+def test_latest_game_of_a_file_without_games_is_reported(tmp_path, monkeypatch, capsys):
+    (tmp_path / "PGNs").mkdir()
+    (tmp_path / "PGNs" / "nobody_latest_game.pgn").write_text("")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("builtins.input", lambda prompt: "nobody")
+    def no_engine(**kwargs):
+        raise AssertionError("the engine was started")
+    monkeypatch.setattr(pgn_file_evaluation.EnginePool, "get_pool", no_engine)
+    pgn_file_evaluation.evaluate_latest_game()
+    assert "No games in PGNs/nobody_latest_game.pgn" in capsys.readouterr().out
@@ -0,0 +1,224 @@
+"""
+ArchiveSync against a stub of the Chess.com API (http.server on a thread) that serves the archives with an ETag and
+a Last-Modified and answers 304 Not Modified to conditional requests for archives that didn't change. It can also
+fail the first requests of a path (429 or 5xx), to check the retries.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Chess.com_API"))
+import sync_archives
+
+USERNAME = "frottorii"
+
+def game(n):
+    return {"pgn": f'[Event "Game {n}"]\n\n1. e4 e5 *'}
+
+class StubApi():
+    def __init__(self):
+        self.archives = {}      # month ("2024/01") -> [game, ...]
+        self.versions = {}      # month -> version, part of the ETag and the Last-Modified
+        self.requests = []      # (path, If-None-Match, If-Modified-Since) of every request
+        self.failures = {}      # path -> [(status, Retry-After or None), ...] answered before the real response
+        self.lock = threading.Lock()
+
+    def set_month(self, month, games):
+        self.archives[month] = games
+        self.versions[month] = self.versions.get(month, 0) + 1
+
+    def archive_path(self, month):
+        return f"/pub/player/{USERNAME}/games/{month}"
+
+    # URL of the archive as the API lists it (the key of the sync state)
+    def archive_url(self, month):
+        return self.baseUrl + self.archive_path(month)[len("/pub"):]
+
+    def validators(self, month):
+        version = self.versions[month]
+        return f'"{month}-{version}"', f"Mon, {version:02d} Jan 2024 00:00:00 GMT"
+
+    def handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with api.lock:
+                    api.requests.append((self.path, self.headers.get("If-None-Match"),
+                                         self.headers.get("If-Modified-Since")))
+                    failures = api.failures.get(self.path)
+                    failure = failures.pop(0) if failures else None
+                if failure is not None:
+                    status, retryAfter = failure
+                    self.send_response(status)
+                    if retryAfter is not None:
+                        self.send_header("Retry-After", retryAfter)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if self.path == f"/pub/player/{USERNAME}/games/archives":
+                    base = f"http://{self.headers['Host']}"
+                    self.send_json({"archives": [base + api.archive_path(month) for month in sorted(api.archives)]})
+                    return
+                for month in api.archives:
+                    if self.path == api.archive_path(month):
+                        etag, lastModified = api.validators(month)
+                        if self.headers.get("If-None-Match") == etag:
+                            self.send_response(304)
+                            self.end_headers()
+                        else:
+                            self.send_json({"games": api.archives[month]}, {"ETag": etag, "Last-Modified": lastModified})
+                        return
+                self.send_error(404)
+
+            def send_json(self, data, headers={}):
+                body = json.dumps(data).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+@pytest.fixture
+def api():
+    stub = StubApi()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), stub.handler())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    stub.baseUrl = f"http://127.0.0.1:{server.server_address[1]}/pub"
+    yield stub
+    server.shutdown()
+    server.server_close()
+
+def run_sync(api, outputDir):
+    sync = sync_archives.ArchiveSync(str(outputDir), api.baseUrl, workers=2, rate=0)
+    api.requests.clear()
+    newGames = sync.sync([USERNAME])[USERNAME]
+    archiveRequests = [request for request in api.requests if not request[0].endswith("/archives")]
+    return sync, newGames, archiveRequests
+
+def read_games(outputDir):
+    with open(os.path.join(outputDir, f"{USERNAME}.pgn")) as pgnFile:
+        return [line for line in pgnFile.read().splitlines() if line.startswith("[Event")]
+
+def read_state(outputDir):
+    with open(os.path.join(outputDir, sync_archives.STATE_FILE)) as stateFile:
+        return json.load(stateFile)
+
+def test_sync_downloads_only_what_changed(api, tmp_path):
+    api.set_month("2024/01", [game(1), game(2)])
+    api.set_month("2024/02", [game(3)])
+
+    # First sync: every game, unconditional requests
+    sync, newGames, archiveRequests = run_sync(api, tmp_path)
+    assert newGames == 3
+    assert read_games(tmp_path) == ['[Event "Game 1"]', '[Event "Game 2"]', '[Event "Game 3"]']
+    assert all(etag is None and modified is None for _, etag, modified in archiveRequests)
+    state = read_state(tmp_path)[USERNAME]
+    for month, games in (("2024/01", 2), ("2024/02", 1)):
+        etag, lastModified = api.validators(month)
+        assert state[api.archive_url(month)] == {"etag": etag, "lastModified": lastModified, "games": games}
+
+    # A new month: only its games are appended, the old months answer 304
+    api.set_month("2024/03", [game(4), game(5)])
+    sync, newGames, archiveRequests = run_sync(api, tmp_path)
+    assert newGames == 2
+    assert read_games(tmp_path)[3:] == ['[Event "Game 4"]', '[Event "Game 5"]']
+    assert len(read_games(tmp_path)) == 5
+    assert sync.notModified == 2
+    state = read_state(tmp_path)[USERNAME]
+    assert state[api.archive_url("2024/03")]["games"] == 2
+    assert state[api.archive_url("2024/03")]["etag"] == api.validators("2024/03")[0]
+
+    # Nothing changed: every archive is asked for conditionally, gets 304 and nothing is written
+    pgnBefore = (tmp_path / f"{USERNAME}.pgn").read_text()
+    stateBefore = read_state(tmp_path)
+    sync, newGames, archiveRequests = run_sync(api, tmp_path)
+    assert newGames == 0
+    assert len(archiveRequests) == 3 and sync.notModified == 3
+    for path, etag, modified in archiveRequests:
+        month = path.split("/games/")[1]
+        assert (etag, modified) == api.validators(month)
+    assert (tmp_path / f"{USERNAME}.pgn").read_text() == pgnBefore
+    assert read_state(tmp_path) == stateBefore
+
+def test_grown_archive_appends_only_the_new_games(api, tmp_path):
+    api.set_month("2024/01", [game(1)])
+    run_sync(api, tmp_path)
+    api.set_month("2024/01", [game(1), game(2)]) # The current month gets another game (and a new ETag)
+    sync, newGames, archiveRequests = run_sync(api, tmp_path)
+    assert newGames == 1
+    assert read_games(tmp_path) == ['[Event "Game 1"]', '[Event "Game 2"]']
+    assert read_state(tmp_path)[USERNAME][api.archive_url("2024/01")]["games"] == 2
+
+def pgn_text(*numbers):
+    return "".join(game(n)["pgn"] + "\n\n" for n in numbers)
+
+def test_games_written_before_a_crash_are_not_appended_again(api, tmp_path, monkeypatch):
+    api.set_month("2024/01", [game(1)])
+    run_sync(api, tmp_path)
+    api.set_month("2024/01", [game(1), game(2)])
+    api.set_month("2024/02", [game(3)])
+    def crash(sync):
+        raise OSError("killed")
+    monkeypatch.setattr(sync_archives.ArchiveSync, "save_state", crash)
+    with pytest.raises(OSError):
+        run_sync(api, tmp_path) # The games are appended, the state isn't written
+    monkeypatch.undo()
+    assert read_games(tmp_path) == ['[Event "Game 1"]', '[Event "Game 2"]', '[Event "Game 3"]']
+
+    sync, newGames, archiveRequests = run_sync(api, tmp_path)
+    assert newGames == 2
+    assert (tmp_path / f"{USERNAME}.pgn").read_text() == pgn_text(1, 2, 3)
+    state = read_state(tmp_path)[USERNAME]
+    assert state[api.archive_url("2024/01")]["games"] == 2 and state[api.archive_url("2024/02")]["games"] == 1
+    assert state["pgnSize"] == len(pgn_text(1, 2, 3))
+
+def test_game_cut_off_by_a_crash_is_written_again(api, tmp_path):
+    api.set_month("2024/01", [game(1)])
+    run_sync(api, tmp_path)
+    api.set_month("2024/01", [game(1), game(2), game(3)])
+    with open(tmp_path / f"{USERNAME}.pgn", "a") as pgnFile: # Killed in the middle of the third game
+        pgnFile.write(pgn_text(2) + pgn_text(3)[:10])
+    sync, newGames, archiveRequests = run_sync(api, tmp_path)
+    assert newGames == 2
+    assert (tmp_path / f"{USERNAME}.pgn").read_text() == pgn_text(1, 2, 3)
+
+def test_retries_go_through_the_rate_limiter(api, tmp_path):
+    api.set_month("2024/01", [game(1)])
+    api.failures[api.archive_path("2024/01")] = [(429, "1"), (503, None)]
+    sync = sync_archives.ArchiveSync(str(tmp_path), api.baseUrl, workers=2, rate=0)
+    waits = []
+    delays = []
+    sync.limiter.wait = lambda: waits.append(True)
+    sync.limiter.delay = delays.append # Recorded instead of slept
+    assert sync.sync([USERNAME]) == {USERNAME: 1}
+    assert len(api.requests) == len(waits) == sync.requests == 4 # The archive list, two failures and the archive
+    assert delays == [1.0, 2 * sync_archives.BACKOFF] # Retry-After, otherwise the backoff of the second retry
+
+def test_request_failing_every_retry_raises(api, tmp_path):
+    api.set_month("2024/01", [game(1)])
+    api.failures[api.archive_path("2024/01")] = [(503, "0")] * (sync_archives.MAX_RETRIES + 1)
+    sync = sync_archives.ArchiveSync(str(tmp_path), api.baseUrl, workers=2, rate=0)
+    with pytest.raises(sync_archives.requests.HTTPError):
+        sync.sync([USERNAME])
+    assert sync.requests == 1 + sync_archives.MAX_RETRIES + 1
+
+def test_delay_holds_back_the_rate_limiter():
+    limiter = sync_archives.RateLimiter(0)
+    limiter.delay(0.1)
+    start = time.monotonic()
+    limiter.wait()
+    assert time.monotonic() - start >= 0.09
@@ -0,0 +1,109 @@
+"""
+ChessUCI: commands go through UCIEngine.handle with the output written to a StringIO.
+"""
+
+import io
+import os
+import sys
+import threading
+import time
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Chess"))
+import ChessEngine
+import ChessUCI
+
+@pytest.fixture
+def engine():
+    uci = ChessUCI.UCIEngine(output=io.StringIO())
+    yield uci
+    uci.stop()
+
+def lines(engine):
+    return engine.output.getvalue().splitlines()
+
+# Run the command on a thread so a command that never returns fails the test instead of hanging it
+def handle(engine, line, timeout=10.0):
+    thread = threading.Thread(target=engine.handle, args=(line,), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), f"'{line}' didn't return"
+
+def fen_after(moves, fen=None):
+    gs = ChessEngine.GameState(fen)
+    for uci in moves:
+        gs.make_move(ChessUCI.find_move(gs, uci))
+    return gs.get_fen()
+
+def test_position_continuing_the_game_only_makes_the_new_moves(engine):
+    handle(engine, "position startpos moves e2e4 e7e5")
+    gs = engine.gs
+    played = list(gs.moveLog)
+    handle(engine, "position startpos moves e2e4 e7e5 g1f3 b8c6")
+    assert engine.gs is gs and gs.moveLog[:2] == played and all(a is b for a, b in zip(gs.moveLog, played))
+    assert engine.moves == ["e2e4", "e7e5", "g1f3", "b8c6"]
+    assert gs.get_fen() == fen_after(engine.moves)
+
+def test_position_take_back_undoes_only_the_moves_that_differ(engine):
+    handle(engine, "position startpos moves e2e4 e7e5 g1f3")
+    gs = engine.gs
+    first = gs.moveLog[0]
+    handle(engine, "position startpos moves e2e4 e7e5 b1c3")
+    assert engine.gs is gs and gs.moveLog[0] is first
+    assert gs.get_fen() == fen_after(["e2e4", "e7e5", "b1c3"])
+    handle(engine, "position startpos moves e2e4")
+    assert engine.gs is gs and gs.get_fen() == fen_after(["e2e4"])
+
+def test_position_from_another_start_is_set_up_again(engine):
+    fen = "r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1"
+    handle(engine, "position startpos moves e2e4")
+    gs = engine.gs
+    handle(engine, f"position fen {fen} moves e1g1")
+    assert engine.gs is not gs
+    assert engine.startFen == fen and engine.gs.get_fen() == fen_after(["e1g1"], fen)
+
+def test_bad_position_keeps_the_old_one(engine):
+    handle(engine, "position startpos moves e2e4")
+    handle(engine, "position fen 8/8/8/8/8/8/8/8 w - - 0 1") # No kings
+    handle(engine, "position startpos moves e2e4 e7e9")
+    assert engine.gs.get_fen() == fen_after(["e2e4"])
+    assert lines(engine)[0].startswith("info string Invalid FEN board")
+    assert lines(engine)[1] == "info string illegal move e7e9"
+
+def test_parse_go():
+    assert ChessUCI.parse_go("wtime 60000 btime 50000 winc 1000 binc 0 movestogo 40".split()) == \
+        {"wtime": 60000, "btime": 50000, "winc": 1000, "binc": 0, "movestogo": 40}
+    assert ChessUCI.parse_go(["infinite"]) == {"infinite": True}
+    assert ChessUCI.parse_go("depth 5 nodes 1000 ponder".split()) == {"depth": 5, "nodes": 1000}
+    assert ChessUCI.parse_go(["depth"]) == {} # No value
+    with pytest.raises(ValueError):
+        ChessUCI.parse_go("depth x".split())
+
+def test_time_limit(engine):
+    overhead = ChessUCI.MOVE_OVERHEAD
+    assert engine.time_limit({"movetime": 2000}) == pytest.approx(2 - overhead)
+    assert engine.time_limit({"depth": 5}) is None
+    assert engine.time_limit({"btime": 60000}) is None # White to move, only black's clock is given
+    limits = {"wtime": 60000, "btime": 6000, "winc": 2000}
+    assert engine.time_limit(limits) == pytest.approx(60 / ChessUCI.DEFAULT_MOVES_TO_GO + 1.5 - overhead)
+    assert engine.time_limit({"wtime": 60000, "movestogo": 10}) == pytest.approx(6 - overhead)
+    assert engine.time_limit({"wtime": 4000, "movestogo": 1}) == pytest.approx(2 - overhead) # At most half the clock
+    handle(engine, "position startpos moves e2e4")
+    assert engine.time_limit(limits) == pytest.approx(6 / ChessUCI.DEFAULT_MOVES_TO_GO - overhead)
+    assert engine.time_limit({"btime": 100}) == 0.01 # Never less than 10 ms
+
+def test_go_depth_sends_info_and_bestmove(engine):
+    handle(engine, "go depth 2")
+    engine.wait()
+    output = lines(engine)
+    assert [line.split()[2] for line in output if line.startswith("info depth")] == ["1", "2"]
+    assert output[-1].startswith("bestmove ")
+
+@pytest.mark.parametrize("command", ["position startpos moves e2e4", "go depth 1", "ucinewgame"])
+def test_command_after_go_infinite_stops_the_search(engine, command):
+    handle(engine, "go infinite")
+    time.sleep(0.1)
+    handle(engine, command)
+    assert any(line.startswith("bestmove") for line in lines(engine)) # The infinite search's
+    engine.wait()
+    assert sum(line.startswith("bestmove") for line in lines(engine)) == (2 if command.startswith("go") else 1)